@@ -1,16 +1,146 @@
 """
 AI Analysis Agent - Phân tích lỗi tự động với AI, tóm tắt và đề xuất fix
 """
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from collections import defaultdict
+import ast
+import json
+import logging
+import re
 from .base_agent import BaseAgent
+from llm import LLMProvider, LLMError
+from llm.prompt import compact_code, count_tokens, truncate_to_tokens
+from config import Config
+from utils.telemetry import telemetry
+from utils.error_classifier import ErrorClassifier
+from utils.error_clustering import ErrorClusterIndex
+from utils.failure_memory import FailureMemory
+from utils.single_flight import request_fingerprint
+from utils.generated_test_cache import (
+    GeneratedTestCache,
+    case_fingerprint,
+    generation_context_key,
+    split_test_code,
+    assemble_test_code
+)
+
+logger = logging.getLogger(__name__)
+
+# Instructions cố định (schema output) của từng loại task - nằm trong prompt prefix để provider cache được
+CODE_ANALYSIS_INSTRUCTIONS = """Hãy:
+1. Phân tích từng public method trong code
+2. Đề xuất test cases CỤ THỂ cho từng method: unit tests, integration tests, edge cases, negative tests
+3. Xác định potential bugs hoặc security issues
+4. Đề xuất improvements nếu có
+
+QUAN TRỌNG: Trả về kết quả dưới dạng JSON với format sau (KHÔNG có markdown, chỉ JSON thuần):
+{
+  "summary": {
+    "overview": "Mô tả tổng quan về code (2-3 câu)",
+    "risks": ["Risk 1", "Risk 2", ...]
+  },
+  "testCases": [
+    {
+      "id": 1,
+      "title": "Tên test case cụ thể (ví dụ: bookmarkRoom_WhenValidInput_ReturnsBookmarkResponse)",
+      "name": "Tên test case (cùng với title)",
+      "function": "Tên method cần test (ví dụ: bookmarkRoom)",
+      "type": "unit|integration|negative|edge",
+      "complexity": "S|M|L",
+      "description": "Mô tả test case",
+      "steps": ["Bước 1", "Bước 2", ...],
+      "expectedResult": "Kết quả mong đợi"
+    }
+  ]
+}
+
+Lưu ý QUAN TRỌNG: 
+- testCases PHẢI là array với ít nhất 3-5 test cases
+- Mỗi test case PHẢI có title và name là STRING, KHÔNG phải object
+- title/name phải mô tả cụ thể test case (ví dụ: "bookmarkRoom_WhenRoomNotFound_ThrowsException")
+- function phải là tên method thực tế trong code (ví dụ: "bookmarkRoom", "unbookmarkRoom")
+- Ưu tiên test cases cho tất cả public methods trong code
+- KHÔNG trả về error analysis format, chỉ trả về test cases format"""
+
+TEST_GENERATION_INSTRUCTIONS = """Yêu cầu:
+1. Generate test code hoàn chỉnh, có thể chạy được
+2. Sử dụng đúng framework và syntax cho language đã cho
+3. Implement đầy đủ các test cases đã liệt kê
+4. Bao gồm setup/teardown nếu cần
+5. Add assertions và error handling
+
+QUAN TRỌNG: Trả về JSON format:
+{
+  "framework": "<framework đã cho>",
+  "testCode": "// Full test code here\\n...",
+  "fileExtension": "<file extension đã cho>",
+  "dependencies": ["dependency1", "dependency2"],
+  "testCases": [
+    {
+      "id": 1,
+      "name": "test case name",
+      "code": "// specific test code snippet",
+      "status": "generated"
+    }
+  ]
+}"""
+
+ERROR_BATCH_INSTRUCTIONS = """Với MỖI lỗi test trong danh sách:
+1. Xác định nguyên nhân gốc rễ của lỗi (tóm tắt 1-2 câu)
+2. Đưa ra gợi ý fix cụ thể, có thể là nhiều bước
+3. Đánh giá severity (low/medium/high)
+4. Phân loại loại lỗi (assertion, timeout, network, authentication, etc.)
+
+QUAN TRỌNG: Trả về JSON array (KHÔNG có markdown), mỗi phần tử ứng với một lỗi, giữ đúng "id" đã cho:
+[
+  {
+    "id": "<id của lỗi>",
+    "name": "test case name",
+    "cause": "nguyên nhân ngắn gọn",
+    "suggestion": "hướng dẫn fix cụ thể",
+    "severity": "low|medium|high",
+    "category": "type of error"
+  }
+]
+- Phải có đúng một phần tử cho mỗi id, không bỏ sót lỗi nào"""
+
+SEVERITIES = ("low", "medium", "high")
 
 
 class AIAnalysisAgent(BaseAgent):
     """Agent chuyên phân tích lỗi với AI"""
     
-    def __init__(self, api_key: str = None):
-        super().__init__("AIAnalysis", api_key)
+    TASK_INSTRUCTIONS = {
+        "code_analysis": CODE_ANALYSIS_INSTRUCTIONS,
+        "test_generation": TEST_GENERATION_INSTRUCTIONS,
+        "error_batch_analysis": ERROR_BATCH_INSTRUCTIONS
+    }
+    
+    # Giới hạn độ dài error message / stack trace của mỗi lỗi trong batch prompt
+    BATCH_ERROR_TOKENS = 300
+    BATCH_STACK_TRACE_TOKENS = 400
+    
+    def __init__(self, api_key: str = None, provider: Optional[LLMProvider] = None):
+        super().__init__("AIAnalysis", api_key, provider)
+        # Phân loại local cho lỗi phổ biến - chỉ lỗi chưa chắc chắn mới gọi LLM
+        self.classifier = ErrorClassifier(
+            threshold=Config.ERROR_CLASSIFIER_THRESHOLD,
+            min_samples=Config.ERROR_CLASSIFIER_MIN_SAMPLES,
+            history_path=Config.ERROR_CLASSIFIER_HISTORY_PATH
+        ) if Config.ERROR_CLASSIFIER_ENABLED else None
+        # Analyses đã có của các failure trước đây (dùng lại hoặc làm few-shot example)
+        self.failure_memory = FailureMemory(
+            max_entries=Config.FAILURE_MEMORY_MAX_ENTRIES,
+            path=Config.FAILURE_MEMORY_PATH
+        ) if Config.FAILURE_MEMORY_ENABLED else None
+        # Clusters lỗi (MinHash/LSH) giữ giữa các test runs
+        self.error_clusters = ErrorClusterIndex(similarity_threshold=Config.ERROR_CLUSTER_THRESHOLD)
+        # Test code đã generate (content-addressed theo inputs) - execute lại không cần gọi LLM
+        self.test_artifacts = GeneratedTestCache(
+            max_entries=Config.TEST_ARTIFACT_CACHE_SIZE,
+            directory=Config.TEST_ARTIFACT_CACHE_DIR,
+            max_disk_entries=Config.TEST_ARTIFACT_CACHE_MAX_DISK_ENTRIES
+        ) if Config.TEST_ARTIFACT_CACHE_ENABLED else None
     
     def get_system_prompt(self) -> str:
         return """Bạn là AI Analysis Agent - chuyên gia phân tích code và test errors.
@@ -61,7 +191,8 @@ Khi phân tích errors, trả về:
         test_name: str,
         error_message: str,
         stack_trace: Optional[str] = None,
-        context: Optional[Dict[str, Any]] = None
+        context: Optional[Dict[str, Any]] = None,
+        use_local: bool = True
     ) -> Dict[str, Any]:
         """
         Phân tích một lỗi cụ thể
@@ -71,7 +202,19 @@ Khi phân tích errors, trả về:
             error_message: Error message
             stack_trace: Stack trace (optional)
             context: Context bổ sung (test code, environment, etc.)
+            use_local: Thử failure memory và error classifier local trước khi gọi LLM
         """
+        example = None
+        if use_local:
+            analysis, example = self._local_analysis(test_name, error_message, stack_trace)
+            if analysis is not None:
+                return analysis
+        
+        example_block = f"""
+Phân tích của một lỗi tương tự trước đây (chỉ tham khảo, kiểm tra lại với lỗi hiện tại):
+{json.dumps(example, ensure_ascii=False)}
+""" if example else ""
+        
         prompt = f"""Phân tích lỗi test sau và đưa ra phân tích chi tiết:
 
 Test Name: {test_name}
@@ -84,7 +227,7 @@ Stack Trace:
 
 Context:
 {context or "Không có"}
-
+{example_block}
 Hãy:
 1. Xác định nguyên nhân gốc rễ của lỗi
 2. Tóm tắt ngắn gọn (1-2 câu)
@@ -94,17 +237,20 @@ Hãy:
 
 Trả về JSON với format đã mô tả trong system prompt."""
         
-        response = self.call_llm(prompt)
+        try:
+            response = self.call_llm(prompt)
+        except LLMError as e:
+            logger.warning(f"LLM error analysis failed for {test_name}, dùng basic analysis: {e}")
+            return self._create_basic_analysis(test_name, error_message, stack_trace)
         
         # Parse JSON từ response
         try:
-            import json
-            import re
             json_match = re.search(r'\{.*\}', response, re.DOTALL)
             if json_match:
                 analysis = json.loads(json_match.group())
                 # Ensure required fields
                 analysis["name"] = analysis.get("name", test_name)
+                self._remember(error_message, stack_trace, analysis)
                 return analysis
             else:
                 # Fallback: create basic analysis
@@ -118,26 +264,217 @@ Trả về JSON với format đã mô tả trong system prompt."""
     ) -> List[Dict[str, Any]]:
         """
         Phân tích nhiều lỗi cùng lúc
+        
+        Với LLM_ERROR_BATCH_SIZE > 1, nhiều lỗi được gộp vào một prompt (xem analyze_errors_batched)
+        """
+        if Config.LLM_ERROR_BATCH_SIZE > 1 and len(failed_tests) > 1:
+            return self.analyze_errors_batched(failed_tests)
+        return [self._analyze_failed_test(test) for test in failed_tests]
+    
+    def analyze_errors_batched(
+        self,
+        failed_tests: List[Dict[str, Any]],
+        batch_size: Optional[int] = None,
+        token_budget: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
         """
-        analyses = []
+        Phân tích lỗi theo batch: mỗi LLM call chứa tối đa batch_size lỗi (trong token_budget)
+        và trả về JSON array keyed theo id. Lỗi thiếu/không hợp lệ trong response được
+        phân tích lại riêng lẻ. Lỗi mà error classifier phân loại chắc chắn không gửi LLM.
         
-        for test in failed_tests:
-            analysis = self.analyze_error(
-                test_name=test.get("name", ""),
-                error_message=test.get("error", ""),
-                stack_trace=test.get("stackTrace"),
-                context={"duration": test.get("duration"), "category": test.get("category")}
-            )
-            analyses.append(analysis)
+        Returns:
+            List analyses theo đúng thứ tự failed_tests
+        """
+        batch_size = batch_size or Config.LLM_ERROR_BATCH_SIZE
+        token_budget = token_budget or Config.LLM_ERROR_BATCH_TOKENS
+        
+        analyses: Dict[str, Dict[str, Any]] = {}
+        items = []
+        for i, test in enumerate(failed_tests):
+            item_id = str(i + 1)
+            # Batch prompt không kèm few-shot examples - chỉ dùng lại analysis đủ giống
+            local, _ = self._local_analysis(test.get("name", ""), test.get("error", ""), test.get("stackTrace"))
+            if local is not None:
+                analyses[item_id] = local
+            else:
+                items.append((item_id, test, self._format_failure(item_id, test)))
+        
+        retry = []
+        for batch in self._pack_batches(items, batch_size, token_budget):
+            if len(batch) == 1:
+                retry.extend(batch)
+                continue
+            try:
+                results = self._analyze_batch(batch)
+            except LLMError as e:
+                # Provider lỗi sau khi đã retry - không gọi lại từng lỗi, dùng basic analysis
+                logger.warning(f"LLM batch error analysis failed ({len(batch)} lỗi), dùng basic analysis: {e}")
+                for item_id, test, _ in batch:
+                    analyses[item_id] = self._create_basic_analysis(
+                        test.get("name", ""), test.get("error", ""), test.get("stackTrace")
+                    )
+                self._record_batch_items("fallback", len(batch))
+                continue
+            analyses.update(results)
+            retry.extend(item for item in batch if item[0] not in results)
+            self._record_batch_items("batched", len(results))
+        
+        if retry:
+            self._record_batch_items("individual", len(retry))
+        for item_id, test, _ in retry:
+            analyses[item_id] = self._analyze_failed_test(test, use_local=False)
+        
+        return [analyses[str(i + 1)] for i in range(len(failed_tests))]
+    
+    def _analyze_failed_test(self, test: Dict[str, Any], use_local: bool = True) -> Dict[str, Any]:
+        return self.analyze_error(
+            test_name=test.get("name", ""),
+            error_message=test.get("error", ""),
+            stack_trace=test.get("stackTrace"),
+            context={"duration": test.get("duration"), "category": test.get("category")},
+            use_local=use_local
+        )
+    
+    def _local_analysis(
+        self,
+        test_name: str,
+        error_message: Optional[str],
+        stack_trace: Optional[str]
+    ) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Phân tích không cần LLM: failure memory rồi error classifier
+        
+        Returns:
+            (analysis, example) - analysis nếu đủ chắc chắn, ngược lại example (analysis của lỗi
+            tương tự) để đưa vào prompt nếu có
+        """
+        example = None
+        if self.failure_memory is not None:
+            matches = self.failure_memory.search(error_message, stack_trace)
+            similarity, stored = matches[0] if matches else (0.0, None)
+            if similarity >= Config.FAILURE_MEMORY_REUSE_THRESHOLD:
+                self._record_memory("reuse")
+                return {"name": test_name, **stored, "source": "memory", "similarity": round(similarity, 4)}, None
+            if similarity >= Config.FAILURE_MEMORY_EXAMPLE_THRESHOLD:
+                example = stored
+            self._record_memory("example" if example else "miss")
+        
+        if self.classifier:
+            analysis = self.classifier.classify(test_name, error_message, stack_trace)
+            if analysis is not None:
+                return analysis, None
+        return None, example
+    
+    def _remember(self, error_message: Optional[str], stack_trace: Optional[str], analysis: Dict[str, Any]):
+        """Lưu analysis do LLM trả về để classifier/failure memory học"""
+        if self.classifier:
+            self.classifier.learn(error_message, stack_trace, analysis)
+        if self.failure_memory is not None:
+            self.failure_memory.add(error_message, stack_trace, analysis)
+    
+    def _record_memory(self, outcome: str):
+        telemetry.metrics.inc(
+            "testflow_failure_memory_total",
+            help_text="Kết quả tìm failure tương tự (reuse: dùng lại analysis, example: few-shot, miss)",
+            outcome=outcome
+        )
+    
+    def _format_failure(self, item_id: str, test: Dict[str, Any]) -> str:
+        error_message = truncate_to_tokens(str(test.get("error") or ""), self.BATCH_ERROR_TOKENS)
+        stack_trace = truncate_to_tokens(str(test.get("stackTrace") or ""), self.BATCH_STACK_TRACE_TOKENS)
+        return f"""### id: {item_id}
+Test Name: {test.get("name", "")}
+Error Message:
+{error_message or "Không có"}
+Stack Trace:
+{stack_trace or "Không có"}"""
+    
+    def _pack_batches(self, items: List[tuple], batch_size: int, token_budget: int) -> List[List[tuple]]:
+        """Gộp items liên tiếp thành batches, mỗi batch <= batch_size items và <= token_budget tokens"""
+        batches, current, current_tokens = [], [], 0
+        for item in items:
+            tokens = count_tokens(item[2])
+            if current and (len(current) >= batch_size or current_tokens + tokens > token_budget):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(item)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _analyze_batch(self, batch: List[tuple]) -> Dict[str, Dict[str, Any]]:
+        """Một LLM call cho cả batch; trả về analyses hợp lệ theo id"""
+        failures = "\n\n".join(text for _, _, text in batch)
+        prompt = f"""Phân tích các lỗi test sau ({len(batch)} lỗi) và đưa ra phân tích cho từng lỗi:
+
+{failures}"""
+        response = self.call_llm(prompt, task_kind="error_batch_analysis")
         
-        return analyses
+        tests_by_id = {item_id: test for item_id, test, _ in batch}
+        results: Dict[str, Dict[str, Any]] = {}
+        for entry in self._parse_json_array(response):
+            analysis = self._validate_batch_entry(entry, tests_by_id)
+            if analysis is not None:
+                results[str(entry["id"])] = analysis
+                test = tests_by_id[str(entry["id"])]
+                self._remember(test.get("error"), test.get("stackTrace"), analysis)
+        if len(results) < len(batch):
+            logger.warning(f"Batch error analysis: {len(batch) - len(results)}/{len(batch)} lỗi thiếu hoặc không hợp lệ, phân tích lại riêng")
+        return results
+    
+    def _parse_json_array(self, response: str) -> List[Any]:
+        json_match = re.search(r'\[.*\]', response or "", re.DOTALL)
+        if not json_match:
+            return []
+        try:
+            parsed = json.loads(json_match.group())
+        except ValueError:
+            return []
+        return parsed if isinstance(parsed, list) else []
+    
+    def _validate_batch_entry(
+        self,
+        entry: Any,
+        tests_by_id: Dict[str, Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        if not isinstance(entry, dict) or str(entry.get("id")) not in tests_by_id:
+            return None
+        cause, suggestion = entry.get("cause"), entry.get("suggestion")
+        severity = str(entry.get("severity", "")).lower()
+        if not (isinstance(cause, str) and cause.strip() and isinstance(suggestion, str) and suggestion.strip()):
+            return None
+        if severity not in SEVERITIES:
+            return None
+        test = tests_by_id[str(entry["id"])]
+        return {
+            "name": test.get("name") or entry.get("name", ""),
+            "cause": cause,
+            "suggestion": suggestion,
+            "severity": severity,
+            "category": entry.get("category") or "unknown"
+        }
+    
+    def _record_batch_items(self, mode: str, count: int):
+        if count:
+            telemetry.metrics.inc(
+                "testflow_error_analysis_items_total",
+                count,
+                help_text="Số lỗi được phân tích theo mode (batched|individual|fallback)",
+                mode=mode
+            )
     
     def group_similar_errors(
         self,
-        error_analyses: List[Dict[str, Any]]
+        error_analyses: List[Dict[str, Any]],
+        failed_tests: Optional[List[Dict[str, Any]]] = None
     ) -> Dict[str, List[Dict[str, Any]]]:
         """
         Gom nhóm các lỗi tương tự nhau (flaky tests, recurring errors)
+        
+        Args:
+            failed_tests: Failed tests tương ứng (cùng thứ tự) với error_analyses - error message và
+                stack trace của chúng được dùng để cluster; nếu không có thì cluster theo cause
         """
         # Group by category first
         by_category = defaultdict(list)
@@ -162,14 +499,43 @@ Trả về JSON với format đã mô tả trong system prompt."""
             if len(analyses) > 1
         }
         
+        # Near-duplicate errors (MinHash/LSH), gán vào clusters đã có từ các run trước
+        by_cluster = defaultdict(list)
+        new_clusters = set()
+        for i, analysis in enumerate(error_analyses):
+            if failed_tests and i < len(failed_tests):
+                error_message = failed_tests[i].get("error")
+                stack_trace = failed_tests[i].get("stackTrace")
+            else:
+                error_message, stack_trace = analysis.get("cause", ""), None
+            cluster_id, is_new = self.error_clusters.assign(error_message, stack_trace)
+            by_cluster[cluster_id].append(analysis)
+            if is_new:
+                new_clusters.add(cluster_id)
+        
+        clusters = []
+        for cluster_id, analyses in sorted(by_cluster.items(), key=lambda x: len(x[1]), reverse=True):
+            info = self.error_clusters.cluster(cluster_id) or {}
+            clusters.append({
+                "id": cluster_id,
+                "label": info.get("label", ""),
+                "size": len(analyses),
+                "total_count": info.get("count", len(analyses)),
+                "new": cluster_id in new_clusters
+            })
+        
         return {
             "by_category": dict(by_category),
             "by_error_pattern": dict(by_error_pattern),
+            "by_cluster": dict(by_cluster),
+            "clusters": clusters,
             "flaky_tests": flaky_tests,
             "summary": {
                 "total_errors": len(error_analyses),
                 "unique_categories": len(by_category),
                 "unique_patterns": len(by_error_pattern),
+                "unique_clusters": len(by_cluster),
+                "new_clusters": len(new_clusters),
                 "flaky_count": len(flaky_tests)
             }
         }
@@ -177,10 +543,16 @@ Trả về JSON với format đã mô tả trong system prompt."""
     def generate_error_summary(
         self,
         error_analyses: List[Dict[str, Any]],
-        test_run: Optional[Dict[str, Any]] = None
+        test_run: Optional[Dict[str, Any]] = None,
+        failed_tests: Optional[List[Dict[str, Any]]] = None,
+        groups: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
         Tạo tổng hợp về các lỗi
+        
+        Args:
+            failed_tests: Failed tests tương ứng với error_analyses (để cluster theo error text)
+            groups: Kết quả group_similar_errors đã có (tránh gán clusters hai lần)
         """
         if not error_analyses:
             return {
@@ -201,7 +573,8 @@ Trả về JSON với format đã mô tả trong system prompt."""
             by_category[category] += 1
         
         # Group errors
-        groups = self.group_similar_errors(error_analyses)
+        if groups is None:
+            groups = self.group_similar_errors(error_analyses, failed_tests)
         
         # Generate summary text with LLM
         summary_text = self._generate_summary_text(error_analyses, groups)
@@ -302,7 +675,11 @@ Tóm tắt cần:
 - Đề cập đến flaky tests nếu có
 - Gợi ý action items cần ưu tiên"""
         
-        return self.call_llm(prompt)
+        try:
+            return self.call_llm(prompt)
+        except LLMError as e:
+            logger.warning(f"LLM summary failed, dùng summary thống kê: {e}")
+            return summary_data.strip()
     
     def _generate_recommendations(
         self,
@@ -326,9 +703,15 @@ Tóm tắt cần:
                 f"Ưu tiên fix {high_severity} high severity error(s)"
             )
         
-        # Check for common patterns
+        # Check for common patterns (ưu tiên clusters near-duplicate)
+        top_cluster = (groups.get("clusters") or [None])[0]
         by_pattern = groups.get("by_error_pattern", {})
-        if by_pattern:
+        if top_cluster:
+            if top_cluster["size"] > 1:
+                recommendations.append(
+                    f"Nhận diện nhóm lỗi '{top_cluster['label']}' xuất hiện {top_cluster['size']} lần - cần review systematic issue"
+                )
+        elif by_pattern:
             top_pattern = max(by_pattern.items(), key=lambda x: len(x[1]))
             if len(top_pattern[1]) > 1:
                 recommendations.append(
@@ -368,50 +751,38 @@ Ví dụ cho Java Spring service method:
 - Test edge case: "bookmarkRoom_WhenAlreadyBookmarked_ThrowsAppException"
 """
         
+        # Compact code (bỏ comments/dòng trống) để tiết kiệm tokens; context cùng code sẽ không bị gửi lại
+        if Config.LLM_COMPACT_CODE:
+            code = compact_code(code, self._context_language(context) if context else language)
+        
         prompt = f"""Phân tích đoạn code sau và đề xuất test cases:
 
 Language: {language}
 {lang_instructions}
 
 Code:
-{code[:10000]}  # Limit để tránh token limit
-
-Hãy:
-1. Phân tích từng public method trong code
-2. Đề xuất test cases CỤ THỂ cho từng method: unit tests, integration tests, edge cases, negative tests
-3. Xác định potential bugs hoặc security issues
-4. Đề xuất improvements nếu có
-
-QUAN TRỌNG: Trả về kết quả dưới dạng JSON với format sau (KHÔNG có markdown, chỉ JSON thuần):
-{{
-  "summary": {{
-    "overview": "Mô tả tổng quan về code (2-3 câu)",
-    "risks": ["Risk 1", "Risk 2", ...]
-  }},
-  "testCases": [
-    {{
-      "id": 1,
-      "title": "Tên test case cụ thể (ví dụ: bookmarkRoom_WhenValidInput_ReturnsBookmarkResponse)",
-      "name": "Tên test case (cùng với title)",
-      "function": "Tên method cần test (ví dụ: bookmarkRoom)",
-      "type": "unit|integration|negative|edge",
-      "complexity": "S|M|L",
-      "description": "Mô tả test case",
-      "steps": ["Bước 1", "Bước 2", ...],
-      "expectedResult": "Kết quả mong đợi"
-    }}
-  ]
-}}
-
-Lưu ý QUAN TRỌNG: 
-- testCases PHẢI là array với ít nhất 3-5 test cases
-- Mỗi test case PHẢI có title và name là STRING, KHÔNG phải object
-- title/name phải mô tả cụ thể test case (ví dụ: "bookmarkRoom_WhenRoomNotFound_ThrowsException")
-- function phải là tên method thực tế trong code (ví dụ: "bookmarkRoom", "unbookmarkRoom")
-- Ưu tiên test cases cho tất cả public methods trong code
-- KHÔNG trả về error analysis format, chỉ trả về test cases format"""
+{code[:10000]}"""
         
-        response = self.call_llm(prompt, context)
+        # Coverage của lần chạy tests trước: ưu tiên test cases cho phần code chưa được chạy tới
+        uncovered = (context or {}).get("uncovered_functions") or []
+        if uncovered:
+            context = {k: v for k, v in context.items() if k != "uncovered_functions"}
+            lines = [
+                f"- {f['name']} (coverage {f.get('coverage', 0):.0%}, dòng chưa chạy: {', '.join(str(n) for n in f.get('missing_lines', [])[:10])})"
+                for f in uncovered[:20]
+            ]
+            prompt += (
+                "\n\nCác functions chưa được generated tests hiện tại cover hết "
+                "- ưu tiên đề xuất test cases cho chúng:\n" + "\n".join(lines)
+            )
+        
+        try:
+            response = self.call_llm(prompt, context, task_kind="code_analysis")
+        except LLMError as e:
+            return {
+                "success": False,
+                "error": f"LLM call failed: {str(e)}"
+            }
         
         # Parse JSON từ response
         try:
@@ -504,7 +875,7 @@ Lưu ý QUAN TRỌNG:
         
         elif action == "group_errors":
             error_analyses = task.get("error_analyses", [])
-            groups = self.group_similar_errors(error_analyses)
+            groups = self.group_similar_errors(error_analyses, task.get("failed_tests"))
             return {
                 "success": True,
                 "groups": groups
@@ -513,7 +884,9 @@ Lưu ý QUAN TRỌNG:
         elif action == "generate_summary":
             error_analyses = task.get("error_analyses", [])
             test_run = task.get("test_run")
-            summary = self.generate_error_summary(error_analyses, test_run)
+            summary = self.generate_error_summary(
+                error_analyses, test_run, task.get("failed_tests"), task.get("groups")
+            )
             return {
                 "success": True,
                 "summary": summary
@@ -533,7 +906,7 @@ Lưu ý QUAN TRỌNG:
             if code and len(code) > 50:  # Phải có code thực sự (ít nhất 50 ký tự)
                 language = task.get("language", "unknown")
                 context = task.get("context")
-                print(f"[DEBUG ai_analysis_agent] Default action: analyzing code, language={language}, code_length={len(code)}")
+                logger.debug(f"Default action: analyzing code, language={language}, code_length={len(code)}")
                 return self.analyze_code(code, language, context)
             
             # Nếu không có code, trả về error thay vì error analysis
@@ -547,16 +920,22 @@ Lưu ý QUAN TRỌNG:
         test_cases: List[Dict[str, Any]],
         original_code: str = "",
         language: str = "unknown",
-        framework: Optional[str] = None
+        framework: Optional[str] = None,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
         Generate actual test code từ test cases
         
+        Test code đã generate được cache theo hash của inputs: cùng original_code/test cases/language/
+        framework thì dùng lại ngay (cache "hit"); nếu chỉ một số test cases thay đổi thì chỉ generate lại
+        các test cases đó rồi ghép với snippets đã cache ("partial").
+        
         Args:
             test_cases: List các test cases đã được đề xuất
             original_code: Code gốc cần test (optional)
             language: Programming language
             framework: Test framework (Jest, JUnit, pytest, etc.)
+            use_cache: False để luôn generate lại
         """
         if not test_cases:
             return {
@@ -576,6 +955,138 @@ Lưu ý QUAN TRỌNG:
             }
             framework = framework_map.get(language.lower(), "custom")
         
+        cache = self.test_artifacts if use_cache else None
+        if cache is None:
+            return self._generate_test_code_llm(test_cases, original_code, language, framework)
+        
+        context_key = generation_context_key(
+            original_code, language, framework, Config.CEREBRAS_MODEL, self.prompt_prefix("test_generation")[1]
+        )
+        case_keys = [request_fingerprint(context=context_key, case=case_fingerprint(tc)) for tc in test_cases]
+        artifact_key = request_fingerprint(context=context_key, cases=case_keys)
+        
+        artifact = cache.get(artifact_key)
+        if artifact is not None:
+            self._record_artifact_cache("hit")
+            return {**artifact, "cache": "hit", "regenerated": 0}
+        
+        cached_pieces = {i: piece for i, piece in enumerate(cache.get(key) for key in case_keys) if piece}
+        missing = [i for i in range(len(test_cases)) if i not in cached_pieces]
+        result = None
+        new_pieces: Dict[int, Dict[str, Any]] = {}
+        
+        if cached_pieces:
+            # Chỉ generate các test cases chưa có snippet trong cache
+            generated = {}
+            if missing:
+                partial = self._generate_test_code_llm([test_cases[i] for i in missing], original_code, language, framework)
+                pieces = self._split_generated(partial) if partial.get("success") else None
+                if pieces is not None and len(pieces) == len(missing):
+                    generated = dict(zip(missing, pieces))
+            if len(generated) == len(missing):
+                assembled = self._assemble_generated(test_cases, {**cached_pieces, **generated}, set(generated), framework, language)
+                # File ghép không hợp lệ thì generate lại cả file thay vì cache artifact hỏng
+                if self._assembled_code_valid(assembled["generated_code"]["testCode"], language):
+                    new_pieces = generated
+                    result = assembled
+                    outcome = "partial" if missing else "assembled"
+        
+        if result is None:
+            result = self._generate_test_code_llm(test_cases, original_code, language, framework)
+            if not result.get("success"):
+                return result
+            pieces = self._split_generated(result)
+            if pieces is not None and len(pieces) == len(test_cases):
+                new_pieces = dict(enumerate(pieces))
+            outcome = "miss"
+        
+        cache.put(artifact_key, result)
+        for i, piece in new_pieces.items():
+            cache.put(case_keys[i], piece)
+        self._record_artifact_cache(outcome)
+        regenerated = len(test_cases) if outcome == "miss" else len(missing)
+        return {**result, "cache": outcome, "regenerated": regenerated}
+    
+    def _split_generated(self, result: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Snippet + header của từng test case trong response; None nếu không tách được"""
+        generated = result.get("generated_code") or {}
+        snippets = [tc.get("code", "") for tc in generated.get("testCases") or [] if isinstance(tc, dict)]
+        if not snippets:
+            return None
+        header = split_test_code(generated.get("testCode", ""), snippets)
+        if header is None:
+            return None
+        return [
+            {
+                "code": snippet.strip(),
+                "header": header,
+                "fileExtension": generated.get("fileExtension", ""),
+                "dependencies": generated.get("dependencies", [])
+            }
+            for snippet in snippets
+        ]
+    
+    def _assemble_generated(
+        self,
+        test_cases: List[Dict[str, Any]],
+        pieces: Dict[int, Dict[str, Any]],
+        regenerated: set,
+        framework: str,
+        language: str
+    ) -> Dict[str, Any]:
+        """Ghép snippets (cached + mới generate) thành một test file theo thứ tự test cases"""
+        ordered = [pieces[i] for i in range(len(test_cases))]
+        dependencies = list(dict.fromkeys(dep for piece in ordered for dep in piece.get("dependencies") or []))
+        return {
+            "success": True,
+            "generated_code": {
+                "framework": framework,
+                "testCode": assemble_test_code(
+                    list(dict.fromkeys(piece["header"] for piece in ordered)),
+                    [piece["code"] for piece in ordered]
+                ),
+                "fileExtension": ordered[0].get("fileExtension", ""),
+                "dependencies": dependencies,
+                "testCases": [
+                    {
+                        "id": i + 1,
+                        "name": tc.get("name", tc.get("title", f"Test {i+1}")),
+                        "code": ordered[i]["code"],
+                        "status": "generated" if i in regenerated else "cached"
+                    }
+                    for i, tc in enumerate(test_cases)
+                ]
+            },
+            "framework": framework,
+            "language": language
+        }
+    
+    @staticmethod
+    def _assembled_code_valid(test_code: str, language: str) -> bool:
+        """Kiểm tra syntax của test file đã ghép (hiện chỉ với Python)"""
+        if (language or "").lower() != "python":
+            return True
+        try:
+            ast.parse(test_code)
+        except (SyntaxError, ValueError):
+            return False
+        return True
+    
+    def _record_artifact_cache(self, outcome: str):
+        telemetry.metrics.inc(
+            "testflow_test_artifact_cache_total",
+            help_text="Lấy generated test code: hit (cache), assembled/partial (ghép snippets), miss (generate lại)",
+            outcome=outcome
+        )
+    
+    def _generate_test_code_llm(
+        self,
+        test_cases: List[Dict[str, Any]],
+        original_code: str,
+        language: str,
+        framework: str
+    ) -> Dict[str, Any]:
+        """Generate test code cho test_cases bằng một LLM call"""
         # Tạo prompt để generate test code
         test_details = "\n".join([
             f"""
@@ -594,37 +1105,15 @@ Test Case {i+1}:
 
 Language: {language}
 Framework: {framework}
+File extension: .{self._get_file_extension(language)}
 Original Code (for reference):
 {original_code[:2000] if original_code else "N/A"}
 
 Test Cases to implement:
-{test_details}
-
-Yêu cầu:
-1. Generate test code hoàn chỉnh, có thể chạy được
-2. Sử dụng đúng framework và syntax cho {language}
-3. Implement đầy đủ các test cases đã liệt kê
-4. Bao gồm setup/teardown nếu cần
-5. Add assertions và error handling
-
-QUAN TRỌNG: Trả về JSON format:
-{{
-  "framework": "{framework}",
-  "testCode": "// Full test code here\\n...",
-  "fileExtension": ".{self._get_file_extension(language)}",
-  "dependencies": ["dependency1", "dependency2"],
-  "testCases": [
-    {{
-      "id": 1,
-      "name": "test case name",
-      "code": "// specific test code snippet",
-      "status": "generated"
-    }}
-  ]
-}}"""
+{test_details}"""
         
         try:
-            response = self.call_llm(prompt)
+            response = self.call_llm(prompt, task_kind="test_generation")
             
             # Parse response
             import json
@@ -2,60 +2,222 @@
 Base Agent Class - Base class cho tất cả các agents
 """
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
+import functools
+import hashlib
+import logging
 import os
-from cerebras.cloud.sdk import Cerebras
+import threading
+from config import Config
+from llm import LLMProvider, LLMError, create_provider
+from llm.prompt import count_tokens, compact_code, collapse_whitespace, truncate_to_tokens
+from utils.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
 
 
 class BaseAgent(ABC):
     """Base class cho tất cả các specialist agents"""
     
-    def __init__(self, name: str, api_key: Optional[str] = None):
+    # Context value dài hơn ngưỡng này mà đã có trong user message sẽ không gửi lại
+    DUPLICATE_MIN_CHARS = 200
+    # Các context key chứa source code (được compact trước khi gửi)
+    CODE_CONTEXT_KEYS = ("code",)
+    
+    # Version của prompt prefix - tăng khi sửa system prompt/instructions
+    PROMPT_VERSION = "1"
+    # task_kind -> instructions cố định (schema output) nối sau system prompt
+    TASK_INSTRUCTIONS: Dict[str, str] = {}
+    
+    # (agent class, task_kind) -> (prefix, prefix_id), dùng chung cho mọi instance
+    _prefix_cache: Dict[Tuple[type, Optional[str]], Tuple[str, str]] = {}
+    _prefix_cache_lock = threading.Lock()
+    _prefix_token_counts: Dict[str, int] = {}
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Tự động bọc process() của mỗi agent trong một span
+        process = cls.__dict__.get("process")
+        if process and not getattr(process, "__isabstractmethod__", False):
+            @functools.wraps(process)
+            def traced_process(self, task: Dict[str, Any]) -> Dict[str, Any]:
+                action = task.get("action") or task.get("report_type") or "default"
+                with telemetry.span("agent.process", agent=self.name, action=action) as span:
+                    result = process(self, task)
+                    if isinstance(result, dict):
+                        span.set_attribute("success", bool(result.get("success")))
+                    return result
+            cls.process = traced_process
+    
+    def __init__(self, name: str, api_key: Optional[str] = None, provider: Optional[LLMProvider] = None):
         self.name = name
         self.api_key = api_key or os.environ.get("CEREBRAS_API_KEY", "")
-        self.client = None
-        
-        if self.api_key:
-            self.client = Cerebras(api_key=self.api_key)
+        # LLM backend (Cerebras hoặc fake provider, chọn qua LLM_PROVIDER)
+        self.provider = provider or create_provider(self.api_key)
+        # Build sẵn các prompt prefix một lần lúc khởi tạo
+        for task_kind in (None, *self.TASK_INSTRUCTIONS):
+            self.prompt_prefix(task_kind)
     
     @abstractmethod
     def get_system_prompt(self) -> str:
         """Trả về system prompt đặc thù cho agent này"""
         pass
     
-    def call_llm(self, user_message: str, context: Optional[Dict[str, Any]] = None) -> str:
+    def prompt_prefix(self, task_kind: Optional[str] = None) -> Tuple[str, str]:
         """
-        Gọi Cerebras LLM với user message và context
+        Prompt prefix bất biến (system prompt + instructions của task_kind) và ID có version
+        
+        Prefix giống hệt nhau giữa các call nên provider/proxy có KV prefix caching dùng lại được;
+        phần thay đổi (code, test cases, context) luôn nằm sau prefix.
+        """
+        key = (type(self), task_kind)
+        cached = self._prefix_cache.get(key)
+        if cached is None:
+            with self._prefix_cache_lock:
+                cached = self._prefix_cache.get(key)
+                if cached is None:
+                    prefix = self.get_system_prompt()
+                    if task_kind:
+                        prefix = f"{prefix}\n\n{self.TASK_INSTRUCTIONS[task_kind]}"
+                    digest = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:12]
+                    prefix_id = f"{self.name}.{task_kind or 'default'}.v{self.PROMPT_VERSION}.{digest}"
+                    cached = self._prefix_cache[key] = (prefix, prefix_id)
+        return cached
+    
+    def call_llm(
+        self,
+        user_message: str,
+        context: Optional[Dict[str, Any]] = None,
+        task_kind: Optional[str] = None
+    ) -> str:
+        """
+        Gọi LLM (qua provider đã cấu hình) với user message và context
+        
+        Args:
+            task_kind: Loại task trong TASK_INSTRUCTIONS - instructions được đưa vào prompt prefix
+        
+        Raises:
+            LLMError: khi provider lỗi (đã hết retry) - caller tự quyết định fallback
         """
-        if not self.client:
+        if not self.provider:
             raise ValueError(f"Agent {self.name}: Cerebras client chưa được khởi tạo. Vui lòng cung cấp API key.")
         
+        messages, stats = self.build_messages(user_message, context, task_kind)
+        prefix_id = stats.pop("prefix_id")
+        
+        model = Config.CEREBRAS_MODEL
+        with telemetry.span("llm.call", agent=self.name, model=model, provider=self.provider.name,
+                            prefix_id=prefix_id, **stats) as span:
+            try:
+                response = self.provider.complete(messages, model, prompt_cache_key=prefix_id)
+            except LLMError as e:
+                span.status = "error"
+                span.set_attribute("error", str(e))
+                telemetry.record_llm_usage(self.name, model, 0, 0, status="error")
+                logger.error(f"Agent {self.name}: LLM call failed: {e}")
+                raise
+            
+            span.set_attribute("prompt_tokens", response.prompt_tokens)
+            span.set_attribute("completion_tokens", response.completion_tokens)
+            span.set_attribute("cached_tokens", response.cached_tokens)
+            telemetry.record_llm_usage(self.name, model, response.prompt_tokens, response.completion_tokens,
+                                       cached_tokens=response.cached_tokens)
+            return response.content
+    
+    def token_budget(self) -> int:
+        """Token budget cho input (system + messages) của một LLM call"""
+        return Config.LLM_AGENT_TOKEN_BUDGETS.get(self.name, Config.LLM_PROMPT_TOKEN_BUDGET)
+    
+    def build_messages(
+        self,
+        user_message: str,
+        context: Optional[Dict[str, Any]] = None,
+        task_kind: Optional[str] = None
+    ) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        Ghép messages cho LLM call:
+        - Bỏ context value đã có trong user message (ví dụ code được gửi hai lần)
+        - Compact code trong context
+        - Cắt context rồi tới user message cho vừa token budget
+        
+        Returns:
+            (messages, stats) - stats là token counts của call (ước lượng) và prefix_id
+        """
+        system_prompt, prefix_id = self.prompt_prefix(task_kind)
+        system_tokens = self._prefix_tokens(prefix_id, system_prompt)
+        budget = self.token_budget()
+        
+        context_str = self._format_context(context, user_message) if context else ""
+        user_tokens = count_tokens(user_message)
+        context_tokens = count_tokens(context_str)
+        
+        # Ưu tiên giữ user message (chứa yêu cầu và format output), cắt context trước
+        available = budget - system_tokens
+        if context_tokens and user_tokens + context_tokens > available:
+            context_str = truncate_to_tokens(context_str, max(0, available - user_tokens), tail_ratio=0)
+            context_tokens = count_tokens(context_str)
+        if user_tokens + context_tokens > available:
+            logger.warning(f"Agent {self.name}: prompt vượt token budget ({user_tokens} > {available}), cắt bớt")
+            user_message = truncate_to_tokens(user_message, max(0, available - context_tokens))
+            user_tokens = count_tokens(user_message)
+        
         messages = [
-            {"role": "system", "content": self.get_system_prompt()},
+            {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_message}
         ]
-        
-        # Thêm context nếu có
-        if context:
-            context_str = self._format_context(context)
+        if context_str:
             messages.append({"role": "user", "content": f"Context:\n{context_str}"})
         
-        try:
-            response = self.client.chat.completions.create(
-                messages=messages,
-                model="qwen-3-coder-480b",
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            return f"Error calling LLM: {str(e)}"
+        stats = {
+            "system_tokens": system_tokens,
+            "user_tokens": user_tokens,
+            "context_tokens": context_tokens,
+            "prompt_tokens_estimated": system_tokens + user_tokens + context_tokens,
+            "token_budget": budget,
+            "prefix_id": prefix_id
+        }
+        telemetry.metrics.observe(
+            "testflow_llm_prompt_tokens_estimated",
+            stats["prompt_tokens_estimated"],
+            help_text="Số prompt tokens (ước lượng) của mỗi LLM call sau khi compact",
+            buckets=(250, 500, 1000, 2000, 4000, 8000, 12000, 16000, 32000, 64000),
+            agent=self.name
+        )
+        return messages, stats
+    
+    def _prefix_tokens(self, prefix_id: str, prefix: str) -> int:
+        count = self._prefix_token_counts.get(prefix_id)
+        if count is None:
+            count = self._prefix_token_counts[prefix_id] = count_tokens(prefix)
+        return count
     
-    def _format_context(self, context: Dict[str, Any]) -> str:
-        """Format context dict thành string"""
+    def _format_context(self, context: Dict[str, Any], user_message: str = "") -> str:
+        """Format context dict thành string (bỏ payload trùng với user message, compact code)"""
+        collapsed_message = collapse_whitespace(user_message) if user_message else ""
+        language = self._context_language(context)
         formatted = []
         for key, value in context.items():
+            if isinstance(value, str) and len(value) >= self.DUPLICATE_MIN_CHARS:
+                is_code = key in self.CODE_CONTEXT_KEYS
+                if is_code and Config.LLM_COMPACT_CODE:
+                    value = compact_code(value, language)
+                # Payload đã được gửi nguyên vẹn trong user message thì chỉ giữ tham chiếu. Probe ngắn
+                # chỉ để lọc nhanh: message có thể chỉ chứa phần đầu (vd. code[:10000]), khi đó vẫn gửi đủ
+                probe = collapse_whitespace(value[:self.DUPLICATE_MIN_CHARS * 2])[:self.DUPLICATE_MIN_CHARS]
+                if collapsed_message and probe in collapsed_message and collapse_whitespace(value) in collapsed_message:
+                    formatted.append(f"{key}: (xem nội dung ở message phía trên)")
+                    continue
             formatted.append(f"{key}: {value}")
         return "\n".join(formatted)
     
+    def _context_language(self, context: Dict[str, Any]) -> Optional[str]:
+        """Ngôn ngữ của code trong context - None nếu không rõ hoặc trộn nhiều ngôn ngữ"""
+        languages = context.get("detected_languages")
+        if isinstance(languages, list):
+            return languages[0] if len(set(languages)) == 1 else None
+        language = context.get("language")
+        return language if isinstance(language, str) and language != "unknown" else None
+    
     @abstractmethod
     def process(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """
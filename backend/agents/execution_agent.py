@@ -8,14 +8,44 @@ import tempfile
 import os
 import json
 import re
+import time
+import logging
 from .base_agent import BaseAgent
+from .testing_agent import TestingAgent
+from llm import LLMProvider
+from utils.telemetry import telemetry
+from utils.jest_toolchain import get_jest_toolchain
+from utils.pytest_pool import get_pytest_pool
+from utils.execution_history import ExecutionHistory
+from utils.source_diff import changed_symbols, symbol_names, python_test_references
+from utils.risk_index import RiskIndex
+from utils.run_comparison import RunComparator
+from utils.coverage_data import (
+    CoverageBudget,
+    coverage_available,
+    install_coverage_plugin,
+    load_coverage_report,
+    merge_coverage
+)
+from config import Config
+
+logger = logging.getLogger(__name__)
 
 
 class ExecutionAgent(BaseAgent):
     """Agent chuyên quản lý test execution và runs"""
     
-    def __init__(self, api_key: str = None):
-        super().__init__("Execution", api_key)
+    def __init__(self, api_key: str = None, provider: Optional[LLMProvider] = None):
+        super().__init__("Execution", api_key, provider)
+        # Inputs + kết quả của các lần execute (theo run_id) để re-run một phần tests
+        self.executions = ExecutionHistory(
+            max_runs=Config.EXECUTION_HISTORY_SIZE,
+            directory=Config.EXECUTION_HISTORY_DIR
+        )
+        # Coverage khi chạy pytest thật - tần suất thu thập giữ overhead trong budget
+        self.coverage_budget = CoverageBudget(budget=Config.COVERAGE_OVERHEAD_BUDGET)
+        # Columns của runs + baselines đã gộp (so sánh runs / baseline nhiều runs)
+        self.comparator = RunComparator()
     
     def get_system_prompt(self) -> str:
         return """Bạn là Execution Agent - chuyên gia quản lý test execution và tracking test runs.
@@ -108,11 +138,13 @@ Bạn cần đảm bảo:
     def compare_runs(
         self,
         run1: Dict[str, Any],
-        run2: Dict[str, Any]
+        run2: Dict[str, Any],
+        thresholds: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """
-        So sánh 2 test runs để phát hiện regressions
+        So sánh 2 test runs để phát hiện regressions (run1 là baseline)
         """
+        diff = self.comparator.compare(run2, [run1], thresholds)
         comparison = {
             "run1_id": run1.get("run_id"),
             "run2_id": run2.get("run_id"),
@@ -123,37 +155,45 @@ Bạn cần đảm bảo:
                 run2.get("summary", {}).get("pass_rate", 0) - 
                 run1.get("summary", {}).get("pass_rate", 0)
             ),
-            "new_failures": [],
-            "fixed_tests": [],
+            "new_failures": diff["new_failures"],
+            "fixed_tests": diff["fixed_tests"],
+            "added_tests": diff["added_tests"],
+            "removed_tests": diff["removed_tests"],
+            "duration_regressions": diff["duration_regressions"],
+            "totals": diff["totals"],
             "regression": False
         }
         
-        # Tìm new failures (fail trong run2 nhưng pass trong run1)
-        run1_tests = {t.get("name"): t for t in run1.get("test_results", [])}
-        run2_tests = {t.get("name"): t for t in run2.get("test_results", [])}
-        
-        for test_name, test2 in run2_tests.items():
-            test1 = run1_tests.get(test_name)
-            if test2.get("status") == "fail":
-                if not test1 or test1.get("status") == "pass":
-                    comparison["new_failures"].append(test_name)
-        
-        # Tìm fixed tests (pass trong run2 nhưng fail trong run1)
-        for test_name, test1 in run1_tests.items():
-            test2 = run2_tests.get(test_name)
-            if test1.get("status") == "fail":
-                if test2 and test2.get("status") == "pass":
-                    comparison["fixed_tests"].append(test_name)
-        
         # Xác định regression
         comparison["regression"] = (
             comparison["fail_diff"] > 0 or 
             comparison["pass_rate_change"] < 0 or
-            len(comparison["new_failures"]) > 0
+            diff["totals"]["new_failures"] > 0
         )
         
         return comparison
     
+    def compare_to_baseline(
+        self,
+        run: Dict[str, Any],
+        baseline_runs: List[Dict[str, Any]],
+        thresholds: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        So sánh run với baseline gộp từ nhiều runs: new/known failures, fixed tests, tests thêm/bớt và
+        duration regressions theo z-score (mean/std duration của từng test trong baseline)
+        """
+        with telemetry.span("execution.compare", baseline_runs=len(baseline_runs)) as span:
+            start = time.perf_counter()
+            comparison = self.comparator.compare(run, baseline_runs, thresholds)
+            elapsed = time.perf_counter() - start
+            span.set_attribute("tests", comparison["totals"]["total"])
+        telemetry.metrics.observe(
+            "testflow_run_comparison_seconds", elapsed,
+            help_text="Thời gian so sánh một run với baseline"
+        )
+        return comparison
+    
     def _calculate_pass_rate(self, test_results: Dict[str, Any]) -> float:
         """Tính tỷ lệ pass"""
         total = test_results.get("total", 0)
@@ -182,7 +222,12 @@ Bạn cần đảm bảo:
     def _generate_run_id(self) -> int:
         """Generate unique run ID (trong production sẽ dùng database sequence)"""
         import random
-        return random.randint(1000, 9999)
+        # Không trùng run_id của execution còn trong history (re-run tham chiếu theo run_id)
+        for _ in range(10):
+            run_id = random.randint(1000, 9999)
+            if f"#{run_id}" not in self.executions:
+                break
+        return run_id
     
     def process(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -212,12 +257,22 @@ Bạn cần đảm bảo:
         elif action == "compare_runs":
             run1 = task.get("run1", {})
             run2 = task.get("run2", {})
-            comparison = self.compare_runs(run1, run2)
+            comparison = self.compare_runs(run1, run2, task.get("thresholds"))
             return {
                 "success": True,
                 "comparison": comparison
             }
         
+        elif action == "compare_baseline":
+            return {
+                "success": True,
+                "comparison": self.compare_to_baseline(
+                    task.get("run", {}),
+                    task.get("baseline_runs", []),
+                    task.get("thresholds")
+                )
+            }
+        
         elif action == "execute_test_code":
             return self.execute_test_code(
                 task.get("test_code", ""),
@@ -228,6 +283,14 @@ Bạn cần đảm bảo:
                 task.get("original_code", "")  # Truyền original_code vào
             )
         
+        elif action == "rerun_tests":
+            return self.rerun_tests(
+                task.get("parent_run_id", ""),
+                original_code=task.get("original_code"),
+                select=task.get("select", "failed_or_changed"),
+                tests=task.get("tests")
+            )
+        
         else:
             return {
                 "success": False,
@@ -242,6 +305,254 @@ Bạn cần đảm bảo:
         test_cases: List[Dict[str, Any]] = None,
         risks: List[str] = None,
         original_code: str = ""
+    ) -> Dict[str, Any]:
+        """
+        Execute test code (simulate hoặc thực sự run); inputs và kết quả được lưu theo run_id
+        để có thể re-run một phần tests (rerun_tests)
+        """
+        result = self._run_test_code(test_code, framework, language, test_cases, risks, original_code)
+        if result.get("success"):
+            self._remember_execution(result, test_code, framework, language, test_cases, risks, original_code)
+        return result
+    
+    def _remember_execution(
+        self,
+        result: Dict[str, Any],
+        test_code: str,
+        framework: str,
+        language: str,
+        test_cases: Optional[List[Dict[str, Any]]],
+        risks: Optional[List[str]],
+        original_code: str
+    ):
+        self.executions.put(result["run_id"], {
+            "run_id": result["run_id"],
+            "parent_run_id": result.get("parent_run_id"),
+            "test_code": test_code,
+            "framework": framework,
+            "language": language,
+            "test_cases": test_cases or [],
+            "risks": risks or [],
+            "original_code": original_code or "",
+            "execution_mode": result.get("execution_mode", "simulated"),
+            "results": result.get("results", []),
+            "coverage": result.get("coverage")
+        })
+    
+    def rerun_tests(
+        self,
+        parent_run_id: str,
+        original_code: Optional[str] = None,
+        select: str = "failed_or_changed",
+        tests: Optional[List[Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Chạy lại một phần tests của một execution trước (không generate lại test code) và merge với
+        kết quả của run cha thành run mới (parent_run_id trỏ về run cha)
+        
+        Args:
+            parent_run_id: run_id của execution trước
+            original_code: Source code mới (đã sửa); None = giữ source của run cha
+            select: "failed", "changed" (tests dùng functions bị sửa) hoặc "failed_or_changed"
+            tests: Danh sách tests cụ thể (id, name, nodeId hoặc testCaseId) - bỏ qua select
+        """
+        parent = self.executions.get(parent_run_id)
+        if parent is None:
+            return {
+                "success": False,
+                "error": f"Unknown run_id: {parent_run_id} (chỉ re-run được execution còn trong history)"
+            }
+        if select not in ("failed", "changed", "failed_or_changed"):
+            return {"success": False, "error": f"Unknown select: {select}"}
+        
+        if original_code is None:
+            original_code = parent["original_code"]
+        parent_results = parent["results"]
+        selected = self._select_rerun(parent, original_code, select, tests)
+        
+        test_code = parent["test_code"]
+        framework, language = parent["framework"], parent["language"]
+        test_cases = parent["test_cases"]
+        run = None
+        with telemetry.span("execution.rerun", parent=parent_run_id, selected=len(selected)):
+            if selected and parent["execution_mode"] == "real" and self._should_actually_execute(language, framework):
+                try:
+                    run = self._execute_real_tests(
+                        test_code, framework, language, test_cases, parent["risks"], original_code,
+                        selection=[parent_results[i].get("nodeId") or parent_results[i]["name"] for i in selected]
+                    )
+                except Exception as e:
+                    logger.warning(f"Real re-run failed, falling back to simulation: {str(e)}")
+            if selected and run is None:
+                # Simulate lại các test cases tương ứng
+                selected_ids = {parent_results[i].get("testCaseId") for i in selected}
+                subset = [tc for tc in test_cases if tc.get("id") in selected_ids] or [
+                    {"name": parent_results[i]["name"]} for i in selected
+                ]
+                run = self._simulate_test_code(framework, language, subset, parent["risks"])
+        
+        new_results = (run or {}).get("results", [])
+        results = self._merge_rerun_results(parent_results, selected, new_results)
+        coverage = self._merge_rerun_coverage(parent, original_code, selected, run)
+        passed = sum(1 for r in results if r["status"] == "pass")
+        failed = sum(1 for r in results if r["status"] == "fail")
+        merged = {
+            "success": True,
+            "run_id": f"#{self._generate_run_id()}",
+            "parent_run_id": parent_run_id,
+            "total": len(results),
+            "passed": passed,
+            "failed": failed,
+            "durationMs": (run or {}).get("durationMs", 0),  # chỉ thời gian của phần chạy lại
+            "results": results,
+            "framework": (run or {}).get("framework", framework),
+            "language": (run or {}).get("language", language),
+            "executed_at": datetime.now().isoformat(),
+            "execution_mode": run.get("execution_mode", "simulated") if run else parent["execution_mode"],
+            "coverage": coverage,
+            "rerun": {
+                "select": "explicit" if tests else select,
+                "selected": len(selected),
+                "reused": len(parent_results) - len(selected),
+                "tests": [parent_results[i]["name"] for i in selected]
+            }
+        }
+        self._remember_execution(merged, test_code, framework, language, test_cases, parent["risks"], original_code)
+        telemetry.metrics.inc(
+            "testflow_rerun_tests_total",
+            len(selected),
+            help_text="Số tests được chạy lại trong incremental re-runs"
+        )
+        return merged
+    
+    def _select_rerun(
+        self,
+        parent: Dict[str, Any],
+        original_code: str,
+        select: str,
+        tests: Optional[List[Any]]
+    ) -> List[int]:
+        """Index (trong parent results) của các tests cần chạy lại"""
+        results = parent["results"]
+        if tests:
+            wanted = {str(t) for t in tests}
+            selected = []
+            for i, r in enumerate(results):
+                keys = {str(r.get(key)) for key in ("id", "name", "nodeId", "testCaseId") if r.get(key) is not None}
+                # "test_x" chọn tất cả các biến thể parametrize "test_x[...]"
+                keys |= {re.sub(r"\[.*\]$", "", key) for key in keys}
+                if wanted & keys:
+                    selected.append(i)
+            return selected
+        
+        selected = set()
+        if select in ("failed", "failed_or_changed"):
+            selected |= {i for i, r in enumerate(results) if r.get("status") == "fail"}
+        if select in ("changed", "failed_or_changed"):
+            changed = changed_symbols(parent["original_code"], original_code, parent["language"])
+            if changed is None:
+                # Không xác định được phạm vi thay đổi - chạy lại tất cả
+                return list(range(len(results)))
+            if changed:
+                selected |= self._tests_using(parent, symbol_names(changed))
+        return sorted(selected)
+    
+    def _tests_using(self, parent: Dict[str, Any], names: set) -> set:
+        """Tests tham chiếu tới một trong các names (theo AST của test code, hoặc field function của test case)"""
+        results = parent["results"]
+        references = None
+        if parent["language"].lower() in ("python", "py"):
+            references = python_test_references(parent["test_code"])
+            if references is None:
+                return set(range(len(results)))
+        test_cases = {tc.get("id"): tc for tc in parent["test_cases"] if isinstance(tc, dict)}
+        normalized = {self._normalize_test_name(name) for name in names}
+        
+        affected = set()
+        for i, r in enumerate(results):
+            node_id = r.get("nodeId")
+            if references is not None and node_id:
+                key = re.sub(r"\[.*\]$", "", node_id.split("::", 1)[-1])
+                if references.get(key, set()) & names:
+                    affected.add(i)
+                continue
+            tc = test_cases.get(r.get("testCaseId")) or {}
+            function = tc.get("function", "")
+            if function in names or self._normalize_test_name(function) in normalized:
+                affected.add(i)
+            elif any(n and n in self._normalize_test_name(r.get("name", "")) for n in normalized):
+                affected.add(i)
+        return affected
+    
+    def _merge_rerun_coverage(
+        self,
+        parent: Dict[str, Any],
+        original_code: str,
+        selected: List[int],
+        run: Optional[Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        """Coverage của run merge; source đổi thì bitmaps của run cha không còn đúng dòng nữa"""
+        new = (run or {}).get("coverage")
+        old = parent.get("coverage")
+        if original_code != parent["original_code"]:
+            return {**new, "partial": True} if new else None
+        if not new:
+            return old
+        if not old:
+            return {**new, "partial": True}
+        rerun_tests = {parent["results"][i].get("nodeId") for i in selected}
+        sources = {path: original_code for path in new.get("files", {})}
+        return merge_coverage(old, new, rerun_tests, sources)
+    
+    def _merge_rerun_results(
+        self,
+        parent_results: List[Dict[str, Any]],
+        selected: List[int],
+        new_results: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """Kết quả mới thay cho các tests đã chọn, các tests còn lại giữ kết quả của run cha"""
+        by_key = {}
+        for r in new_results:
+            for key in (r.get("nodeId"), r.get("name"), ("testCase", r.get("testCaseId"))):
+                if key and key != ("testCase", None):
+                    by_key.setdefault(key, r)
+        selected_set = set(selected)
+        used = set()
+        merged = []
+        for i, parent_result in enumerate(parent_results):
+            if i not in selected_set:
+                merged.append({**parent_result, "rerun": False})
+                continue
+            new = (
+                by_key.get(parent_result.get("nodeId"))
+                or by_key.get(parent_result["name"])
+                or by_key.get(("testCase", parent_result.get("testCaseId")))
+            )
+            if new is None or id(new) in used:
+                new = {
+                    **parent_result,
+                    "status": "fail",
+                    "error": "Test was selected for re-run but did not report a result",
+                    "executedAt": datetime.now().isoformat()
+                }
+            else:
+                used.add(id(new))
+                new = {**new, "testCaseId": new.get("testCaseId") or parent_result.get("testCaseId")}
+            merged.append({**new, "rerun": True})
+        # Kết quả không map được về test nào của run cha (ví dụ lỗi collect)
+        merged.extend({**r, "rerun": True} for r in new_results if id(r) not in used and r.get("status") == "fail")
+        for i, r in enumerate(merged):
+            r["id"] = i + 1
+        return merged
+    
+    def _run_test_code(
+        self,
+        test_code: str,
+        framework: str = "custom",
+        language: str = "unknown",
+        test_cases: List[Dict[str, Any]] = None,
+        risks: List[str] = None,
+        original_code: str = ""
     ) -> Dict[str, Any]:
         """
         Execute test code (simulate hoặc thực sự run)
@@ -254,9 +565,6 @@ Bạn cần đảm bảo:
             risks: List of risks từ analysis để quyết định pass/fail
             original_code: Original source code từ user để import trong tests
         """
-        import random
-        import time
-        
         if not test_code:
             return {
                 "success": False,
@@ -273,82 +581,29 @@ Bạn cần đảm bảo:
                 )
             except Exception as e:
                 # Fallback to simulation nếu thực sự chạy fails
-                print(f"[WARNING] Real execution failed, falling back to simulation: {str(e)}")
+                logger.warning(f"Real execution failed, falling back to simulation: {str(e)}")
                 # Continue với simulation logic below
         
-        # Simulate test execution (fallback hoặc khi không thể thực sự chạy)
+        return self._simulate_test_code(framework, language, test_cases, risks)
+    
+    def _simulate_test_code(
+        self,
+        framework: str,
+        language: str,
+        test_cases: Optional[List[Dict[str, Any]]],
+        risks: Optional[List[str]]
+    ) -> Dict[str, Any]:
+        """Simulate test execution (fallback hoặc khi không thể thực sự chạy)"""
+        import random
+        
         results = []
         total_time = 0
         
         num_tests = len(test_cases) if test_cases else random.randint(3, 10)
         risks = risks or []
         
-        # Helper function để check nếu test case có risk liên quan
-        def has_related_risk(test_case: Dict[str, Any]) -> bool:
-            """Check nếu test case có risk liên quan dựa trên function name và test name"""
-            if not risks or not test_case:
-                return False
-            
-            function_name = test_case.get("function", "").lower()
-            test_name = test_case.get("name", "").lower()
-            test_type = test_case.get("type", "").lower()
-            
-            # Extract function name từ test name nếu có
-            # Format: functionName_WhenCondition_ExpectedResult
-            function_from_name = ""
-            if "_" in test_name:
-                function_from_name = test_name.split("_")[0].lower()
-            
-            # Match risks với function name hoặc test name
-            for risk in risks:
-                risk_lower = risk.lower()
-                
-                # Check 1: Direct function name match trong risk
-                if function_name:
-                    # Check nếu risk mention function name
-                    if function_name in risk_lower:
-                        return True
-                    # Remove common prefixes để match (get, set, is, has)
-                    clean_function = function_name
-                    for prefix in ["get", "set", "is", "has", "add", "delete", "update", "create", "remove"]:
-                        if clean_function.startswith(prefix):
-                            clean_function = clean_function[len(prefix):]
-                    if clean_function and len(clean_function) > 2 and clean_function in risk_lower:
-                        return True
-                
-                # Check 2: Function name từ test name
-                if function_from_name:
-                    if function_from_name in risk_lower:
-                        return True
-                    # Remove prefixes
-                    clean_name = function_from_name
-                    for prefix in ["test", "should", "verify", "check"]:
-                        if clean_name.startswith(prefix):
-                            clean_name = clean_name[len(prefix):]
-                    if clean_name and len(clean_name) > 2 and clean_name in risk_lower:
-                        return True
-                
-                # Check 3: Partial match với test name keywords
-                if test_name:
-                    # Extract keywords từ test name
-                    # Ví dụ: "deleteProduct_WhenProductExists_DoesNotRemoveProductFromProductsArray"
-                    # -> keywords: ["delete", "product", "does", "not", "remove", "product", "from", "products", "array"]
-                    keywords = re.findall(r'\b\w+\b', test_name.lower())
-                    # Filter common words
-                    meaningful_keywords = [k for k in keywords if k not in ["when", "then", "should", "test", "the", "a", "an", "is", "are", "from", "to", "and", "or"]]
-                    
-                    # Check nếu risk có chứa meaningful keywords
-                    for keyword in meaningful_keywords:
-                        if len(keyword) > 3 and keyword in risk_lower:
-                            return True
-                
-                # Check 4: Negative tests và error keywords trong risk
-                if test_type == "negative" or any(word in test_name for word in ["not", "fail", "error", "exception", "throw"]):
-                    error_keywords = ["không", "không cập nhật", "không kiểm tra", "không thay đổi", "lỗi", "fail", "error", "exception", "throwing"]
-                    if any(keyword in risk_lower for keyword in error_keywords):
-                        return True
-            
-            return False
+        # Inverted index token -> risks, build một lần cho cả request
+        risk_index = RiskIndex(risks)
         
         for i in range(num_tests):
             # Simulate execution time
@@ -366,7 +621,8 @@ Bạn cần đảm bảo:
             # Quyết định pass/fail dựa trên risks
             # Nếu có risk liên quan: 80-90% fail rate (realistic vì code có bug)
             # Nếu không có risk: 15% fail rate (normal)
-            has_risk = has_related_risk(test_case) if test_case else False
+            risk_matches = risk_index.match(test_case)
+            has_risk = bool(risk_matches)
             
             if has_risk:
                 # Có risk liên quan -> xác suất fail cao hơn
@@ -383,7 +639,7 @@ Bạn cần đảm bảo:
             
             # Debug log để kiểm tra matching
             if test_case:
-                print(f"[DEBUG] Test: {test_name}, Function: {test_case.get('function', '')}, Has Risk: {has_risk}, Status: {status}")
+                logger.debug(f"Test: {test_name}, Function: {test_case.get('function', '')}, Has Risk: {has_risk}, Status: {status}")
             
             # Generate log
             log_lines = [
@@ -410,8 +666,12 @@ Bạn cần đảm bảo:
                 "timeMs": execution_time,
                 "log": "\n".join(log_lines),
                 "error": error,
-                "executedAt": datetime.now().isoformat()
+                "executedAt": datetime.now().isoformat(),
+                "testCaseId": test_case.get("id") if test_case else None
             }
+            if risk_matches:
+                # Lý do test được coi là liên quan tới risk (quyết định fail rate)
+                result["riskMatches"] = risk_matches
             
             results.append(result)
         
@@ -582,29 +842,13 @@ Bạn cần đảm bảo:
         
         # Python pytest - có thể thực sự chạy nếu pytest có sẵn
         if language_lower in ["python", "py"] and "pytest" in framework_lower:
-            try:
-                # Check nếu pytest có sẵn
-                result = subprocess.run(
-                    ["pytest", "--version"],
-                    capture_output=True,
-                    timeout=5
-                )
-                return result.returncode == 0
-            except:
-                return False
+            # Check một lần (khởi động worker pool hoặc tìm pytest CLI), kết quả được cache
+            return get_pytest_pool().available()
         
         # JavaScript/TypeScript Jest - cần có Node.js và Jest
         if language_lower in ["javascript", "typescript", "js", "ts"] and "jest" in framework_lower:
-            try:
-                # Check nếu node có sẵn
-                result = subprocess.run(
-                    ["node", "--version"],
-                    capture_output=True,
-                    timeout=5
-                )
-                return result.returncode == 0
-            except:
-                return False
+            # Node version được check một lần; toolchain cài lỗi gần đây thì simulate luôn
+            return get_jest_toolchain().available()
         
         # Các languages khác tạm thời simulate
         return False
@@ -616,7 +860,8 @@ Bạn cần đảm bảo:
         language: str,
         test_cases: List[Dict[str, Any]],
         risks: List[str],
-        original_code: str = ""
+        original_code: str = "",
+        selection: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """
         Thực sự chạy tests (Python pytest)
@@ -628,15 +873,20 @@ Bạn cần đảm bảo:
             test_cases: Original test cases để map results
             risks: List of risks (dùng để validate results)
             original_code: Original source code từ user
+            selection: Chỉ chạy các tests này (pytest node ids / Jest full names)
         """
         language_lower = language.lower()
         framework_lower = framework.lower()
         
         if language_lower in ["python", "py"] and "pytest" in framework_lower:
-            return self._execute_pytest_tests(test_code, test_cases, risks, original_code)
+            return self._execute_pytest_tests(test_code, test_cases, risks, original_code, node_ids=selection)
         
         if language_lower in ["javascript", "typescript", "js", "ts"] and "jest" in framework_lower:
-            return self._execute_jest_tests(test_code, test_cases, risks, original_code)
+            return self._execute_jest_tests(
+                test_code, test_cases, risks, original_code,
+                typescript=language_lower in ["typescript", "ts"],
+                test_names=selection
+            )
         
         # Fallback nếu không support
         raise NotImplementedError(f"Real execution not yet implemented for {language}/{framework}")
@@ -646,7 +896,8 @@ Bạn cần đảm bảo:
         test_code: str,
         test_cases: List[Dict[str, Any]],
         risks: List[str],
-        original_code: str = ""
+        original_code: str = "",
+        node_ids: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """
         Thực sự chạy Python pytest tests
@@ -656,6 +907,7 @@ Bạn cần đảm bảo:
             test_cases: Original test cases
             risks: List of risks
             original_code: Original source code từ user để import
+            node_ids: Chỉ chạy các tests này ("test_generated.py::test_x"), None = cả file
         """
         # Tạo temporary directory cho test files
         with tempfile.TemporaryDirectory() as tmpdir:
@@ -742,113 +994,89 @@ Bạn cần đảm bảo:
                             test_code = f"from {source_module_name} import *\n\n{test_code}"
             
             test_file = os.path.join(tmpdir, "test_generated.py")
+            report_file = os.path.join(tmpdir, "report.xml")
             
             # Write test code vào file
             with open(test_file, "w", encoding="utf-8") as f:
                 f.write(test_code)
             
-            # Chạy pytest với JSON report
+            # Coverage (line + branch, context theo từng test) cho source file của user
+            collect_coverage = (
+                source_file is not None
+                and Config.COVERAGE_ENABLED
+                and coverage_available()
+                and self.coverage_budget.should_collect()
+            )
+            if collect_coverage:
+                install_coverage_plugin(tmpdir, [os.path.basename(source_file)], branch=Config.COVERAGE_BRANCH)
+            
+            # Chạy pytest với JUnit XML report (kết quả có cấu trúc thay vì parse stdout)
             start_time = datetime.now()
             try:
-                result = subprocess.run(
-                    [
-                        "pytest",
-                        test_file,
-                        "-v",  # Verbose để có output chi tiết
-                        "--tb=short",  # Short traceback
-                        "--no-header",  # Không show header
-                        "--color=no"  # Không màu để dễ parse
-                    ],
-                    capture_output=True,
-                    text=True,
-                    timeout=60,  # Timeout 60s
-                    cwd=tmpdir
-                )
+                with telemetry.span("execution.pytest", test_cases=len(test_cases or []), coverage=collect_coverage) as span:
+                    # Chạy trong warm worker (fork, pytest đã import sẵn), fallback subprocess
+                    result = get_pytest_pool().run(
+                        [
+                            *(node_ids or [test_file]),
+                            "-q",
+                            "--tb=short",  # Short traceback trong report
+                            "--no-header",  # Không show header
+                            "--color=no",
+                            "-p", "no:cacheprovider",  # Không ghi .pytest_cache trong job dir
+                            f"--junitxml={report_file}"
+                        ],
+                        cwd=tmpdir,
+                        timeout=Config.PYTEST_TIMEOUT
+                    )
+                    span.set_attribute("returncode", result.returncode)
                 
                 duration = (datetime.now() - start_time).total_seconds() * 1000
+                if not os.path.exists(report_file):
+                    raise ValueError(f"pytest did not write a report (exit {result.returncode}): {result.stderr[-500:]}")
                 
-                # Parse pytest output
-                stdout = result.stdout
-                stderr = result.stderr
-                
-                # Extract test results từ output
+                test_case_index = self._test_case_index(test_cases)
                 results = []
                 passed_count = 0
                 failed_count = 0
                 
-                # Parse pytest verbose output
-                # Format: test_file.py::test_name PASSED/FAILED [XX%]
-                # Hoặc: test_name PASSED/FAILED
-                test_pattern = r"(?:.+::)?(.+?)\s+(PASSED|FAILED)(?:\s+\[(\d+)%\])?(?:\s+in\s+([\d.]+)\s*(?:ms|s))?"
-                
-                test_names_found = []
-                for line in stdout.split("\n"):
-                    match = re.search(test_pattern, line)
-                    if match:
-                        test_name = match.group(1).strip()
-                        # Remove file path prefix nếu có (ví dụ: test_file.py::test_name -> test_name)
-                        if "::" in test_name:
-                            test_name = test_name.split("::")[-1]
-                        test_name = test_name.strip()
-                        
-                        if test_name in test_names_found:
-                            continue  # Skip duplicate
-                        test_names_found.append(test_name)
-                        
-                        status_str = match.group(2).strip()
-                        duration_str = match.group(4) if match.group(4) else "0"
-                        
-                        # Parse duration
-                        try:
-                            duration_ms = float(duration_str.replace("ms", "").replace("s", ""))
-                            if "s" in duration_str or ("s" not in duration_str and float(duration_str) > 100):
-                                duration_ms *= 1000
-                        except:
-                            duration_ms = random.randint(50, 500)
-                        
-                        status = "pass" if status_str == "PASSED" else "fail"
-                        if status == "pass":
-                            passed_count += 1
-                        else:
-                            failed_count += 1
-                        
-                        # Match với test case để lấy error message nếu có
-                        error = None
-                        log = f"[INFO] Running test: {test_name}\n"
-                        if status == "fail":
-                            # Tìm error message trong stderr
-                            error_start = stderr.find(test_name)
-                            if error_start != -1:
-                                error_lines = stderr[error_start:].split("\n")[:10]
-                                error = "\n".join(error_lines)
-                                log += f"[ERROR] Test failed:\n{error}"
-                            else:
-                                error = "Test assertion failed"
-                                log += f"[ERROR] {error}"
-                        else:
-                            log += f"[SUCCESS] Test passed in {duration_ms:.0f}ms"
-                        
-                        # Find matching test case
-                        matching_test = None
-                        for tc in test_cases:
-                            tc_name = tc.get("name", "").lower()
-                            if tc_name and tc_name in test_name.lower() or test_name.lower() in tc_name:
-                                matching_test = tc
-                                break
-                        
-                        results.append({
-                            "id": len(results) + 1,
-                            "name": test_name,
-                            "status": status,
-                            "timeMs": int(duration_ms),
-                            "log": log,
-                            "error": error,
-                            "executedAt": datetime.now().isoformat()
-                        })
+                for testcase in TestingAgent.iter_junit_testcases(path=report_file):
+                    test_name = testcase["name"]
+                    status = testcase["status"]
+                    duration_ms = testcase["duration"]
+                    error = None
+                    log = f"[INFO] Running test: {test_name}\n"
+                    if status == "pass":
+                        passed_count += 1
+                        log += f"[SUCCESS] Test passed in {duration_ms:.0f}ms"
+                    elif status == "fail":
+                        failed_count += 1
+                        # Traceback đầy đủ từ report, message nếu không có
+                        error = testcase["stackTrace"] or testcase["error"] or "Test assertion failed"
+                        log += f"[ERROR] Test failed:\n{error}"
+                    else:
+                        log += f"[SKIP] {testcase.get('skipReason') or 'Test skipped'}"
+                    
+                    matching_test = self._match_test_case(test_case_index, test_name)
+                    results.append({
+                        "id": len(results) + 1,
+                        "name": test_name,
+                        "nodeId": self._pytest_node_id(os.path.basename(test_file), testcase["classname"], test_name),
+                        "status": status,
+                        "timeMs": int(duration_ms),
+                        "log": log,
+                        "error": error,
+                        "executedAt": datetime.now().isoformat(),
+                        "testCaseId": matching_test.get("id") if matching_test else None
+                    })
                 
-                # Nếu không parse được từ output, fallback to simulation
+                # Nếu report không có testcase nào, fallback to simulation
                 if not results:
-                    raise ValueError("Could not parse pytest output, falling back to simulation")
+                    raise ValueError("pytest report has no test cases, falling back to simulation")
+                
+                coverage = None
+                if collect_coverage:
+                    coverage = load_coverage_report(tmpdir, {os.path.basename(source_file): original_code})
+                self._record_coverage_overhead(collect_coverage, duration, len(results))
                 
                 return {
                     "success": True,
@@ -861,34 +1089,187 @@ Bạn cần đảm bảo:
                     "framework": "pytest",
                     "language": "python",
                     "executed_at": datetime.now().isoformat(),
-                    "execution_mode": "real"  # Flag để biết là thực sự chạy
+                    "execution_mode": "real",  # Flag để biết là thực sự chạy
+                    "coverage": coverage
                 }
                 
             except subprocess.TimeoutExpired:
-                raise TimeoutError("Test execution timeout after 60 seconds")
+                raise TimeoutError(f"Test execution timeout after {Config.PYTEST_TIMEOUT} seconds")
             except Exception as e:
                 raise Exception(f"Failed to execute pytest tests: {str(e)}")
     
+    def _record_coverage_overhead(self, covered: bool, duration_ms: float, tests: int):
+        self.coverage_budget.record(covered, duration_ms, tests)
+        overhead = self.coverage_budget.overhead
+        if overhead is not None:
+            telemetry.metrics.set_gauge(
+                "testflow_coverage_overhead_ratio",
+                overhead,
+                help_text="Overhead ước lượng của coverage khi chạy generated tests (0.25 = chậm hơn 25%)"
+            )
+    
+    @staticmethod
+    def _pytest_node_id(file_name: str, classname: str, name: str) -> str:
+        """JUnit classname "test_generated.TestCalc" + name -> "test_generated.py::TestCalc::test_add" """
+        module = os.path.splitext(file_name)[0]
+        parts = (classname or "").split(".")
+        if parts and parts[0] == module:
+            parts = parts[1:]
+        return "::".join([file_name, *[p for p in parts if p], name])
+    
     def _execute_jest_tests(
         self,
         test_code: str,
         test_cases: List[Dict[str, Any]],
         risks: List[str],
-        original_code: str = ""
+        original_code: str = "",
+        typescript: bool = False,
+        test_names: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """
         Thực sự chạy JavaScript/TypeScript Jest tests
         
-        Note: Cần setup Jest project structure, nên có thể phức tạp hơn
+        Toolchain (jest, babel, ts-jest) đã cài sẵn được symlink vào job directory nên
+        setup mỗi job chỉ mất vài ms, không chạy npm install.
         
         Args:
             test_code: Generated test code
             test_cases: Original test cases
             risks: List of risks
             original_code: Original source code từ user để import
+            typescript: Test/source là TypeScript (dùng ts-jest)
+            test_names: Chỉ chạy các tests này (full name), None = tất cả
         """
-        # Tạm thời raise để fallback về simulation
-        # Có thể implement sau khi có nhu cầu
-        # TODO: Implement combine original_code với test_code cho JavaScript
-        raise NotImplementedError("Jest execution not yet fully implemented")
-
+        toolchain = get_jest_toolchain()
+        ext = "ts" if typescript else "js"
+        
+        with tempfile.TemporaryDirectory() as tmpdir:
+            if original_code and original_code.strip():
+                source_name, source_code, test_code = self._combine_jest_sources(test_code, original_code, typescript)
+                with open(os.path.join(tmpdir, f"{source_name}.{ext}"), "w", encoding="utf-8") as f:
+                    f.write(source_code)
+            with open(os.path.join(tmpdir, f"generated.test.{ext}"), "w", encoding="utf-8") as f:
+                f.write(test_code)
+            
+            start_time = datetime.now()
+            try:
+                with telemetry.span("execution.jest", test_cases=len(test_cases or []), typescript=typescript) as span:
+                    config_path = toolchain.prepare_job(tmpdir, typescript=typescript)
+                    pattern = f"^(?:{'|'.join(re.escape(name) for name in test_names)})$" if test_names else None
+                    report = toolchain.run(tmpdir, config_path, timeout=Config.JEST_TIMEOUT, test_name_pattern=pattern)
+                    span.set_attribute("success", report.get("success"))
+            except subprocess.TimeoutExpired:
+                raise TimeoutError(f"Test execution timeout after {Config.JEST_TIMEOUT} seconds")
+            duration = (datetime.now() - start_time).total_seconds() * 1000
+        
+        test_case_index = self._test_case_index(test_cases)
+        results = []
+        passed_count = 0
+        failed_count = 0
+        status_map = {"passed": "pass", "failed": "fail", "pending": "skip", "skipped": "skip", "todo": "skip"}
+        for test_file in report.get("testResults", []):
+            for assertion in test_file.get("assertionResults", []):
+                test_name = assertion.get("fullName") or assertion.get("title", "")
+                status = status_map.get(assertion.get("status"), "fail")
+                duration_ms = assertion.get("duration") or 0
+                error = None
+                log = f"[INFO] Running test: {test_name}\n"
+                if status == "pass":
+                    passed_count += 1
+                    log += f"[SUCCESS] Test passed in {duration_ms:.0f}ms"
+                elif status == "fail":
+                    failed_count += 1
+                    error = "\n".join(assertion.get("failureMessages") or []) or "Test assertion failed"
+                    log += f"[ERROR] Test failed:\n{error}"
+                else:
+                    log += "[SKIP] Test skipped"
+                
+                matching_test = self._match_test_case(test_case_index, assertion.get("title", ""), test_name)
+                results.append({
+                    "id": len(results) + 1,
+                    "name": test_name,
+                    "status": status,
+                    "timeMs": int(duration_ms),
+                    "log": log,
+                    "error": error,
+                    "executedAt": datetime.now().isoformat(),
+                    "testCaseId": matching_test.get("id") if matching_test else None
+                })
+        
+        # Không có assertion nào (ví dụ test file lỗi syntax) thì fallback to simulation như pytest
+        if not results:
+            messages = [t.get("message", "") for t in report.get("testResults", []) if t.get("message")]
+            raise ValueError(f"Could not get Jest results, falling back to simulation: {' '.join(messages)[:500]}")
+        
+        return {
+            "success": True,
+            "run_id": f"#{self._generate_run_id()}",
+            "total": len(results),
+            "passed": passed_count,
+            "failed": failed_count,
+            "durationMs": int(duration),
+            "results": results,
+            "framework": "jest",
+            "language": "typescript" if typescript else "javascript",
+            "executed_at": datetime.now().isoformat(),
+            "execution_mode": "real"
+        }
+    
+    @staticmethod
+    def _normalize_test_name(name: str) -> str:
+        """"test_adds_two_numbers" / "Adds two numbers" -> "addstwonumbers" """
+        name = re.sub(r"[^a-z0-9]", "", (name or "").lower())
+        return name[4:] if name.startswith("test") and len(name) > 4 else name
+    
+    def _test_case_index(self, test_cases: Optional[List[Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+        """Index test cases theo tên đã normalize (name/title) để map kết quả O(1) mỗi test"""
+        index = {}
+        for tc in test_cases or []:
+            for key in ("name", "title"):
+                normalized = self._normalize_test_name(tc.get(key, ""))
+                if normalized:
+                    index.setdefault(normalized, tc)
+        return index
+    
+    def _match_test_case(self, index: Dict[str, Dict[str, Any]], *names: str) -> Optional[Dict[str, Any]]:
+        for name in names:
+            tc = index.get(self._normalize_test_name(name))
+            if tc is not None:
+                return tc
+        return None
+    
+    _JS_DECLARATION_RE = re.compile(
+        r"^(?:export\s+)?(?:async\s+)?(?:function\*?|class|const|let|var)\s+([A-Za-z_$][\w$]*)", re.M
+    )
+    _JS_RELATIVE_IMPORT_RE = re.compile(r"""(?:require\(\s*|from\s+)['"]\./([\w.-]+?)(?:\.[jt]sx?)?['"]""")
+    
+    def _combine_jest_sources(self, test_code: str, original_code: str, typescript: bool = False):
+        """
+        Ghép original_code với generated test: source file được đặt theo tên module mà test import
+        (./calculator...) hoặc "source"; export các top-level declarations nếu source chưa export gì,
+        và thêm import vào test nếu test chưa import source.
+        
+        Returns:
+            (source_name, source_code, test_code)
+        """
+        import_match = self._JS_RELATIVE_IMPORT_RE.search(test_code)
+        source_name = import_match.group(1) if import_match else "source"
+        names = list(dict.fromkeys(self._JS_DECLARATION_RE.findall(original_code)))
+        
+        source_code = original_code
+        has_exports = "module.exports" in original_code or re.search(r"^\s*export\s", original_code, re.M)
+        if names and not has_exports:
+            export_line = f"export {{ {', '.join(names)} }};" if typescript else f"module.exports = {{ {', '.join(names)} }};"
+            source_code = f"{original_code.rstrip()}\n\n{export_line}\n"
+        
+        if not import_match:
+            # Không import lại tên mà test đã tự khai báo (ví dụ mock implementation)
+            declared_in_test = set(self._JS_DECLARATION_RE.findall(test_code))
+            imported = [name for name in names if name not in declared_in_test]
+            if imported:
+                if typescript:
+                    import_line = f"import {{ {', '.join(imported)} }} from './{source_name}';"
+                else:
+                    import_line = f"const {{ {', '.join(imported)} }} = require('./{source_name}');"
+                test_code = f"{import_line}\n\n{test_code}"
+        return source_name, source_code, test_code
@@ -1,21 +1,51 @@
 """
 Leader Agent (Orchestrator) - Điều phối và phân công công việc cho các specialist agents
 """
-from typing import Dict, Any, List
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
 from .base_agent import BaseAgent
+from llm import LLMProvider, LLMError
+from config import Config
 
 
 class LeaderAgent(BaseAgent):
     """Agent trưởng - phân tích yêu cầu và giao việc cho các agent chuyên gia"""
     
-    def __init__(self, api_key: str = None):
-        super().__init__("Leader", api_key)
+    # Các nguồn request đã biết -> plan template (không cần gọi LLM)
+    CODE_SOURCES = ["code_snippet", "uploaded_files", "github"]
+    
+    PLAN_TEMPLATES = {
+        "code_snippet": [
+            {"id": "analyze_code", "agent": "ai_analysis_agent", "task": "Phân tích code snippet và đề xuất test cases",
+             "input": {"action": "analyze_code"}, "depends_on": [], "required": True}
+        ],
+        "uploaded_files": [
+            {"id": "analyze_code", "agent": "ai_analysis_agent", "task": "Phân tích các file code và đề xuất test cases",
+             "input": {"action": "analyze_code"}, "depends_on": [], "required": True}
+        ],
+        "github": [
+            {"id": "analyze_code", "agent": "ai_analysis_agent", "task": "Phân tích codebase GitHub và đề xuất test cases",
+             "input": {"action": "analyze_code"}, "depends_on": [], "required": True}
+        ],
+        "error_analysis": [
+            {"id": "analyze_errors", "agent": "ai_analysis_agent", "task": "Phân tích các test bị fail",
+             "input": {"action": "analyze_multiple"}, "depends_on": [], "required": True}
+        ]
+    }
+    
+    def __init__(self, api_key: str = None, provider: Optional[LLMProvider] = None):
+        super().__init__("Leader", api_key, provider)
         self.available_agents = [
             "testing_agent",
             "execution_agent", 
             "reporting_agent",
             "ai_analysis_agent"
         ]
+        # Cache workflow (đã bỏ input riêng của request) theo request class
+        self._plan_cache: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self._plan_cache_lock = threading.Lock()
+        self.plan_cache_size = Config.PLAN_CACHE_SIZE
     
     def get_system_prompt(self) -> str:
         return """Bạn là Leader Agent - một Project Manager thông minh trong hệ thống TestFlow AI.
@@ -36,12 +66,15 @@ Bạn cần:
 - Phân tích task một cách chi tiết
 - Xác định agent nào cần tham gia
 - Tạo kế hoạch thực thi rõ ràng
+- Khai báo dependencies giữa các bước: "depends_on" là list ID các bước cần output của chúng.
+  Các bước độc lập (ví dụ reporting và AI analysis trên cùng input) để "depends_on": [] để chạy song song.
+- Đánh dấu "required": true cho bước mà nếu fail thì cả workflow không còn ý nghĩa
 - Trả về JSON với format:
 {
   "agents_needed": ["agent1", "agent2"],
   "workflow": [
-    {"agent": "agent1", "task": "mô tả task", "input": {...}},
-    {"agent": "agent2", "task": "mô tả task", "input": {...}}
+    {"id": "step_1", "agent": "agent1", "task": "mô tả task", "input": {...}, "depends_on": [], "required": true},
+    {"id": "step_2", "agent": "agent2", "task": "mô tả task", "input": {...}, "depends_on": ["step_1"]}
   ],
   "reasoning": "Giải thích tại sao chọn các agent này và workflow này"
 }"""
@@ -54,17 +87,24 @@ Bạn cần:
 
 Yêu cầu: {user_request}
 
-Context hiện tại: {context or "Không có"}
-
 Hãy xác định:
 1. Agent nào cần tham gia?
 2. Thứ tự thực hiện (workflow)
 3. Input cho từng agent
-4. Cách kết nối output của agent này với input của agent tiếp theo
+4. Cách kết nối output của agent này với input của agent tiếp theo (depends_on)
 
 Trả về JSON với format đã mô tả trong system prompt."""
         
-        response = self.call_llm(prompt, context)
+        try:
+            response = self.call_llm(prompt, context)
+        except LLMError as e:
+            # process() sẽ fallback sang keyword routing
+            return {
+                "agents_needed": [],
+                "workflow": [],
+                "reasoning": "",
+                "error": f"LLM call failed: {str(e)}"
+            }
         
         # Parse JSON từ response
         try:
@@ -127,6 +167,111 @@ Trả về JSON với format đã mô tả trong system prompt."""
         
         return list(set(agents))  # Remove duplicates
     
+    def classify_request(self, user_request: str, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Phân loại request dựa trên source đã biết và keywords
+        
+        Returns:
+            Dict với request_class, agents và deterministic (True nếu không cần LLM planner)
+        """
+        context = context or {}
+        source = context.get("source")
+        
+        if source in self.CODE_SOURCES:
+            return {"request_class": source, "agents": ["ai_analysis_agent"], "deterministic": True}
+        
+        if source == "error_analysis" or context.get("failed_tests") or context.get("test_run"):
+            return {"request_class": "error_analysis", "agents": ["ai_analysis_agent"], "deterministic": True}
+        
+        agents = sorted(self.determine_agent_type(user_request))
+        if len(agents) == 1:
+            return {"request_class": f"single:{agents[0]}", "agents": agents, "deterministic": True}
+        
+        return {
+            "request_class": f"free_form:{'+'.join(agents)}" if agents else None,
+            "agents": agents,
+            "deterministic": False
+        }
+    
+    def route_request(self, user_request: str, context: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Fast path: tạo plan bằng rule/template hoặc từ cache, không gọi LLM
+        
+        Returns:
+            Plan dict, hoặc None nếu request mơ hồ và cần LLM planner
+        """
+        context = context or {}
+        classification = self.classify_request(user_request, context)
+        request_class = classification["request_class"]
+        
+        if classification["deterministic"]:
+            template = self.PLAN_TEMPLATES.get(request_class)
+            if template:
+                workflow = [{**step, "input": dict(step.get("input", {}))} for step in template]
+            else:
+                # Request free-form rõ ràng (1 agent): truyền context làm input cho agent
+                workflow = [
+                    {"id": "step_1", "agent": agent, "task": user_request, "input": dict(context), "depends_on": []}
+                    for agent in classification["agents"]
+                ]
+            
+            if request_class == "error_analysis":
+                workflow[0]["input"]["failed_tests"] = self._failed_tests_from_context(context)
+            
+            return {
+                "agents_needed": classification["agents"],
+                "workflow": workflow,
+                "reasoning": f"Rule-based routing cho request class '{request_class}'",
+                "routing": {"mode": "template", "request_class": request_class}
+            }
+        
+        cached = self._get_cached_workflow(request_class)
+        if cached:
+            return {
+                "agents_needed": sorted({step.get("agent") for step in cached}),
+                "workflow": [{**step, "task": user_request} for step in cached],
+                "reasoning": f"Workflow từ cache cho request class '{request_class}'",
+                "routing": {"mode": "cached", "request_class": request_class}
+            }
+        
+        return None
+    
+    def _failed_tests_from_context(self, context: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Lấy danh sách test fail từ context (failed_tests hoặc test_run)"""
+        if context.get("failed_tests"):
+            return context.get("failed_tests")
+        test_run = context.get("test_run") or {}
+        return [
+            t for t in test_run.get("test_results", [])
+            if t.get("status") == "fail"
+        ]
+    
+    def _get_cached_workflow(self, request_class: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        if not request_class:
+            return None
+        with self._plan_cache_lock:
+            workflow = self._plan_cache.get(request_class)
+            if workflow is not None:
+                self._plan_cache.move_to_end(request_class)
+            return workflow
+    
+    def _cache_workflow(self, request_class: Optional[str], workflow: List[Dict[str, Any]]):
+        """Lưu skeleton của workflow (agent, id, depends_on, required) - bỏ task/input riêng của request"""
+        if not request_class or not workflow or self.plan_cache_size <= 0:
+            return
+        skeleton = [
+            {key: step[key] for key in ("id", "agent", "depends_on", "required", "timeout") if key in step}
+            for step in workflow
+            if isinstance(step, dict) and step.get("agent") in self.available_agents
+        ]
+        if not skeleton:
+            return
+        with self._plan_cache_lock:
+            self._plan_cache[request_class] = skeleton
+            self._plan_cache.move_to_end(request_class)
+            while len(self._plan_cache) > self.plan_cache_size:
+                self._plan_cache.popitem(last=False)
+    
     def process(self, task: Dict[str, Any]) -> Dict[str, Any]:
         """
         Xử lý task - phân tích và tạo workflow
@@ -134,6 +279,16 @@ Trả về JSON với format đã mô tả trong system prompt."""
         user_request = task.get("request", "")
         context = task.get("context", {})
         
+        # Fast path: request đã biết -> template/cache, bỏ qua LLM call
+        if Config.FAST_PATH_ROUTING:
+            plan = self.route_request(user_request, context)
+            if plan:
+                return {
+                    "success": True,
+                    "leader_plan": plan,
+                    "next_step": "delegate_to_agents"
+                }
+        
         # Phân tích với LLM
         plan = self.analyze_task(user_request, context)
         
@@ -141,11 +296,20 @@ Trả về JSON với format đã mô tả trong system prompt."""
         if not plan.get("agents_needed") or plan.get("error"):
             agents = self.determine_agent_type(user_request)
             plan["agents_needed"] = agents
-            plan["workflow"] = [{"agent": agent, "task": user_request} for agent in agents]
+            # Các agent cùng xử lý một request nên độc lập với nhau
+            plan["workflow"] = [
+                {"id": f"step_{i + 1}", "agent": agent, "task": user_request, "depends_on": []}
+                for i, agent in enumerate(agents)
+            ]
+            plan["routing"] = {"mode": "keyword"}
+        else:
+            if Config.FAST_PATH_ROUTING:
+                request_class = self.classify_request(user_request, context)["request_class"]
+                self._cache_workflow(request_class, plan.get("workflow", []))
+            plan["routing"] = {"mode": "llm"}
         
         return {
             "success": True,
             "leader_plan": plan,
             "next_step": "delegate_to_agents"
         }
-
@@ -3,14 +3,18 @@ Reporting Agent - Tạo báo cáo, dashboard và visualization
 """
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
+import logging
 from .base_agent import BaseAgent
+from llm import LLMProvider, LLMError
+
+logger = logging.getLogger(__name__)
 
 
 class ReportingAgent(BaseAgent):
     """Agent chuyên tạo báo cáo và dashboard"""
     
-    def __init__(self, api_key: str = None):
-        super().__init__("Reporting", api_key)
+    def __init__(self, api_key: str = None, provider: Optional[LLMProvider] = None):
+        super().__init__("Reporting", api_key, provider)
     
     def get_system_prompt(self) -> str:
         return """Bạn là Reporting Agent - chuyên gia tạo báo cáo và dashboard cho test results.
@@ -36,6 +40,7 @@ Bạn cần:
             return {
                 "metrics": {},
                 "charts_data": {},
+                "duration_regressions": {},
                 "insights": []
             }
         
@@ -51,6 +56,9 @@ Bạn cần:
         
         overall_pass_rate = (total_passed / total_tests * 100) if total_tests > 0 else 0
         
+        # Duration regressions (so với baseline streaming của từng test) được tính lúc upload
+        slowdowns = latest_run.get("duration_regressions") or {}
+        
         metrics = {
             "latest_pass_rate": latest_run.get("summary", {}).get("pass_rate", 0),
             "latest_failed_tests": latest_run.get("failed", 0),
@@ -58,7 +66,9 @@ Bạn cần:
             "latest_total_tests": latest_run.get("total_tests", 0),
             "overall_pass_rate": round(overall_pass_rate, 2),
             "total_runs": total_runs,
-            "avg_duration": round(avg_duration / 1000, 2)  # seconds
+            "avg_duration": round(avg_duration / 1000, 2),  # seconds
+            "latest_slow_tests": slowdowns.get("total_flagged", 0),
+            "latest_slow_suites": len(slowdowns.get("suites", []))
         }
         
         # Tạo chart data cho 7 ngày gần nhất
@@ -90,6 +100,11 @@ Bạn cần:
                 "bar_chart": bar_data,
                 "trend_data": last_7_days
             },
+            "duration_regressions": {
+                "suites": slowdowns.get("suites", []),
+                "tests": slowdowns.get("tests", [])[:10],
+                "run": slowdowns.get("run")
+            },
             "insights": insights
         }
     
@@ -133,6 +148,8 @@ Bạn cần:
             "tests": filtered_tests_sorted,
             "filters_applied": filters,
             "slowest_tests": filtered_tests_sorted[:10],  # Top 10 slowest
+            # Chậm đi so với baseline của chính test đó (không chỉ chậm nhất trong run)
+            "duration_regressions": (test_run.get("duration_regressions") or {}).get("tests", []),
             "failed_tests": by_status["fail"]
         }
     
@@ -324,6 +341,9 @@ Thời gian trung bình: {metrics.get('avg_duration')}s
         latest = test_runs[0]
         previous = test_runs[1] if len(test_runs) > 1 else None
         
+        for suite in (latest.get("duration_regressions") or {}).get("suites", [])[:3]:
+            summary += f"\n⏱️ Suite {suite.get('suite') or '(root)'} chậm hơn {suite['ratio'] * 100:.0f}% so với baseline"
+        
         if previous:
             latest_pass_rate = latest.get("summary", {}).get("pass_rate", 0)
             prev_pass_rate = previous.get("summary", {}).get("pass_rate", 0)
@@ -345,7 +365,12 @@ Hãy đưa ra insights về:
 
 Trả về dạng list các insights (mỗi insight một dòng, ngắn gọn)."""
         
-        response = self.call_llm(prompt)
+        try:
+            response = self.call_llm(prompt)
+        except LLMError as e:
+            # Fallback: insights thống kê thay vì đưa error message vào dashboard
+            logger.warning(f"LLM insights failed: {e}")
+            return [line.strip() for line in summary.split("\n") if line.strip()][:5]
         insights = [line.strip() for line in response.split("\n") if line.strip() and line.strip().startswith(("1", "2", "3", "4", "5", "-", "•"))]
         
         if not insights:
@@ -3,15 +3,17 @@ Testing Agent - Xử lý file kết quả test từ GitHub Actions và các ngu
 """
 import json
 import xml.etree.ElementTree as ET
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Iterator
 from .base_agent import BaseAgent
+from llm import LLMProvider, LLMError
+from utils.telemetry import telemetry
 
 
 class TestingAgent(BaseAgent):
     """Agent chuyên xử lý test results files"""
     
-    def __init__(self, api_key: str = None):
-        super().__init__("Testing", api_key)
+    def __init__(self, api_key: str = None, provider: Optional[LLMProvider] = None):
+        super().__init__("Testing", api_key, provider)
     
     def get_system_prompt(self) -> str:
         return """Bạn là Testing Agent - chuyên gia trong việc xử lý và phân tích file kết quả test.
@@ -47,59 +49,121 @@ Output format mong muốn:
   }
 }"""
     
-    def parse_junit_xml(self, xml_content: str) -> Dict[str, Any]:
-        """Parse JUnit XML format"""
+    # Kích thước mỗi chunk feed cho XML pull parser (streaming, không build cả cây trong memory)
+    JUNIT_CHUNK_SIZE = 1 << 16
+    
+    @classmethod
+    def iter_junit_testcases(
+        cls,
+        xml_content: Optional[str] = None,
+        path: Optional[str] = None,
+        root_attrib: Optional[Dict[str, str]] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream các <testcase> của JUnit XML (từ string hoặc file), mỗi testcase được clear sau khi đọc
+        
+        Yields:
+            {"name", "classname", "status", "duration" (ms), "error", "stackTrace"}
+        Args:
+            root_attrib: dict nhận attributes của root element (tests, failures, time...) khi parse xong
+        """
+        parser = ET.XMLPullParser(events=("end",))
+        last = None
+        for chunk in cls._junit_chunks(xml_content, path):
+            parser.feed(chunk)
+            for _, elem in parser.read_events():
+                last = elem
+                if elem.tag == "testcase":
+                    yield cls._junit_testcase(elem)
+                    elem.clear()
+                elif elem.tag == "testsuite":
+                    # Bỏ các testcase đã xử lý nhưng giữ attributes (có thể là root)
+                    del elem[:]
+        parser.close()
+        for _, elem in parser.read_events():
+            last = elem
+        if root_attrib is not None and last is not None:
+            root_attrib.update(last.attrib)
+    
+    @classmethod
+    def _junit_chunks(cls, xml_content: Optional[str], path: Optional[str]) -> Iterator[Any]:
+        if path:
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(cls.JUNIT_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        else:
+            content = xml_content or ""
+            for i in range(0, len(content), cls.JUNIT_CHUNK_SIZE):
+                yield content[i:i + cls.JUNIT_CHUNK_SIZE]
+    
+    @staticmethod
+    def _junit_testcase(testcase) -> Dict[str, Any]:
+        status = "pass"
+        error = None
+        stack_trace = None
+        for child in testcase:
+            if child.tag in ("failure", "error"):
+                status = "fail"
+                error = child.attrib.get("message", "")
+                stack_trace = child.text
+                break
+            if child.tag == "skipped":
+                status = "skip"
+                error = child.attrib.get("message") or None
+        return {
+            "name": testcase.attrib.get("name", ""),
+            "classname": testcase.attrib.get("classname", ""),
+            "status": status,
+            "duration": float(testcase.attrib.get("time", 0) or 0) * 1000,  # Convert to ms
+            "error": error if status == "fail" else None,
+            "stackTrace": stack_trace,
+            "skipReason": error if status == "skip" else None
+        }
+    
+    def parse_junit_xml(self, xml_content: Optional[str] = None, path: Optional[str] = None) -> Dict[str, Any]:
+        """Parse JUnit XML format (streaming; nhận content string hoặc đường dẫn file)"""
         try:
-            root = ET.fromstring(xml_content)
             tests = []
-            total = int(root.attrib.get("tests", 0))
-            failures = int(root.attrib.get("failures", 0))
-            errors = int(root.attrib.get("errors", 0))
-            skipped = int(root.attrib.get("skipped", 0))
+            counts = {"pass": 0, "fail": 0, "skip": 0}
+            root = {}
             
-            for testcase in root.findall(".//testcase"):
-                test_name = testcase.attrib.get("name", "")
-                classname = testcase.attrib.get("classname", "")
-                duration = float(testcase.attrib.get("time", 0)) * 1000  # Convert to ms
-                
-                # Check status
-                status = "pass"
-                error = None
-                stack_trace = None
-                
-                failure = testcase.find("failure")
-                error_elem = testcase.find("error")
-                
-                if failure is not None:
-                    status = "fail"
-                    error = failure.attrib.get("message", "")
-                    stack_trace = failure.text
-                elif error_elem is not None:
-                    status = "fail"
-                    error = error_elem.attrib.get("message", "")
-                    stack_trace = error_elem.text
-                elif testcase.find("skipped") is not None:
-                    status = "skip"
-                
+            for testcase in self.iter_junit_testcases(xml_content, path, root_attrib=root):
+                test_name = testcase["name"]
+                classname = testcase["classname"]
+                counts[testcase["status"]] += 1
                 tests.append({
                     "name": f"{classname}.{test_name}" if classname else test_name,
-                    "status": status,
-                    "duration": int(duration),
-                    "error": error,
-                    "stackTrace": stack_trace,
+                    "classname": classname,
+                    "status": testcase["status"],
+                    "duration": int(testcase["duration"]),
+                    "error": testcase["error"],
+                    "stackTrace": testcase["stackTrace"],
                     "category": self._detect_category(test_name, classname)
                 })
             
+            # Root <testsuites> không có attributes (pytest...) thì đếm từ testcases
+            if "tests" in root:
+                total = int(root.get("tests", 0))
+                failures = int(root.get("failures", 0))
+                errors = int(root.get("errors", 0))
+                skipped = int(root.get("skipped", 0))
+            else:
+                total = len(tests)
+                failures, errors, skipped = counts["fail"], 0, counts["skip"]
+            
             return {
                 "total": total,
                 "passed": total - failures - errors - skipped,
                 "failed": failures + errors,
                 "skipped": skipped,
-                "duration": int(float(root.attrib.get("time", 0)) * 1000),
+                "duration": int(float(root.get("time", 0) or 0) * 1000),
                 "tests": tests,
                 "metadata": {
                     "framework": "JUnit",
-                    "timestamp": root.attrib.get("timestamp", ""),
+                    "timestamp": root.get("timestamp", ""),
                     "source": "junit_xml"
                 }
             }
@@ -252,37 +316,44 @@ Output format mong muốn:
         result = None
         
         # Parse based on format
-        if file_format == "junit_xml":
-            result = self.parse_junit_xml(file_content)
-        elif file_format == "playwright_json":
-            try:
-                data = json.loads(file_content)
-                result = self.parse_json_playwright(data)
-            except:
-                result = {"error": "Failed to parse Playwright JSON"}
-        elif file_format == "jest_json":
-            try:
-                data = json.loads(file_content)
-                result = self.parse_json_jest(data)
-            except:
-                result = {"error": "Failed to parse Jest JSON"}
-        elif file_format == "generic_json":
-            # Use LLM to parse generic JSON
-            prompt = f"""Parse test results từ JSON này và extract thông tin test cases:
+        with telemetry.span("parser.test_results", format=file_format, size_bytes=len(file_content)) as span:
+            if file_format == "junit_xml":
+                result = self.parse_junit_xml(file_content)
+            elif file_format == "playwright_json":
+                try:
+                    data = json.loads(file_content)
+                    result = self.parse_json_playwright(data)
+                except:
+                    result = {"error": "Failed to parse Playwright JSON"}
+            elif file_format == "jest_json":
+                try:
+                    data = json.loads(file_content)
+                    result = self.parse_json_jest(data)
+                except:
+                    result = {"error": "Failed to parse Jest JSON"}
+            elif file_format == "generic_json":
+                # Use LLM to parse generic JSON
+                prompt = f"""Parse test results từ JSON này và extract thông tin test cases:
 
 {file_content[:2000]}  # Limit content để tránh token limit
 
 Trả về JSON với format chuẩn như đã mô tả trong system prompt."""
-            llm_result = self.call_llm(prompt)
-            try:
-                result = json.loads(llm_result)
-            except:
-                result = {"error": f"LLM parsing failed: {llm_result}"}
-        else:
-            return {
-                "success": False,
-                "error": f"Format không được hỗ trợ: {file_format}"
-            }
+                try:
+                    llm_result = self.call_llm(prompt)
+                except LLMError as e:
+                    llm_result = None
+                    result = {"error": f"LLM call failed: {str(e)}"}
+                if llm_result is not None:
+                    try:
+                        result = json.loads(llm_result)
+                    except:
+                        result = {"error": f"LLM parsing failed: {llm_result}"}
+            else:
+                return {
+                    "success": False,
+                    "error": f"Format không được hỗ trợ: {file_format}"
+                }
+            span.set_attribute("tests", len(result.get("tests", [])) if isinstance(result, dict) else 0)
         
         if "error" in result:
             return {
@@ -1,21 +1,28 @@
 """
 API Server - FastAPI server để kết nối frontend với agents
 """
-from fastapi import FastAPI, HTTPException, UploadFile, File, Header, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, Header, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from typing import Optional, List
 import os
 import sys
 import json
+import time
+import logging
+import threading
 
 # Add parent directory to path để import agents
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from orchestrator import Orchestrator
 from config import Config
-from utils.github_client import GitHubClient
 from utils.response_parser import ResponseParser
+from utils.telemetry import telemetry
+from utils.single_flight import SingleFlight, request_fingerprint, normalize_code
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="TestFlow AI API", version="1.0.0")
 
@@ -28,8 +35,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize orchestrator
-orchestrator = Orchestrator(api_key=Config.CEREBRAS_API_KEY)
+# Orchestrator (và agents, LLM client bên trong) được tạo ở lần dùng đầu tiên thay vì lúc import:
+# import module nhanh, và master process của gunicorn --preload không giữ connection nào trước khi fork
+_orchestrator: Optional[Orchestrator] = None
+_orchestrator_lock = threading.Lock()
+
+
+def get_orchestrator() -> Orchestrator:
+    global _orchestrator
+    if _orchestrator is None:
+        with _orchestrator_lock:
+            if _orchestrator is None:
+                _orchestrator = Orchestrator(api_key=Config.CEREBRAS_API_KEY)
+    return _orchestrator
+
+# Gộp các analyze request giống hệt nhau đang chạy đồng thời (ví dụ CI fan-out)
+analyze_code_flights = SingleFlight("analyze_code")
+analyze_github_flights = SingleFlight("analyze_github")
+
+# Optional: export spans tới OTLP collector
+telemetry.configure_otlp(Config.OTLP_ENDPOINT)
+
+
+@app.on_event("startup")
+async def warm_up_llm_provider():
+    """Mở sẵn connection pool tới LLM provider để request đầu tiên không phải chờ handshake"""
+    if Config.LLM_WARMUP:
+        await run_in_threadpool(lambda: get_orchestrator().warm_up())
+
+
+@app.on_event("startup")
+async def warm_up_pytest_workers():
+    """Khởi động pytest worker pool ở background (không chặn server nhận request)"""
+    if Config.PYTEST_PREWARM:
+        from utils.pytest_pool import get_pytest_pool
+        threading.Thread(target=get_pytest_pool().available, name="pytest-prewarm", daemon=True).start()
+
+
+@app.on_event("shutdown")
+async def close_llm_provider():
+    if _orchestrator is not None:
+        _orchestrator.close()
+
+
+@app.on_event("shutdown")
+async def flush_indexes():
+    """Ghi các updates của duration stats / test impact index chưa được lưu ra disk"""
+    from utils.duration_stats import get_duration_stats_registry
+    from utils.impact_index import get_test_impact_registry
+    await run_in_threadpool(get_duration_stats_registry().flush)
+    await run_in_threadpool(get_test_impact_registry().flush)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Đo latency và đếm requests cho mỗi endpoint"""
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        # Span gốc của request - các span agent/LLM/parser sẽ là con của span này
+        with telemetry.span("http.request", method=request.method, path=request.url.path):
+            response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        # Request không khớp route (404, scanners): label cố định để số series không tăng vô hạn
+        path = getattr(route, "path", None) or "unmatched"
+        telemetry.metrics.observe(
+            "testflow_http_request_duration_seconds",
+            time.perf_counter() - start,
+            help_text="Latency của HTTP requests",
+            method=request.method,
+            path=path,
+            status=status_code
+        )
 
 
 def verify_token(authorization: Optional[str] = Header(None)):
@@ -59,6 +139,21 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics (latency theo stage, LLM calls, token usage)"""
+    return PlainTextResponse(
+        telemetry.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/api/traces")
+async def recent_traces(limit: int = 100, name: Optional[str] = None):
+    """Các span gần nhất (để debug hot spots mà không cần profiler)"""
+    return {"spans": telemetry.recent_spans(limit=limit, name=name)}
+
+
 @app.post("/api/upload")
 async def upload_test_results(
     file: UploadFile = File(...),
@@ -105,7 +200,8 @@ async def upload_test_results(
         }
         
         # Process với orchestrator
-        result = orchestrator.process_test_results_upload(
+        result = await run_in_threadpool(
+            get_orchestrator().process_test_results_upload,
             file_content=file_content,
             file_name=file.filename,
             metadata=metadata
@@ -124,7 +220,9 @@ async def upload_test_results(
                 "run_id": result.get("test_run", {}).get("run_id"),
                 "total_tests": result.get("test_run", {}).get("total_tests"),
                 "passed": result.get("test_run", {}).get("passed"),
-                "failed": result.get("test_run", {}).get("failed")
+                "failed": result.get("test_run", {}).get("failed"),
+                # Tests / suites chậm đi so với duration baseline của project
+                "duration_regressions": result.get("test_run", {}).get("duration_regressions")
             }
         })
     
@@ -154,7 +252,7 @@ async def analyze_with_ai(
         if not user_request:
             raise HTTPException(status_code=400, detail="Missing 'request' field")
         
-        result = orchestrator.process_request(user_request, context)
+        result = await run_in_threadpool(get_orchestrator().process_request, user_request, context)
         
         return JSONResponse(content=result)
     
@@ -181,7 +279,7 @@ async def get_dashboard(
         test_runs = request.get("test_runs", [])
         filters = request.get("filters")
         
-        result = orchestrator.get_dashboard_data(test_runs, filters)
+        result = await run_in_threadpool(get_orchestrator().get_dashboard_data, test_runs, filters)
         
         if not result.get("success"):
             raise HTTPException(
@@ -215,7 +313,7 @@ async def analyze_errors(
         if not test_run:
             raise HTTPException(status_code=400, detail="Missing 'test_run' field")
         
-        result = orchestrator.analyze_test_errors(test_run)
+        result = await run_in_threadpool(get_orchestrator().analyze_test_errors, test_run)
         
         return JSONResponse(content=result)
     
@@ -225,63 +323,42 @@ async def analyze_errors(
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.post("/api/analyze-github")
-async def analyze_github_url(
-    request: dict
-):
-    """
-    Phân tích code từ GitHub URL
+def _fetch_and_analyze_github(github_url: str, max_files: int):
+    """Fetch code từ GitHub và phân tích với orchestrator (blocking - chạy trong threadpool)"""
+    # Fetch code từ GitHub
+    from utils.github_client import GitHubClient  # requests chỉ cần khi phân tích GitHub repo
+    github_client = GitHubClient(token=os.environ.get("GITHUB_TOKEN"))
+    github_data = github_client.fetch_from_url(github_url, max_files)
     
-    Body:
-        {
-            "github_url": "https://github.com/owner/repo",
-            "branch": "main" (optional),
-            "path": "src/" (optional),
-            "max_files": 20 (optional)
-        }
-    """
-    try:
-        github_url = request.get("github_url", "")
-        branch = request.get("branch")
-        path = request.get("path", "")
-        max_files = request.get("max_files", 20)
-        
-        if not github_url:
-            raise HTTPException(status_code=400, detail="Missing 'github_url' field")
-        
-        # Fetch code từ GitHub
-        github_client = GitHubClient(token=os.environ.get("GITHUB_TOKEN"))
-        github_data = github_client.fetch_from_url(github_url, max_files)
-        
-        if "error" in github_data:
-            raise HTTPException(status_code=400, detail=github_data["error"])
-        
-        # Combine tất cả code content
-        all_code = []
-        detected_languages = set()
-        
-        for file in github_data.get("files", []):
-            if "content" in file and "error" not in file:
-                file_name = file.get("name", "")
-                file_ext = os.path.splitext(file_name)[1]
-                
-                # Detect language từ extension
-                lang_map = {
-                    ".js": "javascript", ".ts": "typescript", ".jsx": "javascript",
-                    ".tsx": "typescript", ".py": "python", ".java": "java",
-                    ".go": "go", ".rs": "rust", ".cpp": "cpp", ".c": "c"
-                }
-                language = lang_map.get(file_ext, "unknown")
-                if language != "unknown":
-                    detected_languages.add(language)
-                
-                all_code.append(f"// File: {file.get('path', file_name)}\n{file.get('content', '')}")
-        
-        # Analyze với AI
-        code_content = "\n\n".join(all_code)
-        languages_str = ", ".join(detected_languages) if detected_languages else "unknown"
-        
-        user_request = f"""Phân tích codebase sau từ GitHub repository {github_url}:
+    if "error" in github_data:
+        raise HTTPException(status_code=400, detail=github_data["error"])
+    
+    # Combine tất cả code content
+    all_code = []
+    detected_languages = set()
+    
+    for file in github_data.get("files", []):
+        if "content" in file and "error" not in file:
+            file_name = file.get("name", "")
+            file_ext = os.path.splitext(file_name)[1]
+            
+            # Detect language từ extension
+            lang_map = {
+                ".js": "javascript", ".ts": "typescript", ".jsx": "javascript",
+                ".tsx": "typescript", ".py": "python", ".java": "java",
+                ".go": "go", ".rs": "rust", ".cpp": "cpp", ".c": "c"
+            }
+            language = lang_map.get(file_ext, "unknown")
+            if language != "unknown":
+                detected_languages.add(language)
+            
+            all_code.append(f"// File: {file.get('path', file_name)}\n{file.get('content', '')}")
+    
+    # Analyze với AI
+    code_content = "\n\n".join(all_code)
+    languages_str = ", ".join(detected_languages) if detected_languages else "unknown"
+    
+    user_request = f"""Phân tích codebase sau từ GitHub repository {github_url}:
 
 Languages detected: {languages_str}
 
@@ -314,19 +391,57 @@ QUAN TRỌNG: Trả về kết quả dưới dạng JSON với format sau:
     }}
   ]
 }}"""
-        
-        context = {
-            "source": "github",
-            "url": github_url,
-            "owner": github_data.get("owner"),
-            "repo": github_data.get("repo"),
-            "branch": github_data.get("branch"),
-            "files_analyzed": len(github_data.get("files", [])),
-            "detected_languages": list(detected_languages),
-            "code": code_content[:15000]  # Lưu code thực sự vào context
+    
+    context = {
+        "source": "github",
+        "url": github_url,
+        "owner": github_data.get("owner"),
+        "repo": github_data.get("repo"),
+        "branch": github_data.get("branch"),
+        "files_analyzed": len(github_data.get("files", [])),
+        "detected_languages": list(detected_languages),
+        "code": code_content[:15000]  # Lưu code thực sự vào context
+    }
+    
+    result = get_orchestrator().process_request(user_request, context)
+    return github_data, detected_languages, result
+
+
+def _normalize_github_url(github_url: str) -> str:
+    url = github_url.strip().lower().rstrip("/")
+    return url[:-4] if url.endswith(".git") else url
+
+
+@app.post("/api/analyze-github")
+async def analyze_github_url(
+    request: dict
+):
+    """
+    Phân tích code từ GitHub URL
+    
+    Body:
+        {
+            "github_url": "https://github.com/owner/repo",
+            "branch": "main" (optional),
+            "path": "src/" (optional),
+            "max_files": 20 (optional)
         }
+    """
+    try:
+        github_url = request.get("github_url", "")
+        branch = request.get("branch")
+        path = request.get("path", "")
+        max_files = request.get("max_files", 20)
         
-        result = orchestrator.process_request(user_request, context)
+        if not github_url:
+            raise HTTPException(status_code=400, detail="Missing 'github_url' field")
+        
+        # Cùng repo (URL đã chuẩn hóa) và max_files -> dùng chung một lần fetch + phân tích
+        flight_key = request_fingerprint(url=_normalize_github_url(github_url), max_files=max_files)
+        github_data, detected_languages, result = await analyze_github_flights.do(
+            flight_key,
+            lambda: run_in_threadpool(_fetch_and_analyze_github, github_url, max_files)
+        )
         
         # Parse AI response để extract structured data
         ai_response_text = ""
@@ -382,7 +497,8 @@ async def analyze_code_snippet(
         {
             "code": "code snippet here",
             "language": "javascript" (optional),
-            "context": {...} (optional)
+            "context": {...} (optional),
+            "coverage_run_id": "#1234" (optional) - ưu tiên test cases cho functions mà run này chưa cover
         }
     """
     try:
@@ -393,6 +509,17 @@ async def analyze_code_snippet(
         if not code:
             raise HTTPException(status_code=400, detail="Missing 'code' field")
         
+        if request.get("coverage_run_id"):
+            # Khởi tạo orchestrator / đọc ExecutionHistory từ disk - không chạy trên event loop
+            coverage_result = await run_in_threadpool(
+                lambda: get_orchestrator().get_run_coverage(request["coverage_run_id"])
+            )
+            if coverage_result.get("success"):
+                context_data = {
+                    **context_data,
+                    "uncovered_functions": coverage_result["coverage"].get("uncovered_functions", [])
+                }
+        
         # Analyze với AI - yêu cầu format JSON chuẩn
         user_request = f"""Phân tích đoạn code sau và đề xuất test cases:
 
@@ -436,7 +563,16 @@ QUAN TRỌNG: Trả về kết quả dưới dạng JSON với format sau:
             **context_data
         }
         
-        result = orchestrator.process_request(user_request, context)
+        # Request cùng code (sau khi chuẩn hóa), language và context dùng chung một lần phân tích
+        flight_key = request_fingerprint(
+            code=normalize_code(code),
+            language=language,
+            context=context_data
+        )
+        result = await analyze_code_flights.do(
+            flight_key,
+            lambda: run_in_threadpool(get_orchestrator().process_request, user_request, context)
+        )
         
         # Parse AI response để extract structured data
         ai_response_text = ""
@@ -609,7 +745,7 @@ QUAN TRỌNG: Trả về kết quả dưới dạng JSON với format sau:
             "code": combined_code[:15000]  # Lưu code thực sự vào context
         }
         
-        result = orchestrator.process_request(user_request, context)
+        result = await run_in_threadpool(get_orchestrator().process_request, user_request, context)
         
         # Parse AI response để extract structured data
         ai_response_text = ""
@@ -618,24 +754,24 @@ QUAN TRỌNG: Trả về kết quả dưới dạng JSON với format sau:
         # Ưu tiên 1: Từ ai_response_text trong result
         if result.get("ai_response_text"):
             ai_response_text = result.get("ai_response_text")
-            print(f"[DEBUG analyze-files] Using ai_response_text: {ai_response_text[:200]}")
+            logger.debug(f"Using ai_response_text: {ai_response_text[:200]}")
         # Ưu tiên 2: Từ final_output
         elif result.get("final_output"):
             final_output = result.get("final_output")
-            print(f"[DEBUG analyze-files] final_output type: {type(final_output)}")
+            logger.debug(f"final_output type: {type(final_output)}")
             if isinstance(final_output, dict):
                 # Nếu final_output có result với testCases
                 if "result" in final_output and isinstance(final_output.get("result"), dict):
                     result_data = final_output.get("result")
-                    print(f"[DEBUG analyze-files] final_output.result keys: {result_data.keys()}")
+                    logger.debug(f"final_output.result keys: {result_data.keys()}")
                     if "testCases" in result_data:
                         parsed_response = result_data
-                        print(f"[DEBUG analyze-files] Found testCases in result: {len(result_data.get('testCases', []))}")
+                        logger.debug(f"Found testCases in result: {len(result_data.get('testCases', []))}")
                     else:
                         ai_response_text = json.dumps(result_data)
                 elif "testCases" in final_output:
                     parsed_response = final_output
-                    print(f"[DEBUG analyze-files] Found testCases directly: {len(final_output.get('testCases', []))}")
+                    logger.debug(f"Found testCases directly: {len(final_output.get('testCases', []))}")
                 elif "content" in final_output:
                     ai_response_text = final_output.get("content", "")
                 else:
@@ -647,19 +783,19 @@ QUAN TRỌNG: Trả về kết quả dưới dạng JSON với format sau:
             for workflow_result in result.get("workflow_results", []):
                 if workflow_result.get("step") == "ai_analysis_agent":
                     agent_result = workflow_result.get("result", {})
-                    print(f"[DEBUG analyze-files] agent_result keys: {agent_result.keys()}")
+                    logger.debug(f"agent_result keys: {agent_result.keys()}")
                     
                     # Check result.testCases first
                     if agent_result.get("result") and isinstance(agent_result.get("result"), dict):
                         result_data = agent_result.get("result")
                         if "testCases" in result_data:
                             parsed_response = result_data
-                            print(f"[DEBUG analyze-files] Found testCases in agent_result.result: {len(result_data.get('testCases', []))}")
+                            logger.debug(f"Found testCases in agent_result.result: {len(result_data.get('testCases', []))}")
                             break
                     
                     if agent_result.get("testCases"):
                         parsed_response = agent_result
-                        print(f"[DEBUG analyze-files] Found testCases directly in agent_result: {len(agent_result.get('testCases', []))}")
+                        logger.debug(f"Found testCases directly in agent_result: {len(agent_result.get('testCases', []))}")
                         break
                     
                     if agent_result.get("result"):
@@ -674,19 +810,19 @@ QUAN TRỌNG: Trả về kết quả dưới dạng JSON với format sau:
                 parsed_direct = json.loads(ai_response_text)
                 if isinstance(parsed_direct, dict) and ("testCases" in parsed_direct or "summary" in parsed_direct):
                     parsed_response = parsed_direct
-                    print(f"[DEBUG analyze-files] Parsed from ai_response_text: testCases={len(parsed_response.get('testCases', []))}")
+                    logger.debug(f"Parsed from ai_response_text: testCases={len(parsed_response.get('testCases', []))}")
                 else:
                     parsed_response = ResponseParser.parse_ai_response(ai_response_text)
-                    print(f"[DEBUG analyze-files] Parsed with ResponseParser: testCases={len(parsed_response.get('testCases', []))}")
+                    logger.debug(f"Parsed with ResponseParser: testCases={len(parsed_response.get('testCases', []))}")
             except Exception as e:
-                print(f"[DEBUG analyze-files] Error parsing ai_response_text: {e}")
+                logger.debug(f"Error parsing ai_response_text: {e}")
                 parsed_response = ResponseParser.parse_ai_response(ai_response_text)
-                print(f"[DEBUG analyze-files] Parsed with ResponseParser (fallback): testCases={len(parsed_response.get('testCases', []))}")
+                logger.debug(f"Parsed with ResponseParser (fallback): testCases={len(parsed_response.get('testCases', []))}")
         
         # Ensure parsed_response has testCases array
         if "testCases" not in parsed_response:
             parsed_response["testCases"] = []
-        print(f"[DEBUG analyze-files] Final parsed_response.testCases count: {len(parsed_response.get('testCases', []))}")
+        logger.debug(f"Final parsed_response.testCases count: {len(parsed_response.get('testCases', []))}")
         
         return JSONResponse(content={
             "success": True,
@@ -702,6 +838,140 @@ QUAN TRỌNG: Trả về kết quả dưới dạng JSON với format sau:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 
+@app.post("/api/compare-runs")
+async def compare_runs(
+    request: dict
+):
+    """
+    So sánh một run với một run khác hoặc với baseline gộp từ nhiều runs
+    
+    Body:
+        {
+            "run": {...} | "#1234",                     # test run hoặc run_id của execution
+            "baseline": {...} | "#1200",                # một run, hoặc:
+            "baseline_runs": [{...}, "#1100", ...],     # nhiều runs, hoặc:
+            "test_runs": [...],                         # chọn baseline từ lịch sử runs
+            "baseline_filter": {"branch": "main", "green_only": true, "limit": 10},
+            "thresholds": {"min_ratio": 0.5, "min_delta_ms": 50, "z_score": 3, "limit": 100} (optional)
+        }
+    """
+    if not request.get("run"):
+        raise HTTPException(status_code=400, detail="Missing 'run' field")
+    
+    result = await run_in_threadpool(
+        get_orchestrator().compare_test_runs,
+        request["run"],
+        baseline=request.get("baseline"),
+        baseline_runs=request.get("baseline_runs"),
+        test_runs=request.get("test_runs"),
+        baseline_filter=request.get("baseline_filter"),
+        thresholds=request.get("thresholds")
+    )
+    if not result.get("success"):
+        raise HTTPException(status_code=404 if result.get("not_found") else 400, detail=result.get("error"))
+    return JSONResponse(content=result["comparison"])
+
+
+@app.get("/api/duration-stats")
+async def duration_stats(project: str = "default", test: Optional[str] = None, limit: int = 20):
+    """
+    Duration baseline (streaming, cập nhật mỗi lần /api/upload) của project: một test
+    (test=pkg.Class.test_x) hoặc các tests có p95 lớn nhất
+    """
+    result = await run_in_threadpool(get_orchestrator().get_duration_stats, project, test, limit)
+    if not result.get("success"):
+        raise HTTPException(status_code=404, detail=result.get("error"))
+    return JSONResponse(content=result)
+
+
+@app.get("/api/coverage")
+async def run_coverage(run_id: str, lines: bool = False):
+    """
+    Coverage của một execution (/api/execute-tests): summary, uncovered functions và theo từng file
+    bitmap statements / dòng đã chạy / dòng mỗi test chạy (base64, bit i = dòng i); lines=true để
+    nhận danh sách số dòng thay cho bitmap
+    """
+    result = await run_in_threadpool(get_orchestrator().get_run_coverage, run_id, lines)
+    if not result.get("success"):
+        raise HTTPException(status_code=404, detail=result.get("error"))
+    return JSONResponse(content=result)
+
+
+@app.post("/api/test-impact/index")
+async def build_test_impact_index(
+    request: dict,
+    _: bool = Depends(verify_token)
+):
+    """
+    Build/cập nhật test impact index của project (gọi từ CI ở commit gốc)
+    
+    Body:
+        {
+            "project": "default",
+            "commit": "abc123", "branch": "main",
+            "sources": {"app/calc.py": "<source>"},
+            "tests": {"tests/test_calc.py": "<test code>"},
+            "test_cases": [{"name": "...", "function": "add"}],   # optional (từ analyze_code)
+            "coverage": {...}   # optional: coverage.py JSON với --show-contexts
+        }
+    """
+    try:
+        if not any(request.get(key) for key in ("sources", "tests", "test_cases", "coverage")):
+            raise HTTPException(status_code=400, detail="Provide 'sources', 'tests', 'test_cases' or 'coverage'")
+        result = await run_in_threadpool(
+            get_orchestrator().build_test_impact_index,
+            project=request.get("project") or "default",
+            sources=request.get("sources"),
+            tests=request.get("tests"),
+            test_cases=request.get("test_cases"),
+            coverage=request.get("coverage"),
+            commit=request.get("commit"),
+            branch=request.get("branch")
+        )
+        return JSONResponse(content=result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@app.post("/api/test-impact")
+async def test_impact(
+    request: dict,
+    _: bool = Depends(verify_token)
+):
+    """
+    Tests bị ảnh hưởng bởi một diff (hoặc danh sách files thay đổi), theo thứ tự ưu tiên
+    
+    Body:
+        {
+            "project": "default",
+            "diff": "<git diff base..head>",      # hoặc
+            "changed_files": ["app/calc.py"],
+            "limit": 50                            # optional
+        }
+    
+    run_all = true khi diff chạm source files mà index chưa biết - khi đó nên chạy cả suite.
+    """
+    try:
+        if not request.get("diff") and not request.get("changed_files"):
+            raise HTTPException(status_code=400, detail="Missing 'diff' or 'changed_files' field")
+        result = await run_in_threadpool(
+            get_orchestrator().get_test_impact,
+            project=request.get("project") or "default",
+            diff=request.get("diff"),
+            changed_files=request.get("changed_files"),
+            limit=request.get("limit")
+        )
+        if not result.get("success"):
+            raise HTTPException(status_code=404, detail=result.get("error"))
+        return JSONResponse(content=result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+
 @app.post("/api/execute-tests")
 async def execute_tests(
     request: dict
@@ -725,6 +995,14 @@ async def execute_tests(
             "language": "java",
             "framework": "JUnit (optional)"
         }
+    
+    Incremental re-run (không generate lại, chỉ chạy lại một phần tests của run trước):
+        {
+            "parent_run_id": "#1234",
+            "original_code": "source code đã sửa (optional)",
+            "select": "failed | changed | failed_or_changed (default)",
+            "tests": ["test_add", "test_generated.py::TestCalc::test_mul"]  # optional, chọn cụ thể
+        }
     """
     try:
         test_cases = request.get("test_cases", [])
@@ -732,50 +1010,39 @@ async def execute_tests(
         language = request.get("language", "unknown")
         framework = request.get("framework", None)
         risks = request.get("risks", [])  # Get risks from analysis
+        parent_run_id = request.get("parent_run_id")
         
-        if not test_cases:
+        if parent_run_id:
+            result = await run_in_threadpool(
+                get_orchestrator().rerun_tests,
+                parent_run_id,
+                original_code=request.get("original_code"),
+                select=request.get("select", "failed_or_changed"),
+                tests=request.get("tests")
+            )
+            if not result.get("success") and "Unknown run_id" in result.get("error", ""):
+                raise HTTPException(status_code=404, detail=result["error"])
+            if not result.get("success") and "Unknown select" in result.get("error", ""):
+                raise HTTPException(status_code=400, detail=result["error"])
+        elif not test_cases:
             raise HTTPException(status_code=400, detail="Missing 'test_cases' field")
-        
-        # Step 1: Generate test code với AI Analysis Agent
-        ai_agent = orchestrator.agents["ai_analysis_agent"]
-        generate_result = ai_agent.process({
-            "action": "generate_test_code",
-            "test_cases": test_cases,
-            "original_code": original_code,
-            "language": language,
-            "framework": framework
-        })
-        
-        if not generate_result.get("success"):
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to generate test code: {generate_result.get('error', 'Unknown error')}"
+        else:
+            result = await run_in_threadpool(
+                get_orchestrator().generate_and_execute_tests,
+                test_cases,
+                original_code=original_code,
+                language=language,
+                framework=framework,
+                risks=risks
             )
         
-        generated_code_data = generate_result.get("generated_code", {})
-        test_code = generated_code_data.get("testCode", "")
-        detected_framework = generate_result.get("framework", framework or "custom")
-        
-        if not test_code:
-            raise HTTPException(status_code=500, detail="Generated test code is empty")
-        
-        # Step 2: Execute test code với Execution Agent - truyền risks và original_code vào
-        execution_agent = orchestrator.agents["execution_agent"]
-        execute_result = execution_agent.process({
-            "action": "execute_test_code",
-            "test_code": test_code,
-            "original_code": original_code,  # Truyền original_code để có thể combine khi execute
-            "framework": detected_framework,
-            "language": language,
-            "test_cases": test_cases,
-            "risks": risks  # Truyền risks vào execution agent
-        })
+        if not result.get("success"):
+            raise HTTPException(status_code=500, detail=result.get("error", "Unknown error"))
         
-        if not execute_result.get("success"):
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to execute tests: {execute_result.get('error', 'Unknown error')}"
-            )
+        test_code = result["test_code"]
+        detected_framework = result["framework"]
+        generated_code_data = result.get("generated_code", {})
+        execute_result = result.get("execution", {})
         
         # Combine results
         return JSONResponse(content={
@@ -784,7 +1051,8 @@ async def execute_tests(
                 "code": test_code,
                 "framework": detected_framework,
                 "file_extension": generated_code_data.get("fileExtension", ""),
-                "dependencies": generated_code_data.get("dependencies", [])
+                "dependencies": generated_code_data.get("dependencies", []),
+                "cache": result.get("generation_cache")
             },
             "execution": {
                 "run_id": execute_result.get("run_id"),
@@ -793,12 +1061,20 @@ async def execute_tests(
                 "failed": execute_result.get("failed"),
                 "durationMs": execute_result.get("durationMs"),
                 "results": execute_result.get("results", []),
-                "executed_at": execute_result.get("executed_at")
+                "executed_at": execute_result.get("executed_at"),
+                "parent_run_id": execute_result.get("parent_run_id"),
+                "rerun": execute_result.get("rerun"),
+                # Bitmaps theo từng test: GET /api/coverage?run_id=...
+                "coverage": {
+                    "summary": execute_result["coverage"].get("summary"),
+                    "uncovered_functions": execute_result["coverage"].get("uncovered_functions", []),
+                    "partial": execute_result["coverage"].get("partial", False)
+                } if execute_result.get("coverage") else None
             },
             "summary": {
-                "language": language,
+                "language": execute_result.get("language", language),
                 "framework": detected_framework,
-                "test_cases_count": len(test_cases)
+                "test_cases_count": len(test_cases) if not parent_run_id else execute_result.get("total")
             }
         })
     
@@ -814,6 +1090,6 @@ if __name__ == "__main__":
         "api_server:app",
         host=Config.API_HOST,
         port=Config.API_PORT,
-        reload=True
+        reload=Config.API_RELOAD
     )
 
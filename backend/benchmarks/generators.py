@@ -0,0 +1,224 @@
+"""
+Synthetic data generators cho benchmarks - JUnit XML, Playwright/Jest JSON, run history
+"""
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Any, List
+from xml.sax.saxutils import escape, quoteattr
+
+ERROR_TEMPLATES = [
+    ("AssertionError", "Expected {a} but got {b}"),
+    ("TimeoutError", "Timeout of {a}ms exceeded while waiting for selector #btn-{b}"),
+    ("TypeError", "Cannot read properties of undefined (reading 'item{a}')"),
+    ("NullPointerException", "Null reference in Service{a}.handle line {b}"),
+    ("ConnectionError", "Connection refused: localhost:{a}"),
+]
+
+
+def _error(rng: random.Random) -> Dict[str, str]:
+    error_type, template = rng.choice(ERROR_TEMPLATES)
+    message = template.format(a=rng.randint(1, 5000), b=rng.randint(1, 5000))
+    stack = "\n".join(
+        f"    at com.example.Module{rng.randint(1, 50)}.method{rng.randint(1, 20)}(Module.java:{rng.randint(1, 400)})"
+        for _ in range(rng.randint(3, 8))
+    )
+    return {"type": error_type, "message": message, "stack": stack}
+
+
+def _status(rng: random.Random, failure_ratio: float, skip_ratio: float) -> str:
+    roll = rng.random()
+    if roll < failure_ratio:
+        return "fail"
+    if roll < failure_ratio + skip_ratio:
+        return "skip"
+    return "pass"
+
+
+def generate_junit_xml(
+    num_tests: int,
+    failure_ratio: float = 0.1,
+    skip_ratio: float = 0.02,
+    seed: int = 42
+) -> str:
+    """Tạo JUnit XML với num_tests testcases"""
+    rng = random.Random(seed)
+    cases = []
+    failures = skipped = 0
+    total_time = 0.0
+
+    for i in range(num_tests):
+        status = _status(rng, failure_ratio, skip_ratio)
+        duration = round(rng.uniform(0.001, 2.0), 3)
+        total_time += duration
+        classname = f"com.example.suite{i % 50}.Test{i % 7}"
+        name = f"test_case_{i}"
+        if status == "fail":
+            failures += 1
+            error = _error(rng)
+            body = (
+                f"<failure message={quoteattr(error['message'])} type={quoteattr(error['type'])}>"
+                f"{escape(error['stack'])}</failure>"
+            )
+        elif status == "skip":
+            skipped += 1
+            body = "<skipped/>"
+        else:
+            body = ""
+        cases.append(f'  <testcase name="{name}" classname="{classname}" time="{duration}">{body}</testcase>')
+
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<testsuite name="benchmark" tests="{num_tests}" failures="{failures}" errors="0" '
+        f'skipped="{skipped}" time="{round(total_time, 3)}">\n'
+        + "\n".join(cases)
+        + "\n</testsuite>\n"
+    )
+
+
+def generate_playwright_json(
+    num_tests: int,
+    failure_ratio: float = 0.1,
+    skip_ratio: float = 0.02,
+    seed: int = 42
+) -> str:
+    """Tạo Playwright JSON report"""
+    rng = random.Random(seed)
+    status_map = {"pass": "passed", "fail": "failed", "skip": "skipped"}
+    counts = {"pass": 0, "fail": 0, "skip": 0}
+    suites = []
+    specs = []
+
+    for i in range(num_tests):
+        status = _status(rng, failure_ratio, skip_ratio)
+        counts[status] += 1
+        result = {"status": status_map[status], "duration": rng.randint(10, 5000)}
+        if status == "fail":
+            result["error"] = {"message": _error(rng)["message"]}
+        specs.append({"title": f"spec {i}", "tests": [{"title": f"should work {i}", "results": [result]}]})
+        if len(specs) == 100:
+            suites.append({"title": f"suite {len(suites)}", "specs": specs})
+            specs = []
+    if specs:
+        suites.append({"title": f"suite {len(suites)}", "specs": specs})
+
+    return json.dumps({
+        "suites": suites,
+        "stats": {
+            "total": num_tests,
+            "expected": counts["pass"],
+            "unexpected": counts["fail"],
+            "skipped": counts["skip"],
+            "duration": rng.randint(1000, 100000)
+        }
+    })
+
+
+def generate_jest_json(
+    num_tests: int,
+    failure_ratio: float = 0.1,
+    skip_ratio: float = 0.02,
+    seed: int = 42
+) -> str:
+    """Tạo Jest --json report"""
+    rng = random.Random(seed)
+    status_map = {"pass": "passed", "fail": "failed", "skip": "pending"}
+    counts = {"pass": 0, "fail": 0, "skip": 0}
+    files = []
+    assertions = []
+
+    for i in range(num_tests):
+        status = _status(rng, failure_ratio, skip_ratio)
+        counts[status] += 1
+        assertions.append({
+            "fullName": f"Module{i % 40} handles case {i}",
+            "status": status_map[status],
+            "duration": rng.randint(1, 800),
+            "failureMessages": [_error(rng)["message"]] if status == "fail" else []
+        })
+        if len(assertions) == 50:
+            files.append({"name": f"/src/module{len(files)}.test.js", "assertionResults": assertions})
+            assertions = []
+    if assertions:
+        files.append({"name": f"/src/module{len(files)}.test.js", "assertionResults": assertions})
+
+    return json.dumps({
+        "numTotalTests": num_tests,
+        "numPassedTests": counts["pass"],
+        "numFailedTests": counts["fail"],
+        "numPendingTests": counts["skip"],
+        "startTime": 0,
+        "testResults": files
+    })
+
+
+def generate_run_history(
+    num_runs: int,
+    tests_per_run: int = 200,
+    failure_ratio: float = 0.1,
+    seed: int = 42
+) -> List[Dict[str, Any]]:
+    """Tạo lịch sử test runs (mới nhất trước) theo format của ExecutionAgent.create_test_run"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    branches = ["main", "develop", "feature/login", "feature/payments"]
+    authors = ["alice", "bob", "carol", "dave"]
+    runs = []
+
+    for r in range(num_runs):
+        tests = []
+        for i in range(tests_per_run):
+            status = _status(rng, failure_ratio, 0.01)
+            tests.append({
+                "name": f"suite{i % 20}.test_case_{i}",
+                "status": status,
+                "duration": rng.randint(1, 2000),
+                "error": _error(rng)["message"] if status == "fail" else None,
+                "category": rng.choice(["unit", "integration", "e2e"])
+            })
+        passed = sum(1 for t in tests if t["status"] == "pass")
+        failed = sum(1 for t in tests if t["status"] == "fail")
+        runs.append({
+            "run_id": f"#{10000 + r}",
+            "timestamp": (now - timedelta(hours=r * 3)).isoformat(),
+            "status": "completed",
+            "total_tests": tests_per_run,
+            "passed": passed,
+            "failed": failed,
+            "skipped": tests_per_run - passed - failed,
+            "duration_ms": sum(t["duration"] for t in tests),
+            "metadata": {"branch": rng.choice(branches), "author": rng.choice(authors), "commit": f"{rng.getrandbits(40):010x}"},
+            "test_results": tests,
+            "summary": {"pass_rate": round(passed / tests_per_run * 100, 2)}
+        })
+
+    return runs
+
+
+def generate_ai_response(num_test_cases: int = 10, wrap_markdown: bool = True, seed: int = 42) -> str:
+    """Tạo AI response chứa JSON test cases (có thể bọc trong markdown như LLM thật)"""
+    rng = random.Random(seed)
+    payload = {
+        "summary": {
+            "overview": "Service xử lý bookmark phòng cho user.",
+            "risks": [f"Hàm method{i} không kiểm tra null input" for i in range(5)]
+        },
+        "testCases": [
+            {
+                "id": i + 1,
+                "title": f"method{i % 8}_WhenCondition{i}_ReturnsExpected",
+                "name": f"method{i % 8}_WhenCondition{i}_ReturnsExpected",
+                "function": f"method{i % 8}",
+                "type": rng.choice(["unit", "integration", "negative", "edge"]),
+                "complexity": rng.choice(["S", "M", "L"]),
+                "description": "Kiểm tra hành vi với input hợp lệ",
+                "steps": ["Chuẩn bị dữ liệu", "Gọi hàm", "Kiểm tra kết quả"],
+                "expectedResult": "Trả về kết quả đúng"
+            }
+            for i in range(num_test_cases)
+        ]
+    }
+    body = json.dumps(payload, ensure_ascii=False, indent=2)
+    if wrap_markdown:
+        return f"Dưới đây là phân tích:\n\n```json\n{body}\n```\n\nHy vọng hữu ích."
+    return body
@@ -0,0 +1,318 @@
+"""
+Benchmark runner - đo throughput, latency percentiles và peak memory, so sánh với baseline
+
+Usage:
+    python -m benchmarks.run_benchmarks                      # chạy tất cả (scale quick)
+    python -m benchmarks.run_benchmarks --scale full
+    python -m benchmarks.run_benchmarks --only parser
+    python -m benchmarks.run_benchmarks --save-baseline      # ghi lại baseline
+    python -m benchmarks.run_benchmarks --tolerance 0.25     # fail nếu p50 chậm hơn 25%
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Dict, Any, List, Callable, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.generators import (  # noqa: E402
+    generate_junit_xml,
+    generate_playwright_json,
+    generate_jest_json,
+    generate_run_history,
+    generate_ai_response
+)
+from llm import FakeProvider  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+SCALES = {
+    "quick": {"tests": 2000, "runs": 30, "tests_per_run": 200, "compare_tests": 20000, "test_cases": 50, "iterations": 20},
+    "full": {"tests": 20000, "runs": 200, "tests_per_run": 500, "compare_tests": 200000, "test_cases": 200, "iterations": 50},
+}
+
+def attach_fake_provider(agent_or_orchestrator, latency: str = None):
+    """Gắn FakeProvider (deterministic, không gọi API) vào một agent hoặc toàn bộ Orchestrator"""
+    provider = FakeProvider(latency=latency, seed=0)
+    agents = [agent_or_orchestrator]
+    if hasattr(agent_or_orchestrator, "agents"):
+        agent_or_orchestrator.provider = provider
+        agents = [agent_or_orchestrator.leader, *agent_or_orchestrator.agents.values()]
+    for agent in agents:
+        agent.provider = provider
+    return provider
+
+
+# name -> setup(scale) -> callable không tham số
+BENCHMARKS: Dict[str, Callable[[Dict[str, Any]], Callable[[], Any]]] = {}
+
+
+def benchmark(name: str):
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+@benchmark("parser.junit_xml")
+def _bench_junit(scale):
+    from agents import TestingAgent
+    agent = TestingAgent(api_key=None)
+    content = generate_junit_xml(scale["tests"], failure_ratio=0.1)
+    return lambda: agent.process({"file_content": content, "file_name": "results.xml"})
+
+
+@benchmark("parser.playwright_json")
+def _bench_playwright(scale):
+    from agents import TestingAgent
+    agent = TestingAgent(api_key=None)
+    content = generate_playwright_json(scale["tests"], failure_ratio=0.1)
+    return lambda: agent.process({"file_content": content, "file_name": "results.json"})
+
+
+@benchmark("parser.jest_json")
+def _bench_jest(scale):
+    from agents import TestingAgent
+    agent = TestingAgent(api_key=None)
+    content = generate_jest_json(scale["tests"], failure_ratio=0.1)
+    return lambda: agent.process({"file_content": content, "file_name": "results.json"})
+
+
+@benchmark("reporting.dashboard")
+def _bench_dashboard(scale):
+    from agents import ReportingAgent
+    agent = ReportingAgent(api_key=None)
+    attach_fake_provider(agent)
+    runs = generate_run_history(scale["runs"], scale["tests_per_run"])
+    return lambda: agent.process({"report_type": "dashboard", "test_runs": runs})
+
+
+@benchmark("reporting.history_filters")
+def _bench_history(scale):
+    from agents import ReportingAgent
+    agent = ReportingAgent(api_key=None)
+    runs = generate_run_history(scale["runs"], scale["tests_per_run"])
+    filters = {"branch": "main", "author": "alice"}
+    return lambda: agent.process({"report_type": "history", "test_runs": runs, "filters": filters})
+
+
+@benchmark("reporting.test_details")
+def _bench_test_details(scale):
+    from agents import ReportingAgent
+    agent = ReportingAgent(api_key=None)
+    run = generate_run_history(1, scale["tests"])[0]
+    filters = {"status": ["pass", "fail"], "search": "suite1", "min_duration": 10}
+    return lambda: agent.process({"report_type": "test_details", "test_run": run, "filters": filters})
+
+
+@benchmark("execution.compare_runs")
+def _bench_compare(scale):
+    from agents import ExecutionAgent
+    agent = ExecutionAgent(api_key=None)
+    run1, run2 = generate_run_history(2, scale["compare_tests"])
+    return lambda: agent.compare_runs(run1, run2)
+
+
+@benchmark("run_comparison.cold")
+def _bench_compare_cold(scale):
+    # Runs chưa có trong cache: gồm cả build columns (compare_runs ở trên dùng lại columns đã cache)
+    from agents import ExecutionAgent
+    from utils.run_comparison import RunComparator
+    agent = ExecutionAgent(api_key=None)
+    run1, run2 = generate_run_history(2, scale["compare_tests"])
+
+    def cold_compare():
+        agent.comparator = RunComparator()
+        return agent.compare_runs(run1, run2)
+    return cold_compare
+
+
+@benchmark("run_comparison.baseline_window")
+def _bench_baseline_window(scale):
+    from agents import ExecutionAgent
+    agent = ExecutionAgent(api_key=None)
+    runs = generate_run_history(11, scale["compare_tests"] // 10)
+    agent.compare_to_baseline(runs[0], runs[1:])
+    return lambda: agent.compare_to_baseline(runs[0], runs[1:])
+
+
+@benchmark("response_parser.parse_ai_response")
+def _bench_response_parser(scale):
+    from utils.response_parser import ResponseParser
+    response = generate_ai_response(scale["test_cases"], wrap_markdown=True)
+    return lambda: ResponseParser.parse_ai_response(response)
+
+
+@benchmark("orchestrator.process_request")
+def _bench_orchestrator_request(scale):
+    from orchestrator import Orchestrator
+    orchestrator = Orchestrator(api_key=None)
+    attach_fake_provider(orchestrator)
+    code = "def add(a, b):\n    return a + b\n" * 20
+    context = {"source": "code_snippet", "code": code, "detected_languages": ["python"]}
+    return lambda: orchestrator.process_request("Phân tích đoạn code sau và đề xuất test cases", context)
+
+
+@benchmark("orchestrator.upload")
+def _bench_orchestrator_upload(scale):
+    from orchestrator import Orchestrator
+    orchestrator = Orchestrator(api_key=None)
+    attach_fake_provider(orchestrator)
+    content = generate_junit_xml(scale["tests_per_run"], failure_ratio=0.05)
+    metadata = {"branch": "main", "commit": "abc123", "author": "bench"}
+    return lambda: orchestrator.process_test_results_upload(content, "results.xml", metadata)
+
+
+def _startup_command(code: str) -> Callable[[], Any]:
+    """Đo cold start: mỗi iteration chạy code trong một Python process mới (FakeProvider, không warm-up)"""
+    env = dict(os.environ, LLM_PROVIDER="fake", LLM_WARMUP="false")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+
+    def run():
+        subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, check=True)
+    return run
+
+
+@benchmark("startup.orchestrator")
+def _bench_startup_orchestrator(scale):
+    return _startup_command("from orchestrator import Orchestrator; Orchestrator(api_key=None)")
+
+
+@benchmark("startup.api_server_first_request")
+def _bench_startup_api_server(scale):
+    try:
+        import fastapi  # noqa: F401
+    except ImportError:
+        return None  # fastapi chưa cài - bỏ qua
+    return _startup_command(
+        "import api_server; "
+        "api_server.get_orchestrator().process_request('Phân tích đoạn code sau', "
+        "{'source': 'code_snippet', 'code': 'def f():\\n    return 1', 'detected_languages': ['python']})"
+    )
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_one(fn: Callable[[], Any], iterations: int, warmup: int = 2) -> Dict[str, float]:
+    """Chạy một benchmark: warmup, đo latency từng iteration, rồi đo peak memory riêng"""
+    for _ in range(warmup):
+        fn()
+
+    gc.collect()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+
+    # tracemalloc làm chậm code nên đo memory ở một lần chạy riêng
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "throughput_ops_s": round(iterations / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        "peak_memory_kb": round(peak / 1024, 1)
+    }
+
+
+def compare_with_baseline(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    tolerance: float
+) -> List[Tuple[str, float]]:
+    """Trả về list (benchmark, ratio) có p50 chậm hơn baseline quá tolerance"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base or not base.get("p50_ms"):
+            continue
+        ratio = current["p50_ms"] / base["p50_ms"]
+        if ratio > 1 + tolerance:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="TestFlow AI backend benchmarks")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="quick")
+    parser.add_argument("--only", default="", help="Chỉ chạy benchmarks có tên chứa chuỗi này")
+    parser.add_argument("--iterations", type=int, default=None)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Tỷ lệ chậm hơn cho phép so với baseline p50")
+    parser.add_argument("--output", default=None, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    scale = SCALES[args.scale]
+    iterations = args.iterations or scale["iterations"]
+    results = {}
+
+    print(f"{'benchmark':40} {'ops/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'peak KB':>10}")
+    for name, setup in BENCHMARKS.items():
+        if args.only and args.only not in name:
+            continue
+        fn = setup(scale)
+        if fn is None:
+            print(f"{name:40} skipped")
+            continue
+        stats = run_one(fn, iterations)
+        results[name] = stats
+        print(f"{name:40} {stats['throughput_ops_s']:>10} {stats['p50_ms']:>10} {stats['p95_ms']:>10} {stats['p99_ms']:>10} {stats['peak_memory_kb']:>10}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"scale": args.scale, "results": results}, f, indent=2)
+
+    baseline_key = args.scale
+    if args.save_baseline:
+        baseline_data = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline_data = json.load(f)
+        baseline_data.setdefault(baseline_key, {}).update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline_data, f, indent=2, sort_keys=True)
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline found - run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f).get(baseline_key, {})
+
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print("\nPerformance regressions (p50 vs baseline):")
+        for name, ratio in regressions:
+            print(f"  {name}: {ratio:.2f}x slower")
+        return 1
+
+    print(f"\nNo regressions beyond {int(args.tolerance * 100)}% of baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
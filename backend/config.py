@@ -2,13 +2,23 @@
 Configuration for TestFlow AI backend
 """
 import os
-from typing import Optional
+from typing import Dict, Optional
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
 
+def _parse_int_map(value: str) -> Dict[str, int]:
+    """Parse "Leader=4000,AIAnalysis=16000" thành dict"""
+    result = {}
+    for item in (value or "").split(","):
+        key, _, number = item.partition("=")
+        if key.strip() and number.strip():
+            result[key.strip()] = int(number)
+    return result
+
+
 class Config:
     """Configuration class"""
     
@@ -20,9 +30,66 @@ class Config:
     # Model
     CEREBRAS_MODEL: str = "qwen-3-coder-480b"
     
+    # LLM provider: "cerebras" (mặc định) hoặc "fake" (giả lập cho load testing, không tốn tokens)
+    LLM_PROVIDER: str = os.environ.get("LLM_PROVIDER", "cerebras")
+    # Fake provider: latency distribution (ms), ví dụ "lognormal:800,0.6" hoặc "uniform:100,500"
+    FAKE_LLM_LATENCY: Optional[str] = os.environ.get("FAKE_LLM_LATENCY")
+    FAKE_LLM_ERROR_RATE: float = float(os.environ.get("FAKE_LLM_ERROR_RATE", "0"))
+    FAKE_LLM_RATE_LIMIT_RATE: float = float(os.environ.get("FAKE_LLM_RATE_LIMIT_RATE", "0"))
+    FAKE_LLM_RPM: int = int(os.environ.get("FAKE_LLM_RPM", "0"))
+    FAKE_LLM_RECORDINGS: Optional[str] = os.environ.get("FAKE_LLM_RECORDINGS")
+    FAKE_LLM_SEED: Optional[int] = int(os.environ["FAKE_LLM_SEED"]) if os.environ.get("FAKE_LLM_SEED") else None
+    # Ghi lại mọi LLM response vào file JSONL (để replay bằng fake provider)
+    LLM_RECORD_PATH: Optional[str] = os.environ.get("LLM_RECORD_PATH")
+    
+    # Shared LLM provider (dùng chung cho mọi agent): connection pool và giới hạn in-flight
+    LLM_MAX_IN_FLIGHT: int = int(os.environ.get("LLM_MAX_IN_FLIGHT", "8"))
+    LLM_POOL_MAX_CONNECTIONS: int = int(os.environ.get("LLM_POOL_MAX_CONNECTIONS", "20"))
+    LLM_POOL_MAX_KEEPALIVE: int = int(os.environ.get("LLM_POOL_MAX_KEEPALIVE", "10"))
+    LLM_POOL_KEEPALIVE_EXPIRY: float = float(os.environ.get("LLM_POOL_KEEPALIVE_EXPIRY", "60"))
+    LLM_HTTP2: bool = os.environ.get("LLM_HTTP2", "true").lower() == "true"
+    LLM_TIMEOUT: float = float(os.environ.get("LLM_TIMEOUT", "120"))
+    LLM_WARMUP: bool = os.environ.get("LLM_WARMUP", "true").lower() == "true"
+    # Rate limit phía client (0 = chỉ học limit từ x-ratelimit-* headers của provider) và retry
+    LLM_RATE_LIMIT_RPM: int = int(os.environ.get("LLM_RATE_LIMIT_RPM", "0"))
+    LLM_RATE_LIMIT_TPM: int = int(os.environ.get("LLM_RATE_LIMIT_TPM", "0"))
+    LLM_MAX_RETRIES: int = int(os.environ.get("LLM_MAX_RETRIES", "4"))
+    LLM_RETRY_BASE_DELAY: float = float(os.environ.get("LLM_RETRY_BASE_DELAY", "0.5"))
+    LLM_RETRY_MAX_DELAY: float = float(os.environ.get("LLM_RETRY_MAX_DELAY", "30"))
+    
+    # Prompt assembly: token budget cho input của mỗi LLM call (theo agent name) và compact code
+    LLM_PROMPT_TOKEN_BUDGET: int = int(os.environ.get("LLM_PROMPT_TOKEN_BUDGET", "12000"))
+    LLM_AGENT_TOKEN_BUDGETS: Dict[str, int] = _parse_int_map(os.environ.get("LLM_AGENT_TOKEN_BUDGETS", ""))
+    LLM_COMPACT_CODE: bool = os.environ.get("LLM_COMPACT_CODE", "true").lower() == "true"
+    # Field trong request body để gửi ID của prompt prefix (ví dụ "prompt_cache_key" cho
+    # OpenAI-compatible proxy có KV prefix caching); để trống nếu provider tự cache theo prefix
+    LLM_PROMPT_CACHE_PARAM: Optional[str] = os.environ.get("LLM_PROMPT_CACHE_PARAM") or None
+    # Batch failure analysis: số failures tối đa mỗi LLM call (1 = phân tích từng lỗi)
+    # và token budget cho phần failures trong một prompt
+    LLM_ERROR_BATCH_SIZE: int = int(os.environ.get("LLM_ERROR_BATCH_SIZE", "20"))
+    LLM_ERROR_BATCH_TOKENS: int = int(os.environ.get("LLM_ERROR_BATCH_TOKENS", "6000"))
+    
+    # Error classifier local (rules + TF-IDF model học từ analyses của LLM) chạy trước LLM
+    ERROR_CLASSIFIER_ENABLED: bool = os.environ.get("ERROR_CLASSIFIER_ENABLED", "true").lower() == "true"
+    ERROR_CLASSIFIER_THRESHOLD: float = float(os.environ.get("ERROR_CLASSIFIER_THRESHOLD", "0.85"))
+    ERROR_CLASSIFIER_MIN_SAMPLES: int = int(os.environ.get("ERROR_CLASSIFIER_MIN_SAMPLES", "5"))
+    # File JSONL lưu lịch sử analyses đã gán nhãn (để model giữ được giữa các lần restart)
+    ERROR_CLASSIFIER_HISTORY_PATH: Optional[str] = os.environ.get("ERROR_CLASSIFIER_HISTORY_PATH")
+    # Ngưỡng Jaccard (ước lượng bằng MinHash) để gán lỗi vào cluster đã có
+    ERROR_CLUSTER_THRESHOLD: float = float(os.environ.get("ERROR_CLUSTER_THRESHOLD", "0.5"))
+    # Failure memory: dùng lại analysis của failure đủ giống (cosine >= REUSE) hoặc đưa làm
+    # few-shot example (>= EXAMPLE); PATH là file JSONL để giữ giữa các lần restart
+    FAILURE_MEMORY_ENABLED: bool = os.environ.get("FAILURE_MEMORY_ENABLED", "true").lower() == "true"
+    FAILURE_MEMORY_REUSE_THRESHOLD: float = float(os.environ.get("FAILURE_MEMORY_REUSE_THRESHOLD", "0.92"))
+    FAILURE_MEMORY_EXAMPLE_THRESHOLD: float = float(os.environ.get("FAILURE_MEMORY_EXAMPLE_THRESHOLD", "0.7"))
+    FAILURE_MEMORY_MAX_ENTRIES: int = int(os.environ.get("FAILURE_MEMORY_MAX_ENTRIES", "20000"))
+    FAILURE_MEMORY_PATH: Optional[str] = os.environ.get("FAILURE_MEMORY_PATH")
+    
     # API Server
     API_HOST: str = os.environ.get("API_HOST", "0.0.0.0")
     API_PORT: int = int(os.environ.get("API_PORT", "8000"))
+    API_WORKERS: int = int(os.environ.get("API_WORKERS", "1"))
+    API_RELOAD: bool = os.environ.get("API_RELOAD", "false").lower() == "true"  # chỉ dùng khi dev
     
     # CORS
     CORS_ORIGINS: list = [
@@ -40,6 +107,61 @@ class Config:
     # Security
     UPLOAD_TOKEN: Optional[str] = os.environ.get("UPLOAD_TOKEN")
     
+    # Workflow execution (DAG)
+    WORKFLOW_MAX_PARALLEL: int = int(os.environ.get("WORKFLOW_MAX_PARALLEL", "4"))
+    WORKFLOW_STEP_TIMEOUT: float = float(os.environ.get("WORKFLOW_STEP_TIMEOUT", "120"))
+    
+    # Leader routing: template/cached plans cho các request đã biết
+    FAST_PATH_ROUTING: bool = os.environ.get("FAST_PATH_ROUTING", "true").lower() == "true"
+    PLAN_CACHE_SIZE: int = int(os.environ.get("PLAN_CACHE_SIZE", "128"))
+    
+    # Cache generated test code theo hash của inputs (code, test cases, language, framework, model, prompt)
+    TEST_ARTIFACT_CACHE_ENABLED: bool = os.environ.get("TEST_ARTIFACT_CACHE_ENABLED", "true").lower() == "true"
+    TEST_ARTIFACT_CACHE_SIZE: int = int(os.environ.get("TEST_ARTIFACT_CACHE_SIZE", "512"))
+    TEST_ARTIFACT_CACHE_DIR: Optional[str] = os.environ.get("TEST_ARTIFACT_CACHE_DIR")  # None = chỉ memory
+    TEST_ARTIFACT_CACHE_MAX_DISK_ENTRIES: int = int(os.environ.get("TEST_ARTIFACT_CACHE_MAX_DISK_ENTRIES", "10000"))
+    
+    # Execution history (theo run_id) cho incremental re-run: chỉ chạy lại tests fail/bị ảnh hưởng
+    EXECUTION_HISTORY_SIZE: int = int(os.environ.get("EXECUTION_HISTORY_SIZE", "200"))
+    EXECUTION_HISTORY_DIR: Optional[str] = os.environ.get("EXECUTION_HISTORY_DIR")  # None = chỉ memory
+    
+    # Coverage (line + branch, theo từng test) khi chạy generated pytest thật; cần coverage.py trong môi trường
+    COVERAGE_ENABLED: bool = os.environ.get("COVERAGE_ENABLED", "true").lower() == "true"
+    COVERAGE_BRANCH: bool = os.environ.get("COVERAGE_BRANCH", "true").lower() == "true"
+    # Overhead trung bình tối đa (0.3 = chậm hơn 30%); vượt thì chỉ thu thập coverage ở một phần runs
+    COVERAGE_OVERHEAD_BUDGET: float = float(os.environ.get("COVERAGE_OVERHEAD_BUDGET", "0.3"))
+    
+    # Duration statistics theo từng test (streaming, cập nhật mỗi lần upload) để phát hiện tests/suites chậm đi
+    DURATION_STATS_DIR: Optional[str] = os.environ.get("DURATION_STATS_DIR")
+    DURATION_STATS_WINDOW: int = int(os.environ.get("DURATION_STATS_WINDOW", "100"))
+    DURATION_REGRESSION_SIGMA: float = float(os.environ.get("DURATION_REGRESSION_SIGMA", "3.0"))
+    DURATION_REGRESSION_MIN_MS: float = float(os.environ.get("DURATION_REGRESSION_MIN_MS", "50"))
+    
+    # Test impact index (symbol -> tests) theo project; None = chỉ giữ trong memory
+    TEST_IMPACT_DIR: Optional[str] = os.environ.get("TEST_IMPACT_DIR")
+    # Duration stats / test impact cập nhật sau mỗi upload chỉ được ghi ra disk sau N uploads hoặc T giây
+    # (và lúc shutdown), không phải mỗi request
+    INDEX_SAVE_EVERY: int = int(os.environ.get("INDEX_SAVE_EVERY", "20"))
+    INDEX_SAVE_INTERVAL: float = float(os.environ.get("INDEX_SAVE_INTERVAL", "60"))
+    
+    # Test execution thực (Jest): toolchain node_modules cài một lần (content-addressed theo versions)
+    # dưới JEST_TOOLCHAIN_ROOT và symlink vào mỗi job; npm cài từ local cache (offline) nếu chưa có
+    JEST_TOOLCHAIN_ROOT: str = os.environ.get("JEST_TOOLCHAIN_ROOT", "~/.cache/testflow/jest-toolchains")
+    JEST_TOOLCHAIN_PACKAGES: list = [p.strip() for p in os.environ.get("JEST_TOOLCHAIN_PACKAGES", "").split(",") if p.strip()]
+    JEST_NPM_CACHE: Optional[str] = os.environ.get("JEST_NPM_CACHE")
+    JEST_NPM_OFFLINE: bool = os.environ.get("JEST_NPM_OFFLINE", "true").lower() == "true"
+    JEST_TIMEOUT: int = int(os.environ.get("JEST_TIMEOUT", "60"))
+    
+    # Test execution thực (pytest): worker pool đã import sẵn pytest, mỗi job chạy trong child được fork
+    PYTEST_WORKERS: int = int(os.environ.get("PYTEST_WORKERS", "2"))
+    PYTEST_WORKER_PRELOAD: list = [m.strip() for m in os.environ.get("PYTEST_WORKER_PRELOAD", "").split(",") if m.strip()]
+    PYTEST_MEMORY_LIMIT_MB: int = int(os.environ.get("PYTEST_MEMORY_LIMIT_MB", "1024"))  # 0 = không giới hạn
+    PYTEST_TIMEOUT: int = int(os.environ.get("PYTEST_TIMEOUT", "60"))
+    PYTEST_PREWARM: bool = os.environ.get("PYTEST_PREWARM", "true").lower() == "true"  # start pool lúc startup
+    
+    # Observability: OTLP/HTTP traces endpoint (ví dụ http://localhost:4318/v1/traces)
+    OTLP_ENDPOINT: Optional[str] = os.environ.get("OTLP_ENDPOINT")
+    
     # File upload
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS: list = [".xml", ".json", ".txt", ".log"]
@@ -0,0 +1,111 @@
+"""
+LLM package - pluggable LLM providers (Cerebras, fake provider cho load testing)
+"""
+from typing import Optional
+
+from .base import LLMProvider, LLMResponse, LLMError, RateLimitError
+from .fake_provider import FakeProvider, RecordingProvider
+from .pool import SharedProvider, build_http_client
+from .rate_limiter import (
+    RateLimiter,
+    RateLimitedProvider,
+    RetryPolicy,
+    TokenBucket,
+    llm_priority,
+    current_priority,
+    INTERACTIVE,
+    BACKGROUND
+)
+
+
+def create_provider(
+    api_key: Optional[str] = None,
+    provider_name: Optional[str] = None,
+    http_client=None
+) -> Optional[LLMProvider]:
+    """
+    Tạo LLM provider theo config (LLM_PROVIDER)
+
+    Args:
+        http_client: httpx.Client dùng chung (chỉ áp dụng cho Cerebras)
+
+    Returns:
+        Provider, hoặc None nếu dùng Cerebras mà chưa có API key
+    """
+    from config import Config
+
+    provider_name = (provider_name or Config.LLM_PROVIDER).lower()
+
+    if provider_name == "fake":
+        provider = FakeProvider(
+            latency=Config.FAKE_LLM_LATENCY,
+            error_rate=Config.FAKE_LLM_ERROR_RATE,
+            rate_limit_rate=Config.FAKE_LLM_RATE_LIMIT_RATE,
+            requests_per_minute=Config.FAKE_LLM_RPM,
+            recordings_path=Config.FAKE_LLM_RECORDINGS,
+            seed=Config.FAKE_LLM_SEED
+        )
+    elif provider_name == "cerebras":
+        if not api_key:
+            return None
+        from .cerebras_provider import CerebrasProvider
+        client_kwargs = {"http_client": http_client} if http_client is not None else {}
+        provider = CerebrasProvider(api_key=api_key, prompt_cache_param=Config.LLM_PROMPT_CACHE_PARAM, **client_kwargs)
+    else:
+        raise ValueError(f"Unknown LLM provider: {provider_name}")
+
+    if Config.LLM_RECORD_PATH:
+        provider = RecordingProvider(provider, Config.LLM_RECORD_PATH)
+    return provider
+
+
+def create_shared_provider(api_key: Optional[str] = None, provider_name: Optional[str] = None) -> Optional[LLMProvider]:
+    """
+    Tạo provider dùng chung cho tất cả agents: một HTTP connection pool đã tune
+    (keep-alive, HTTP/2), giới hạn số request in-flight (LLM_MAX_IN_FLIGHT),
+    rate limiter theo priority và retry với backoff
+    """
+    from config import Config
+
+    provider_name = (provider_name or Config.LLM_PROVIDER).lower()
+    http_client = None
+    if provider_name == "cerebras" and api_key:
+        http_client = build_http_client(
+            max_connections=Config.LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive=Config.LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=Config.LLM_POOL_KEEPALIVE_EXPIRY,
+            read_timeout=Config.LLM_TIMEOUT,
+            http2=Config.LLM_HTTP2
+        )
+
+    provider = create_provider(api_key, provider_name, http_client=http_client)
+    if provider is None:
+        return None
+    # Rate limiter bọc ngoài để request đang chờ budget/backoff không giữ slot in-flight
+    return RateLimitedProvider(
+        SharedProvider(provider, max_in_flight=Config.LLM_MAX_IN_FLIGHT),
+        RateLimiter(Config.LLM_RATE_LIMIT_RPM, Config.LLM_RATE_LIMIT_TPM),
+        RetryPolicy(Config.LLM_MAX_RETRIES, Config.LLM_RETRY_BASE_DELAY, Config.LLM_RETRY_MAX_DELAY)
+    )
+
+
+__all__ = [
+    "LLMProvider",
+    "LLMResponse",
+    "LLMError",
+    "RateLimitError",
+    "FakeProvider",
+    "RecordingProvider",
+    "SharedProvider",
+    "RateLimiter",
+    "RateLimitedProvider",
+    "RetryPolicy",
+    "TokenBucket",
+    "llm_priority",
+    "current_priority",
+    "INTERACTIVE",
+    "BACKGROUND",
+    "build_http_client",
+    "create_provider",
+    "create_shared_provider"
+]
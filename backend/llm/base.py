@@ -0,0 +1,77 @@
+"""
+LLM provider interface - abstraction cho backend LLM (Cerebras, fake provider...)
+"""
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Optional, Iterator
+
+
+class LLMError(Exception):
+    """Lỗi khi gọi LLM provider"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, transient: bool = False,
+                 headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.transient = transient
+        self.headers = headers or {}
+
+
+class RateLimitError(LLMError):
+    """Provider trả về 429 - cần chờ retry_after giây"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None,
+                 headers: Optional[Dict[str, str]] = None):
+        super().__init__(message, status_code=429, transient=True, headers=headers)
+        self.retry_after = retry_after
+
+
+class LLMResponse:
+    """Kết quả một LLM call"""
+
+    def __init__(
+        self,
+        content: str,
+        model: str,
+        prompt_tokens: int = 0,
+        completion_tokens: int = 0,
+        headers: Optional[Dict[str, str]] = None,
+        cached_tokens: int = 0
+    ):
+        self.content = content
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.headers = headers or {}
+        # Số prompt tokens provider lấy từ prefix cache (nếu provider báo)
+        self.cached_tokens = cached_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class LLMProvider(ABC):
+    """Base class cho tất cả LLM providers"""
+
+    name = "base"
+
+    @abstractmethod
+    def complete(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> LLMResponse:
+        """
+        Gọi chat completion và trả về toàn bộ response
+
+        kwargs có thể chứa prompt_cache_key (ID của prompt prefix) - provider không hỗ trợ thì bỏ qua
+        """
+        pass
+
+    def stream(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> Iterator[str]:
+        """Stream response theo từng chunk (mặc định: một chunk duy nhất)"""
+        yield self.complete(messages, model, **kwargs).content
+
+    def warm_up(self) -> bool:
+        """Mở sẵn connection tới provider (gọi lúc startup). Trả về False nếu không warm-up được"""
+        return True
+
+    def close(self):
+        """Giải phóng connections"""
+        pass
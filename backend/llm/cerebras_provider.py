@@ -0,0 +1,126 @@
+"""
+Cerebras provider - gọi Cerebras Cloud SDK
+"""
+import logging
+import threading
+from typing import Dict, Any, List, Iterator, Optional
+
+from .base import LLMProvider, LLMResponse, LLMError, RateLimitError
+
+logger = logging.getLogger(__name__)
+
+
+class CerebrasProvider(LLMProvider):
+    """LLM provider dùng Cerebras Cloud SDK"""
+
+    name = "cerebras"
+
+    def __init__(self, api_key: str, prompt_cache_param: Optional[str] = None, **client_kwargs):
+        """
+        Args:
+            api_key: Cerebras API key
+            prompt_cache_param: Tên field trong request body để gửi prompt_cache_key
+                (cho endpoint/proxy có KV prefix caching theo key); None = không gửi
+            client_kwargs: truyền thẳng cho Cerebras(), ví dụ http_client (httpx.Client dùng chung)
+        """
+        self.api_key = api_key
+        self.prompt_cache_param = prompt_cache_param
+        # SDK mặc định warm TCP connection (blocking, có retry) ngay trong Cerebras();
+        # warm-up đã chạy tường minh qua warm_up() lúc server startup
+        client_kwargs.setdefault("warm_tcp_connection", False)
+        # Retry (kể cả 429) do RetryPolicy/RateLimitedProvider lo - tắt retry của SDK để không
+        # nhân số requests và không bỏ qua global pause / adaptive rate của limiter
+        client_kwargs.setdefault("max_retries", 0)
+        self._client_kwargs = client_kwargs
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """SDK client được tạo ở lần dùng đầu tiên (import SDK khá nặng, không nằm trên đường startup)"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    # Import ở đây để fake provider không cần cài SDK
+                    from cerebras.cloud.sdk import Cerebras
+                    self._client = Cerebras(api_key=self.api_key, **self._client_kwargs)
+        return self._client
+
+    def complete(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> LLMResponse:
+        kwargs = self._request_kwargs(kwargs)
+        completions = self.client.chat.completions
+        try:
+            if hasattr(completions, "with_raw_response"):
+                # Raw response để đọc rate-limit headers
+                raw = completions.with_raw_response.create(messages=messages, model=model, **kwargs)
+                headers = dict(raw.headers)
+                response = raw.parse()
+            else:
+                headers = {}
+                response = completions.create(messages=messages, model=model, **kwargs)
+        except Exception as e:
+            raise self._map_error(e)
+
+        usage = getattr(response, "usage", None)
+        prompt_details = getattr(usage, "prompt_tokens_details", None)
+        return LLMResponse(
+            content=response.choices[0].message.content,
+            model=model,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            headers=headers,
+            cached_tokens=getattr(prompt_details, "cached_tokens", 0) or 0
+        )
+
+    def stream(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> Iterator[str]:
+        kwargs = self._request_kwargs(kwargs)
+        try:
+            chunks = self.client.chat.completions.create(messages=messages, model=model, stream=True, **kwargs)
+            for chunk in chunks:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    yield delta
+        except Exception as e:
+            raise self._map_error(e)
+
+    def _request_kwargs(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Chuyển prompt_cache_key thành field trong request body (SDK không có tham số này)"""
+        kwargs = dict(kwargs)
+        cache_key = kwargs.pop("prompt_cache_key", None)
+        if cache_key and self.prompt_cache_param:
+            extra_body = dict(kwargs.get("extra_body") or {})
+            extra_body[self.prompt_cache_param] = cache_key
+            kwargs["extra_body"] = extra_body
+        return kwargs
+
+    def warm_up(self) -> bool:
+        """Request nhẹ (list models) để mở sẵn TLS/HTTP2 connection trong pool"""
+        try:
+            self.client.models.list()
+            return True
+        except Exception as e:
+            logger.warning(f"Cerebras warm-up failed: {e}")
+            return False
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+
+    def _map_error(self, error: Exception) -> LLMError:
+        """Chuyển exception của SDK thành LLMError/RateLimitError"""
+        status_code = getattr(error, "status_code", None)
+        response = getattr(error, "response", None)
+        headers = dict(getattr(response, "headers", {}) or {})
+
+        if status_code == 429 or type(error).__name__ == "RateLimitError":
+            retry_after = headers.get("retry-after")
+            try:
+                retry_after = float(retry_after) if retry_after else None
+            except ValueError:
+                retry_after = None
+            return RateLimitError(str(error), retry_after=retry_after, headers=headers)
+
+        transient = (
+            status_code is None and type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+        ) or (status_code is not None and status_code >= 500)
+        return LLMError(str(error), status_code=status_code, transient=transient, headers=headers)
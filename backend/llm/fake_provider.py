@@ -0,0 +1,313 @@
+"""
+Fake provider - LLM giả lập deterministic cho load testing và benchmarks (không tốn tokens)
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional, Iterator, Callable
+
+from .base import LLMProvider, LLMResponse, LLMError, RateLimitError
+
+
+def parse_latency_spec(spec: Optional[str]) -> Callable[[random.Random], float]:
+    """
+    Parse latency distribution (đơn vị ms) thành hàm sample trả về giây
+
+    Formats:
+        fixed:200            - luôn 200ms
+        uniform:100,500      - đều trong [100, 500]
+        normal:300,50        - mean 300, stddev 50 (cắt tại 0)
+        lognormal:300,0.5    - median 300, sigma 0.5 (có tail dài giống LLM thật)
+    """
+    if not spec:
+        return lambda rng: 0.0
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v.strip()] if params else []
+    kind = kind.strip().lower()
+
+    if kind == "fixed":
+        value = values[0] if values else 0.0
+        return lambda rng: value / 1000
+    if kind == "uniform":
+        low, high = (values + [0.0, 0.0])[:2]
+        return lambda rng: rng.uniform(low, high) / 1000
+    if kind == "normal":
+        mean, stddev = (values + [0.0, 0.0])[:2]
+        return lambda rng: max(0.0, rng.gauss(mean, stddev)) / 1000
+    if kind == "lognormal":
+        median, sigma = (values + [0.0, 0.0])[:2]
+        mu = math.log(median) if median > 0 else 0.0
+        return lambda rng: (rng.lognormvariate(mu, sigma) if median > 0 else 0.0) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def prompt_fingerprint(messages: List[Dict[str, Any]], model: str = "") -> str:
+    """Hash ổn định của prompt - dùng làm key cho recordings"""
+    payload = json.dumps({"model": model, "messages": messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class FakeProvider(LLMProvider):
+    """
+    LLM provider giả lập
+
+    - Replay recorded responses (JSONL: {"prompt_sha256"|"contains": ..., "response": ...})
+    - Hoặc sinh JSON hợp lệ theo schema mà từng agent mong đợi
+    - Latency theo distribution, streaming, inject lỗi 5xx và 429
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        latency: Optional[str] = None,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        requests_per_minute: int = 0,
+        recordings_path: Optional[str] = None,
+        seed: Optional[int] = None,
+        stream_chunk_chars: int = 32
+    ):
+        self._sample_latency = parse_latency_spec(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.requests_per_minute = requests_per_minute
+        self.stream_chunk_chars = max(1, stream_chunk_chars)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self.calls = 0
+        self._recorded_by_hash: Dict[str, str] = {}
+        self._recorded_by_substring: List[tuple] = []
+        # Giả lập provider-side prefix caching: prefix đã thấy thì system prompt tính là cached tokens
+        self._seen_prefixes = set()
+        if recordings_path:
+            self.load_recordings(recordings_path)
+
+    def load_recordings(self, path: str):
+        """Load recorded responses từ file JSONL"""
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if entry.get("prompt_sha256"):
+                    self._recorded_by_hash[entry["prompt_sha256"]] = entry.get("response", "")
+                elif entry.get("contains"):
+                    self._recorded_by_substring.append((entry["contains"], entry.get("response", "")))
+
+    def complete(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> LLMResponse:
+        latency, headers = self._admit()
+        if latency:
+            time.sleep(latency)
+        content = self._respond(messages, model)
+        response = self._build_response(messages, model, content, headers)
+        cache_key = kwargs.get("prompt_cache_key")
+        if cache_key and messages:
+            with self._lock:
+                if cache_key in self._seen_prefixes:
+                    response.cached_tokens = len(str(messages[0].get("content", ""))) // 4
+                self._seen_prefixes.add(cache_key)
+        return response
+
+    def stream(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> Iterator[str]:
+        latency, _ = self._admit()
+        content = self._respond(messages, model)
+        chunks = [content[i:i + self.stream_chunk_chars] for i in range(0, len(content), self.stream_chunk_chars)] or [""]
+        delay = latency / len(chunks)
+        for chunk in chunks:
+            if delay:
+                time.sleep(delay)
+            yield chunk
+
+    def _admit(self):
+        """Sample latency, áp dụng rate limit giả lập và inject lỗi"""
+        with self._lock:
+            self.calls += 1
+            latency = self._sample_latency(self._rng)
+            roll = self._rng.random()
+            now = time.monotonic()
+            if now - self._window_start >= 60:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            headers = self._rate_limit_headers(now)
+            over_limit = self.requests_per_minute and self._window_count > self.requests_per_minute
+
+        if over_limit or roll < self.rate_limit_rate:
+            retry_after = max(0.0, 60 - (now - self._window_start)) if over_limit else 1.0
+            raise RateLimitError("Fake provider: rate limit exceeded", retry_after=retry_after, headers=headers)
+        if roll < self.rate_limit_rate + self.error_rate:
+            raise LLMError("Fake provider: injected server error", status_code=503, transient=True, headers=headers)
+        return latency, headers
+
+    def _rate_limit_headers(self, now: float) -> Dict[str, str]:
+        if not self.requests_per_minute:
+            return {}
+        return {
+            "x-ratelimit-limit-requests-minute": str(self.requests_per_minute),
+            "x-ratelimit-remaining-requests-minute": str(max(0, self.requests_per_minute - self._window_count)),
+            "x-ratelimit-reset-requests-minute": f"{max(0.0, 60 - (now - self._window_start)):.2f}"
+        }
+
+    def _build_response(self, messages, model, content: str, headers: Dict[str, str]) -> LLMResponse:
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+        return LLMResponse(
+            content=content,
+            model=model,
+            prompt_tokens=prompt_chars // 4,
+            completion_tokens=len(content) // 4,
+            headers=headers
+        )
+
+    def _respond(self, messages: List[Dict[str, Any]], model: str) -> str:
+        recorded = self._recorded_by_hash.get(prompt_fingerprint(messages, model))
+        if recorded is not None:
+            return recorded
+
+        system = str(messages[0].get("content", "")) if messages else ""
+        user = "\n".join(str(m.get("content", "")) for m in messages[1:])
+        for needle, response in self._recorded_by_substring:
+            if needle in user:
+                return response
+
+        if "Leader Agent" in system:
+            return self._leader_plan()
+        if "Generate actual test code" in user:
+            return self._generated_test_code(user)
+        if '"testCases"' in user or "đề xuất test cases" in user:
+            return self._code_analysis(user)
+        if "Phân tích các lỗi test" in user:
+            return self._batch_error_analysis(user)
+        if "Phân tích lỗi test" in user:
+            return self._error_analysis(user)
+        if "Parse test results" in user:
+            return json.dumps({"total": 0, "passed": 0, "failed": 0, "skipped": 0, "duration": 0, "tests": [],
+                               "metadata": {"framework": "unknown", "source": "fake_llm"}})
+        return "1. Pass rate ổn định so với các run trước\n2. Cần theo dõi các flaky tests\n3. Ưu tiên fix lỗi high severity"
+
+    def _leader_plan(self) -> str:
+        return json.dumps({
+            "agents_needed": ["ai_analysis_agent", "reporting_agent"],
+            "workflow": [
+                {"id": "step_1", "agent": "ai_analysis_agent", "task": "Phân tích", "depends_on": []},
+                {"id": "step_2", "agent": "reporting_agent", "task": "Tạo báo cáo", "depends_on": []}
+            ],
+            "reasoning": "Fake provider plan"
+        })
+
+    def _code_analysis(self, prompt: str) -> str:
+        # Chỉ tìm function names trong phần code, bỏ qua phần hướng dẫn của prompt
+        code = prompt.split("Code:", 1)[-1].split("\nHãy:", 1)[0]
+        functions = re.findall(r"(?:def|function)\s+([A-Za-z_][A-Za-z0-9_]*)", code)
+        functions += re.findall(r"(?:public|private|protected)\s+[\w<>\[\]]+\s+([A-Za-z_][A-Za-z0-9_]*)\s*\(", code)
+        functions = list(dict.fromkeys(f for f in functions if not f.startswith("test"))) or ["main"]
+        with self._lock:
+            types = [self._rng.choice(["unit", "negative", "edge", "integration"]) for _ in range(len(functions) * 2)]
+        test_cases = []
+        for i, function in enumerate(functions[:10]):
+            for j, (suffix, expected) in enumerate([("WhenValidInput_ReturnsResult", "Trả về kết quả đúng"),
+                                                    ("WhenInvalidInput_RaisesError", "Raise lỗi phù hợp")]):
+                name = f"{function}_{suffix}"
+                test_cases.append({
+                    "id": len(test_cases) + 1,
+                    "title": name,
+                    "name": name,
+                    "function": function,
+                    "type": types[(i * 2 + j) % len(types)],
+                    "complexity": "S" if j == 0 else "M",
+                    "description": f"Kiểm tra {function} ({suffix})",
+                    "steps": ["Chuẩn bị input", f"Gọi {function}", "Kiểm tra kết quả"],
+                    "expectedResult": expected
+                })
+        return json.dumps({
+            "summary": {
+                "overview": f"Code gồm {len(functions)} function chính.",
+                "risks": [f"{functions[0]} không validate input"]
+            },
+            "testCases": test_cases
+        }, ensure_ascii=False)
+
+    def _generated_test_code(self, prompt: str) -> str:
+        framework_match = re.search(r"Framework:\s*(.+)", prompt)
+        framework = framework_match.group(1).strip() if framework_match else "custom"
+        names = re.findall(r"- Name:\s*(.+)", prompt) or ["generated_case"]
+        is_pytest = "pytest" in framework.lower()
+        snippets = []
+        for i, name in enumerate(names):
+            slug = re.sub(r"\W+", "_", name).strip("_").lower() or f"case_{i + 1}"
+            if is_pytest:
+                snippets.append(f"def test_{slug}():\n    assert True\n")
+            else:
+                snippets.append(f"test('{name}', () => {{\n  expect(true).toBe(true);\n}});\n")
+        test_code = ("import pytest\n\n\n" if is_pytest else "") + "\n\n".join(snippets)
+        return json.dumps({
+            "framework": framework,
+            "testCode": test_code,
+            "fileExtension": ".py" if is_pytest else ".js",
+            "dependencies": ["pytest"] if is_pytest else ["jest"],
+            "testCases": [
+                {"id": i + 1, "name": name, "code": snippets[i], "status": "generated"}
+                for i, name in enumerate(names)
+            ]
+        })
+
+    def _batch_error_analysis(self, prompt: str) -> str:
+        analyses = []
+        for block in re.split(r"^### id:", prompt, flags=re.MULTILINE)[1:]:
+            item_id, _, body = block.partition("\n")
+            analysis = json.loads(self._error_analysis(body))
+            analyses.append({"id": item_id.strip(), **analysis})
+        return json.dumps(analyses, ensure_ascii=False)
+
+    def _error_analysis(self, prompt: str) -> str:
+        name_match = re.search(r"Test Name:\s*(.+)", prompt)
+        lower = prompt.lower()
+        if "timeout" in lower:
+            category, severity, cause = "timeout", "medium", "Test vượt quá thời gian chờ"
+        elif "assert" in lower or "expected" in lower:
+            category, severity, cause = "assertion", "high", "Kết quả không khớp expected"
+        elif "null" in lower or "undefined" in lower:
+            category, severity, cause = "null_reference", "high", "Truy cập giá trị null/undefined"
+        elif "connection" in lower or "network" in lower:
+            category, severity, cause = "network", "medium", "Lỗi kết nối tới service phụ thuộc"
+        else:
+            category, severity, cause = "unknown", "medium", "Không xác định được nguyên nhân"
+        return json.dumps({
+            "name": name_match.group(1).strip() if name_match else "unknown",
+            "cause": cause,
+            "suggestion": "1. Kiểm tra log chi tiết\n2. Reproduce locally\n3. Bổ sung assertion rõ ràng",
+            "severity": severity,
+            "category": category
+        }, ensure_ascii=False)
+
+
+class RecordingProvider(LLMProvider):
+    """Wrap provider thật và ghi lại responses (JSONL) để FakeProvider replay sau này"""
+
+    name = "recording"
+
+    def __init__(self, inner: LLMProvider, path: str):
+        self.inner = inner
+        self.path = path
+        self._lock = threading.Lock()
+
+    def complete(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> LLMResponse:
+        response = self.inner.complete(messages, model, **kwargs)
+        entry = {"prompt_sha256": prompt_fingerprint(messages, model), "model": model, "response": response.content}
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return response
+
+    def warm_up(self) -> bool:
+        return self.inner.warm_up()
+
+    def close(self):
+        self.inner.close()
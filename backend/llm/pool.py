@@ -0,0 +1,112 @@
+"""
+Shared provider layer - một connection pool (HTTP/2 keep-alive) và giới hạn in-flight dùng chung cho mọi agent
+"""
+import logging
+import threading
+import time
+from typing import Dict, Any, List, Iterator
+
+from .base import LLMProvider, LLMResponse
+from utils.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+def build_http_client(
+    max_connections: int = 20,
+    max_keepalive: int = 10,
+    keepalive_expiry: float = 60.0,
+    connect_timeout: float = 10.0,
+    read_timeout: float = 120.0,
+    http2: bool = True
+):
+    """
+    Tạo httpx.Client đã tune cho LLM calls: keep-alive pool và HTTP/2 (multiplex nhiều request
+    trên một connection). Tự fallback về HTTP/1.1 nếu chưa cài package h2.
+    """
+    import httpx
+
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("Package h2 chưa được cài đặt - LLM HTTP client dùng HTTP/1.1")
+            http2 = False
+
+    return httpx.Client(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        ),
+        timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+    )
+
+
+class SharedProvider(LLMProvider):
+    """
+    Wrap provider được dùng chung bởi tất cả agents:
+    - Giới hạn số request đang in-flight (semaphore) để không vượt quá pool/quota
+    - Warm-up connection lúc startup để request đầu tiên không phải trả chi phí TLS handshake
+    """
+
+    def __init__(self, inner: LLMProvider, max_in_flight: int = 8):
+        self.inner = inner
+        self.name = inner.name
+        self.max_in_flight = max_in_flight
+        self._semaphore = threading.BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def complete(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> LLMResponse:
+        self._acquire()
+        try:
+            return self.inner.complete(messages, model, **kwargs)
+        finally:
+            self._release()
+
+    def stream(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> Iterator[str]:
+        # Giữ slot trong suốt thời gian stream vì connection vẫn đang được dùng
+        self._acquire()
+        try:
+            yield from self.inner.stream(messages, model, **kwargs)
+        finally:
+            self._release()
+
+    def warm_up(self) -> bool:
+        return self.inner.warm_up()
+
+    def close(self):
+        self.inner.close()
+
+    def _acquire(self):
+        if self._semaphore is not None:
+            start = time.perf_counter()
+            self._semaphore.acquire()
+            telemetry.metrics.observe(
+                "testflow_llm_queue_wait_seconds",
+                time.perf_counter() - start,
+                help_text="Thời gian chờ slot in-flight của LLM provider",
+                provider=self.name
+            )
+        with self._lock:
+            self._in_flight += 1
+            telemetry.metrics.set_gauge(
+                "testflow_llm_in_flight", self._in_flight,
+                help_text="Số LLM requests đang in-flight", provider=self.name
+            )
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+            telemetry.metrics.set_gauge(
+                "testflow_llm_in_flight", self._in_flight,
+                help_text="Số LLM requests đang in-flight", provider=self.name
+            )
+        if self._semaphore is not None:
+            self._semaphore.release()
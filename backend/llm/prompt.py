@@ -0,0 +1,159 @@
+"""
+Prompt utilities - đếm tokens, compact code và cắt prompt theo token budget
+"""
+import functools
+import io
+import logging
+import re
+import tokenize
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Ngôn ngữ dùng comment kiểu C (// và /* */)
+C_LIKE_LANGUAGES = {
+    "javascript", "typescript", "java", "go", "rust", "c", "cpp", "csharp",
+    "php", "kotlin", "swift", "scala", "dart"
+}
+# Ngôn ngữ có backtick string (template literal / raw string)
+BACKTICK_LANGUAGES = {"javascript", "typescript", "go"}
+
+# Header mà API server chèn giữa các file khi gộp code - luôn giữ lại
+FILE_HEADER_PREFIX = "// File:"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_encoding = None
+_encoding_loaded = False
+
+
+def count_tokens(text: str) -> int:
+    """
+    Đếm tokens của text. Dùng tiktoken (cl100k_base) nếu đã cài,
+    nếu không thì ước lượng ~4 ký tự/token.
+    """
+    global _encoding, _encoding_loaded
+    if not text:
+        return 0
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def collapse_whitespace(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def compact_code(code: str, language: Optional[str] = None) -> str:
+    """
+    Giảm tokens của code mà không đổi ý nghĩa với LLM:
+    - Bỏ comments khi biết chắc ngôn ngữ (Python qua tokenize, ngôn ngữ kiểu C qua scanner)
+    - Bỏ trailing whitespace và dòng trống (giữ indentation)
+
+    Ngôn ngữ không rõ (hoặc code trộn nhiều ngôn ngữ) chỉ được compact whitespace.
+    """
+    if not code:
+        return code
+    return _compact_code_cached(code, (language or "").lower())
+
+
+@functools.lru_cache(maxsize=256)
+def _compact_code_cached(code: str, lang: str) -> str:
+    # Cùng một đoạn code thường được compact nhiều lần trong một request (prompt + context)
+    if lang == "python":
+        code = _strip_python_comments(code)
+    elif lang in C_LIKE_LANGUAGES:
+        code = _strip_c_comments(code, lang)
+    lines = (line.rstrip() for line in code.replace("\r\n", "\n").split("\n"))
+    return "\n".join(line for line in lines if line)
+
+
+def truncate_to_tokens(text: str, max_tokens: int, tail_ratio: float = 0.3) -> str:
+    """
+    Cắt text cho vừa max_tokens, giữ phần đầu và phần cuối
+    (phần cuối của prompt thường là yêu cầu format output)
+    """
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    keep_chars = int(len(text) * max_tokens / tokens * 0.95)
+    tail_chars = int(keep_chars * tail_ratio)
+    head_chars = keep_chars - tail_chars
+    removed = len(text) - keep_chars
+    tail = text[len(text) - tail_chars:] if tail_chars else ""
+    return f"{text[:head_chars]}\n...[truncated {removed} chars]...\n{tail}"
+
+
+def _strip_python_comments(code: str) -> str:
+    if "#" not in code:
+        return code
+    lines = code.split("\n")
+    try:
+        comments = [
+            tok.start for tok in tokenize.generate_tokens(io.StringIO(code).readline)
+            if tok.type == tokenize.COMMENT
+        ]
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        # Code không hợp lệ (hoặc bị cắt ngang) - không động vào comments
+        return code
+    for row, col in comments:
+        line = lines[row - 1]
+        if line.lstrip().startswith(FILE_HEADER_PREFIX):
+            continue
+        lines[row - 1] = line[:col]
+    return "\n".join(lines)
+
+
+def _strip_c_comments(code: str, language: str) -> str:
+    """Scanner bỏ // và /* */ nằm ngoài string literals"""
+    quotes = {'"'}
+    if language != "rust":  # 'a là lifetime trong Rust, không phải char literal
+        quotes.add("'")
+    if language in BACKTICK_LANGUAGES:
+        quotes.add("`")
+
+    out = []
+    i, n = 0, len(code)
+    quote = None
+    while i < n:
+        ch = code[i]
+        if quote:
+            out.append(ch)
+            if ch == "\\" and i + 1 < n:
+                out.append(code[i + 1])
+                i += 2
+                continue
+            if ch == quote or (ch == "\n" and quote != "`"):
+                quote = None
+            i += 1
+        elif ch in quotes:
+            quote = ch
+            out.append(ch)
+            i += 1
+        elif code.startswith("//", i):
+            end = code.find("\n", i)
+            end = n if end == -1 else end
+            if code.startswith(FILE_HEADER_PREFIX, i):
+                out.append(code[i:end])
+            i = end
+        elif code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            if end == -1:
+                # Comment chưa đóng (code bị cắt) - giữ nguyên phần còn lại
+                out.append(code[i:])
+                break
+            # Giữ newline để không nối hai dòng code thành một
+            out.append("\n" * code.count("\n", i, end))
+            i = end + 2
+        else:
+            out.append(ch)
+            i += 1
+    return "".join(out)
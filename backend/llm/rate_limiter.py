@@ -0,0 +1,263 @@
+"""
+Rate limiter và retry scheduler cho LLM calls
+
+- Token bucket riêng cho requests/phút và tokens/phút, tự cập nhật theo x-ratelimit-* headers của provider
+- Priority classes (interactive trước background) qua contextvar
+- Retry với exponential backoff + full jitter cho 429 và lỗi transient
+"""
+import contextvars
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterator
+
+from .base import LLMProvider, LLMResponse, LLMError, RateLimitError
+from utils.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = {INTERACTIVE: 0, BACKGROUND: 1}
+
+_priority: contextvars.ContextVar = contextvars.ContextVar("testflow_llm_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: str):
+    """
+    Đặt priority class cho mọi LLM call trong block (kể cả các thread chạy bằng copy_context)
+
+    Usage:
+        with llm_priority(BACKGROUND):
+            orchestrator.analyze_test_errors(test_run)
+    """
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+class TokenBucket:
+    """Token bucket refill liên tục theo limit/phút. capacity = 0 nghĩa là chưa biết limit (không chặn)"""
+
+    def __init__(self, per_minute: float = 0):
+        self.capacity = 0.0
+        self.rate = 0.0
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.configure(per_minute)
+
+    def configure(self, per_minute: float):
+        per_minute = max(0.0, float(per_minute or 0))
+        if per_minute == self.capacity:
+            return
+        self._refill(time.monotonic())
+        # Bucket mới bắt đầu đầy, bucket đổi limit giữ nguyên số tokens còn lại
+        self.tokens = per_minute if not self.capacity else min(self.tokens, per_minute)
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+
+    def observe_remaining(self, remaining: float):
+        """Provider báo còn `remaining` - không bao giờ tin bucket local hơn server"""
+        if self.capacity:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, float(remaining))
+
+    def time_until(self, amount: float, now: float) -> float:
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        # Request lớn hơn capacity vẫn được chạy khi bucket đầy
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        # Cho phép âm (nợ) khi usage thực tế lớn hơn ước tính
+        if self.capacity:
+            self.tokens -= amount
+
+    def _refill(self, now: float):
+        if self.capacity:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """Giới hạn requests/phút và tokens/phút, phục vụ waiters theo priority rồi FIFO"""
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._cond = threading.Condition()
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+
+    def acquire(self, estimated_tokens: int, priority: str = INTERACTIVE) -> float:
+        """Chờ tới lượt và đủ budget; trả về số giây đã chờ"""
+        entry = (PRIORITIES.get(priority, 0), next(self._seq))
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if self._waiters[0] == entry:
+                        wait = max(
+                            self._paused_until - now,
+                            self.requests.time_until(1, now),
+                            self.tokens.time_until(estimated_tokens, now)
+                        )
+                        if wait <= 0:
+                            self.requests.consume(1)
+                            self.tokens.consume(estimated_tokens)
+                            break
+                    self._cond.wait(wait)
+            finally:
+                if self._waiters and self._waiters[0] == entry:
+                    heapq.heappop(self._waiters)
+                else:
+                    self._waiters.remove(entry)
+                    heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+        waited = time.monotonic() - start
+        telemetry.metrics.observe(
+            "testflow_llm_rate_limit_wait_seconds",
+            waited,
+            help_text="Thời gian chờ rate limiter trước mỗi LLM call",
+            priority=priority
+        )
+        return waited
+
+    def pause(self, seconds: float):
+        """Dừng mọi request trong `seconds` giây (sau khi nhận 429)"""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """Điều chỉnh token bucket theo usage thực tế"""
+        if not actual_tokens:
+            return
+        with self._cond:
+            self.tokens.consume(actual_tokens - estimated_tokens)
+            self._cond.notify_all()
+
+    def update_from_headers(self, headers: Dict[str, str]):
+        """Cập nhật limit/remaining từ x-ratelimit-* headers (window theo phút)"""
+        if not headers:
+            return
+        headers = {k.lower(): v for k, v in headers.items()}
+        with self._cond:
+            for kind, bucket in (("requests", self.requests), ("tokens", self.tokens)):
+                limit = self._header_value(headers, f"x-ratelimit-limit-{kind}")
+                remaining = self._header_value(headers, f"x-ratelimit-remaining-{kind}")
+                if limit is not None:
+                    bucket.configure(limit)
+                if remaining is not None:
+                    bucket.observe_remaining(remaining)
+            self._cond.notify_all()
+
+    @staticmethod
+    def _header_value(headers: Dict[str, str], prefix: str) -> Optional[float]:
+        # Ưu tiên window theo phút (Cerebras: ...-minute), bỏ qua window theo ngày
+        for key in (f"{prefix}-minute", prefix):
+            value = headers.get(key)
+            if value is not None:
+                try:
+                    return float(value)
+                except ValueError:
+                    return None
+        return None
+
+
+class RetryPolicy:
+    """Exponential backoff với full jitter"""
+
+    def __init__(self, max_retries: int = 4, base_delay: float = 0.5, max_delay: float = 30.0,
+                 rng: Optional[random.Random] = None):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = rng or random.Random()
+
+    def backoff(self, attempt: int) -> float:
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class RateLimitedProvider(LLMProvider):
+    """Wrap provider: chờ rate limiter trước mỗi call, retry 429 và lỗi transient"""
+
+    def __init__(self, inner: LLMProvider, limiter: RateLimiter, retry_policy: Optional[RetryPolicy] = None,
+                 completion_estimate: int = 512):
+        self.inner = inner
+        self.name = inner.name
+        self.limiter = limiter
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.completion_estimate = completion_estimate
+
+    def complete(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> LLMResponse:
+        priority = current_priority()
+        estimated = self._estimate_tokens(messages, kwargs)
+        last_error: Optional[LLMError] = None
+
+        for attempt in range(self.retry_policy.max_retries + 1):
+            self.limiter.acquire(estimated, priority)
+            try:
+                response = self.inner.complete(messages, model, **kwargs)
+            except RateLimitError as e:
+                self.limiter.update_from_headers(e.headers)
+                # 429: dừng tất cả callers, không chỉ request này, để tránh 429 storm
+                delay = e.retry_after if e.retry_after is not None else self.retry_policy.backoff(attempt)
+                self.limiter.pause(delay)
+                last_error, reason = e, "rate_limit"
+            except LLMError as e:
+                self.limiter.update_from_headers(e.headers)
+                if not e.transient:
+                    raise
+                last_error, reason = e, "transient"
+            else:
+                self.limiter.update_from_headers(response.headers)
+                self.limiter.record_usage(estimated, response.total_tokens)
+                return response
+
+            if attempt == self.retry_policy.max_retries:
+                break
+            telemetry.metrics.inc("testflow_llm_retries_total", help_text="Số lần retry LLM call",
+                                  provider=self.name, reason=reason)
+            logger.warning(f"LLM call failed ({reason}), retry {attempt + 1}/{self.retry_policy.max_retries}: {last_error}")
+            if reason == "transient":
+                time.sleep(self.retry_policy.backoff(attempt))
+
+        raise last_error
+
+    def stream(self, messages: List[Dict[str, Any]], model: str, **kwargs) -> Iterator[str]:
+        # Stream không retry được giữa chừng - chỉ áp dụng rate limit
+        self.limiter.acquire(self._estimate_tokens(messages, kwargs), current_priority())
+        yield from self.inner.stream(messages, model, **kwargs)
+
+    def warm_up(self) -> bool:
+        return self.inner.warm_up()
+
+    def close(self):
+        self.inner.close()
+
+    def _estimate_tokens(self, messages: List[Dict[str, Any]], kwargs: Dict[str, Any]) -> int:
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+        return prompt_chars // 4 + int(kwargs.get("max_tokens") or self.completion_estimate)
@@ -1,8 +1,19 @@
 """
 Orchestrator - Điều phối workflow giữa các agents
 """
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable
+from collections.abc import Mapping
 import json
+import logging
+import threading
+from config import Config
+from utils.telemetry import telemetry
+from utils.workflow_dag import WorkflowDAG
+from utils.impact_index import get_test_impact_registry
+from utils.coverage_data import bitmap_to_lines
+from utils.run_comparison import normalize_thresholds, select_baseline_runs
+from utils.duration_stats import get_duration_stats_registry
+from llm import LLMProvider, BACKGROUND, create_shared_provider, llm_priority
 from agents import (
     LeaderAgent,
     TestingAgent,
@@ -11,19 +22,88 @@ from agents import (
     AIAnalysisAgent
 )
 
+logger = logging.getLogger(__name__)
+
+
+class _LazyAgents(Mapping):
+    """Registry agents: mỗi agent chỉ được khởi tạo ở lần truy cập đầu tiên"""
+
+    def __init__(self, factories: Dict[str, Callable[[], Any]]):
+        self._factories = factories
+        self._agents: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str):
+        agent = self._agents.get(name)
+        if agent is None:
+            factory = self._factories[name]
+            with self._lock:
+                agent = self._agents.get(name)
+                if agent is None:
+                    agent = self._agents[name] = factory()
+        return agent
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self) -> int:
+        return len(self._factories)
+
+    def __contains__(self, name) -> bool:
+        return name in self._factories
+
 
 class Orchestrator:
     """Điều phối workflow giữa các agents"""
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, provider: Optional[LLMProvider] = None):
         self.api_key = api_key
-        self.leader = LeaderAgent(api_key)
-        self.agents = {
-            "testing_agent": TestingAgent(api_key),
-            "execution_agent": ExecutionAgent(api_key),
-            "reporting_agent": ReportingAgent(api_key),
-            "ai_analysis_agent": AIAnalysisAgent(api_key)
-        }
+        # Provider và agents được tạo lazy: import module/khởi tạo Orchestrator không mở connection
+        # hay build prompt prefix, classifier, failure memory... cho tới khi request đầu tiên cần
+        self._provider = provider
+        self._provider_ready = provider is not None
+        self._provider_lock = threading.Lock()
+        self._leader = _LazyAgents({"leader": lambda: LeaderAgent(self.api_key, self.provider)})
+        self.agents = _LazyAgents({
+            "testing_agent": lambda: TestingAgent(self.api_key, self.provider),
+            "execution_agent": lambda: ExecutionAgent(self.api_key, self.provider),
+            "reporting_agent": lambda: ReportingAgent(self.api_key, self.provider),
+            "ai_analysis_agent": lambda: AIAnalysisAgent(self.api_key, self.provider)
+        })
+    
+    @property
+    def provider(self) -> Optional[LLMProvider]:
+        """Một provider (connection pool + giới hạn in-flight) dùng chung cho tất cả agents"""
+        if not self._provider_ready:
+            with self._provider_lock:
+                if not self._provider_ready:
+                    self._provider = create_shared_provider(self.api_key)
+                    self._provider_ready = True
+        return self._provider
+
+    @provider.setter
+    def provider(self, provider: Optional[LLMProvider]):
+        with self._provider_lock:
+            self._provider = provider
+            self._provider_ready = True
+
+    @property
+    def leader(self) -> LeaderAgent:
+        return self._leader["leader"]
+    
+    def warm_up(self) -> bool:
+        """Mở sẵn connection tới LLM provider (gọi lúc server startup)"""
+        if not self.provider:
+            return False
+        with telemetry.span("llm.warm_up", provider=self.provider.name) as span:
+            ok = self.provider.warm_up()
+            span.set_attribute("success", ok)
+        return ok
+    
+    def close(self):
+        """Đóng connection pool của LLM provider (nếu đã được tạo)"""
+        if self._provider_ready and self._provider:
+            self._provider.close()
     
     def process_request(
         self,
@@ -58,94 +138,48 @@ class Orchestrator:
         plan = leader_result.get("leader_plan", {})
         workflow = plan.get("workflow", [])
         
-        # Bước 2: Thực thi workflow
-        results = []
+        # Bước 2: Thực thi workflow theo DAG (các step độc lập chạy song song)
+        dag = WorkflowDAG(
+            workflow,
+            max_parallel=Config.WORKFLOW_MAX_PARALLEL,
+            step_timeout=Config.WORKFLOW_STEP_TIMEOUT
+        )
+        results = dag.run(
+            lambda step, dep_outputs: self._run_workflow_step(step, dep_outputs, user_request, context)
+        )
+        
         previous_output = None
         ai_response_text = None  # Store AI response text
         
-        for step in workflow:
-            agent_name = step.get("agent")
-            task = step.get("task", "")
-            step_input = step.get("input", {})
-            
-            if agent_name not in self.agents:
-                results.append({
-                    "step": agent_name,
-                    "success": False,
-                    "error": f"Unknown agent: {agent_name}"
-                })
+        for record in results:
+            agent_result = record.get("result")
+            if record.get("status") != "completed" or not isinstance(agent_result, dict):
                 continue
             
-            # Merge previous output vào input nếu cần
-            if previous_output:
-                step_input.update({"previous_output": previous_output})
-            
-            # Gọi agent
-            agent = self.agents[agent_name]
-            agent_task = {
-                **step_input,
-                "task_description": task
-            }
+            # Output của step thành công cuối cùng (theo thứ tự plan) là final output
+            previous_output = agent_result
             
-            # Đặc biệt cho ai_analysis_agent: nếu là code analysis, đảm bảo action đúng
-            if agent_name == "ai_analysis_agent" and context and context.get("source") in ["uploaded_files", "code_snippet", "github"]:
-                # Extract code từ context trước (code thực sự), sau đó mới từ step_input hoặc user_request
-                code = context.get("code") or step_input.get("code") or user_request
-                if code and len(code) > 100:  # Nếu có code thực sự
-                    language = context.get("detected_languages", ["unknown"])
-                    if isinstance(language, list) and len(language) > 0:
-                        language = language[0]
+            # Extract AI response text nếu là ai_analysis_agent
+            if record.get("step") == "ai_analysis_agent":
+                # Ưu tiên: result.testCases (từ analyze_code)
+                if "result" in agent_result and isinstance(agent_result.get("result"), dict):
+                    result_data = agent_result.get("result")
+                    # Nếu có testCases, dùng result_data
+                    if "testCases" in result_data:
+                        ai_response_text = json.dumps(result_data)
+                        logger.debug(f"Extracted testCases from result: {len(result_data.get('testCases', []))}")
                     else:
-                        language = "unknown"
-                    
-                    # Giới hạn code để tránh quá dài
-                    code_to_use = code[:10000] if isinstance(code, str) else str(code)[:10000]
-                    
-                    agent_task = {
-                        "action": "analyze_code",
-                        "code": code_to_use,
-                        "language": language,
-                        "context": context
-                    }
-                    print(f"[DEBUG orchestrator] Override agent_task for ai_analysis_agent: action=analyze_code, language={language}, code_length={len(code_to_use)}")
-            
-            agent_result = agent.process(agent_task)
-            results.append({
-                "step": agent_name,
-                "task": task,
-                "result": agent_result
-            })
-            
-            # Lưu output để dùng cho step tiếp theo
-            if agent_result.get("success"):
-                previous_output = agent_result
-                
-                # Extract AI response text nếu là ai_analysis_agent
-                if agent_name == "ai_analysis_agent":
-                    # Try to extract response text
-                    if isinstance(agent_result, dict):
-                        # Ưu tiên: result.testCases (từ analyze_code)
-                        if "result" in agent_result and isinstance(agent_result.get("result"), dict):
-                            result_data = agent_result.get("result")
-                            # Nếu có testCases, dùng result_data
-                            if "testCases" in result_data:
-                                ai_response_text = json.dumps(result_data)
-                                print(f"[DEBUG orchestrator] Extracted testCases from result: {len(result_data.get('testCases', []))}")
-                            else:
-                                # Nếu không có testCases, vẫn dùng result_data (có thể có summary)
-                                ai_response_text = json.dumps(result_data)
-                        # Fallback: testCases trực tiếp
-                        elif "testCases" in agent_result:
-                            ai_response_text = json.dumps(agent_result)
-                        # Fallback: content (raw response)
-                        elif "content" in agent_result:
-                            ai_response_text = agent_result.get("content")
-                        # Last resort: convert to JSON
-                        else:
-                            ai_response_text = json.dumps(agent_result)
-                    else:
-                        # Nếu không phải dict, convert to JSON string
-                        ai_response_text = json.dumps(agent_result) if agent_result else ""
+                        # Nếu không có testCases, vẫn dùng result_data (có thể có summary)
+                        ai_response_text = json.dumps(result_data)
+                # Fallback: testCases trực tiếp
+                elif "testCases" in agent_result:
+                    ai_response_text = json.dumps(agent_result)
+                # Fallback: content (raw response)
+                elif "content" in agent_result:
+                    ai_response_text = agent_result.get("content")
+                # Last resort: convert to JSON
+                else:
+                    ai_response_text = json.dumps(agent_result)
         
         # Nếu không có ai_analysis_agent trong workflow, thử gọi trực tiếp
         if not ai_response_text and "ai_analysis_agent" not in [step.get("agent") for step in workflow]:
@@ -174,9 +208,9 @@ class Orchestrator:
                         "language": language,
                         "context": context
                     }
-                    print(f"[DEBUG orchestrator] Direct call: code_length={len(code_to_use)}, language={language}")
+                    logger.debug(f"Direct call: code_length={len(code_to_use)}, language={language}")
                     ai_result = ai_agent.process(ai_task)
-                    print(f"[DEBUG orchestrator] Direct AI call result keys: {ai_result.keys() if isinstance(ai_result, dict) else 'not dict'}")
+                    logger.debug(f"Direct AI call result keys: {ai_result.keys() if isinstance(ai_result, dict) else 'not dict'}")
                     if ai_result.get("success"):
                         previous_output = ai_result
                         # Extract parsed result
@@ -185,7 +219,7 @@ class Orchestrator:
                             # Nếu có testCases trong result_data
                             if "testCases" in result_data:
                                 ai_response_text = json.dumps(result_data)
-                                print(f"[DEBUG orchestrator] Direct call found testCases: {len(result_data.get('testCases', []))}")
+                                logger.debug(f"Direct call found testCases: {len(result_data.get('testCases', []))}")
                             else:
                                 ai_response_text = json.dumps(result_data)
                         elif ai_result.get("testCases"):
@@ -196,17 +230,93 @@ class Orchestrator:
                         else:
                             ai_response_text = json.dumps(ai_result)
                 except Exception as e:
-                    print(f"Error calling ai_analysis_agent directly: {e}")
+                    logger.error(f"Error calling ai_analysis_agent directly: {e}")
         
         return {
             "success": True,
             "original_request": user_request,
             "plan": plan,
             "workflow_results": results,
+            "workflow_status": self._workflow_status(results),
             "final_output": previous_output,
             "ai_response_text": ai_response_text  # Include AI response text
         }
     
+    def _run_workflow_step(
+        self,
+        step: Dict[str, Any],
+        dependency_outputs: Dict[str, Dict[str, Any]],
+        user_request: str,
+        context: Optional[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """
+        Chạy một step của workflow (được gọi từ WorkflowDAG, có thể song song)
+        
+        Args:
+            step: Step trong plan (agent, task, input, depends_on...)
+            dependency_outputs: Output của các step phụ thuộc đã thành công
+            user_request: Yêu cầu gốc từ user
+            context: Context bổ sung
+        """
+        agent_name = step.get("agent")
+        task = step.get("task", "")
+        step_input = dict(step.get("input") or {})
+        
+        if agent_name not in self.agents:
+            return {
+                "success": False,
+                "error": f"Unknown agent: {agent_name}"
+            }
+        
+        # Merge output của các step phụ thuộc vào input
+        if dependency_outputs:
+            step_input["previous_output"] = list(dependency_outputs.values())[-1]
+            if len(dependency_outputs) > 1:
+                step_input["dependency_outputs"] = dependency_outputs
+        
+        agent = self.agents[agent_name]
+        agent_task = {
+            **step_input,
+            "task_description": task
+        }
+        
+        # Đặc biệt cho ai_analysis_agent: nếu là code analysis, đảm bảo action đúng
+        if agent_name == "ai_analysis_agent" and context and context.get("source") in ["uploaded_files", "code_snippet", "github"]:
+            # Extract code từ context trước (code thực sự), sau đó mới từ step_input hoặc user_request
+            code = context.get("code") or step_input.get("code") or user_request
+            # Nếu có code thực sự, hoặc plan template đã chỉ định analyze_code
+            if code and (len(code) > 100 or step_input.get("action") == "analyze_code"):
+                language = context.get("detected_languages", ["unknown"])
+                if isinstance(language, list) and len(language) > 0:
+                    language = language[0]
+                else:
+                    language = "unknown"
+                
+                # Giới hạn code để tránh quá dài
+                code_to_use = code[:10000] if isinstance(code, str) else str(code)[:10000]
+                
+                agent_task = {
+                    "action": "analyze_code",
+                    "code": code_to_use,
+                    "language": language,
+                    "context": context
+                }
+                logger.debug(f"Override agent_task for ai_analysis_agent: action=analyze_code, language={language}, code_length={len(code_to_use)}")
+        
+        with telemetry.span("workflow.step", agent=agent_name, step_id=step.get("id")):
+            return agent.process(agent_task)
+    
+    def _workflow_status(self, results: List[Dict[str, Any]]) -> str:
+        """Tổng hợp trạng thái workflow: completed, partial hoặc failed"""
+        if not results:
+            return "completed"
+        statuses = [r.get("status") for r in results]
+        if all(status == "completed" for status in statuses):
+            return "completed"
+        if any(status == "completed" for status in statuses):
+            return "partial"
+        return "failed"
+    
     def process_test_results_upload(
         self,
         file_content: str,
@@ -258,6 +368,15 @@ class Orchestrator:
         
         test_run = test_run_result.get("test_run", {})
         
+        # Thời gian / trạng thái từng test cho thứ tự ưu tiên của test impact analysis
+        project = metadata.get("project") or "default"
+        impact_registry = get_test_impact_registry()
+        if impact_registry.has(project) and impact_registry.get(project).record_junit_results(parsed_data.get("tests", [])):
+            impact_registry.mark_dirty(project)
+        
+        # Duration baseline của từng test: kiểm tra run mới rồi cập nhật (streaming)
+        test_run["duration_regressions"] = self._detect_duration_regressions(project, test_run, parsed_data.get("tests", []))
+        
         # Bước 3: Nếu có lỗi, gọi AI Analysis Agent
         if parsed_data.get("failed", 0) > 0:
             failed_tests = [
@@ -265,27 +384,30 @@ class Orchestrator:
                 if t.get("status") == "fail"
             ]
             
-            ai_agent = self.agents["ai_analysis_agent"]
-            ai_result = ai_agent.process({
-                "action": "analyze_multiple",
-                "failed_tests": failed_tests
-            })
-            results.append({"step": "ai_analysis", "result": ai_result})
-            
-            # Generate summary
-            if ai_result.get("success"):
-                analyses = ai_result.get("analyses", [])
-                summary_result = ai_agent.process({
-                    "action": "generate_summary",
-                    "error_analyses": analyses,
-                    "test_run": test_run
+            # Phân tích lỗi sau upload là việc nền - nhường LLM budget cho request interactive
+            with llm_priority(BACKGROUND):
+                ai_agent = self.agents["ai_analysis_agent"]
+                ai_result = ai_agent.process({
+                    "action": "analyze_multiple",
+                    "failed_tests": failed_tests
                 })
-                results.append({"step": "ai_summary", "result": summary_result})
+                results.append({"step": "ai_analysis", "result": ai_result})
                 
-                # Thêm AI insights vào test run
-                if summary_result.get("success"):
-                    test_run["ai_analysis"] = summary_result.get("summary", {})
-        
+                # Generate summary
+                if ai_result.get("success"):
+                    analyses = ai_result.get("analyses", [])
+                    summary_result = ai_agent.process({
+                        "action": "generate_summary",
+                        "error_analyses": analyses,
+                        "test_run": test_run,
+                        "failed_tests": failed_tests
+                    })
+                    results.append({"step": "ai_summary", "result": summary_result})
+                    
+                    # Thêm AI insights vào test run
+                    if summary_result.get("success"):
+                        test_run["ai_analysis"] = summary_result.get("summary", {})
+            
         # Bước 4: Reporting Agent - Tạo dashboard data
         reporting_agent = self.agents["reporting_agent"]
         # Note: Trong production, sẽ lấy từ database
@@ -302,6 +424,46 @@ class Orchestrator:
             "results": results
         }
     
+    def _detect_duration_regressions(
+        self,
+        project: str,
+        test_run: Dict[str, Any],
+        tests: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        registry = get_duration_stats_registry()
+        with telemetry.span("duration_stats.ingest", project=project, tests=len(tests)) as span:
+            report = registry.get(project).ingest(
+                tests,
+                run_id=test_run.get("run_id"),
+                thresholds={"sigma": Config.DURATION_REGRESSION_SIGMA, "min_delta_ms": Config.DURATION_REGRESSION_MIN_MS}
+            )
+            span.set_attribute("flagged", report["total_flagged"])
+        registry.mark_dirty(project)
+        if report["total_flagged"]:
+            telemetry.metrics.inc(
+                "testflow_duration_regressions_total", report["total_flagged"],
+                help_text="Số tests chậm bất thường so với duration baseline", level="test"
+            )
+        if report["suites"]:
+            telemetry.metrics.inc(
+                "testflow_duration_regressions_total", len(report["suites"]),
+                help_text="Số tests chậm bất thường so với duration baseline", level="suite"
+            )
+        return report
+    
+    def get_duration_stats(self, project: str = "default", test: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
+        """Duration baseline của một test ("pkg.Class.test_x"), hoặc các tests có p95 lớn nhất"""
+        registry = get_duration_stats_registry()
+        if not registry.has(project):
+            return {"success": False, "error": f"No duration statistics for project: {project}"}
+        index = registry.get(project)
+        if test:
+            stats = index.get(test)
+            if stats is None:
+                return {"success": False, "error": f"No duration statistics for test: {test}"}
+            return {"success": True, **index.stats(), "test": test, "stats": stats}
+        return {"success": True, **index.stats(), "slowest": index.slowest(limit)}
+    
     def get_dashboard_data(
         self,
         test_runs: List[Dict[str, Any]],
@@ -338,6 +500,232 @@ class Orchestrator:
         
         return dashboard_result
     
+    def generate_and_execute_tests(
+        self,
+        test_cases: List[Dict[str, Any]],
+        original_code: str = "",
+        language: str = "unknown",
+        framework: Optional[str] = None,
+        risks: Optional[List[Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Generate test code từ test cases (AI Analysis Agent) rồi chạy tests (Execution Agent)
+        """
+        ai_agent = self.agents["ai_analysis_agent"]
+        generate_result = ai_agent.process({
+            "action": "generate_test_code",
+            "test_cases": test_cases,
+            "original_code": original_code,
+            "language": language,
+            "framework": framework
+        })
+        
+        if not generate_result.get("success"):
+            return {
+                "success": False,
+                "error": f"Failed to generate test code: {generate_result.get('error', 'Unknown error')}"
+            }
+        
+        generated_code_data = generate_result.get("generated_code", {})
+        test_code = generated_code_data.get("testCode", "")
+        detected_framework = generate_result.get("framework", framework or "custom")
+        
+        if not test_code:
+            return {"success": False, "error": "Generated test code is empty"}
+        
+        # Truyền original_code và risks để execution agent có thể combine khi execute
+        execution_agent = self.agents["execution_agent"]
+        execute_result = execution_agent.process({
+            "action": "execute_test_code",
+            "test_code": test_code,
+            "original_code": original_code,
+            "framework": detected_framework,
+            "language": language,
+            "test_cases": test_cases,
+            "risks": risks or []
+        })
+        
+        if not execute_result.get("success"):
+            return {
+                "success": False,
+                "error": f"Failed to execute tests: {execute_result.get('error', 'Unknown error')}"
+            }
+        
+        return {
+            "success": True,
+            "test_code": test_code,
+            "framework": detected_framework,
+            "generated_code": generated_code_data,
+            "generation_cache": generate_result.get("cache"),
+            "execution": execute_result
+        }
+    
+    def rerun_tests(
+        self,
+        parent_run_id: str,
+        original_code: Optional[str] = None,
+        select: str = "failed_or_changed",
+        tests: Optional[List[Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Chạy lại tests fail / bị ảnh hưởng bởi source thay đổi (hoặc tests chỉ định) của một execution
+        trước, dùng lại test code đã generate; kết quả merge thành run mới trỏ về run cha
+        """
+        execution_agent = self.agents["execution_agent"]
+        execute_result = execution_agent.process({
+            "action": "rerun_tests",
+            "parent_run_id": parent_run_id,
+            "original_code": original_code,
+            "select": select,
+            "tests": tests
+        })
+        if not execute_result.get("success"):
+            return {
+                "success": False,
+                "error": f"Failed to re-run tests: {execute_result.get('error', 'Unknown error')}"
+            }
+        record = execution_agent.executions.get(execute_result["run_id"]) or {}
+        return {
+            "success": True,
+            "test_code": record.get("test_code", ""),
+            "framework": execute_result.get("framework"),
+            "generated_code": {},
+            "generation_cache": None,
+            "execution": execute_result
+        }
+    
+    def compare_test_runs(
+        self,
+        run: Any,
+        baseline: Optional[Any] = None,
+        baseline_runs: Optional[List[Any]] = None,
+        test_runs: Optional[List[Dict[str, Any]]] = None,
+        baseline_filter: Optional[Dict[str, Any]] = None,
+        thresholds: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        So sánh run với baseline. Run có thể là dict (format create_test_run) hoặc run_id của một
+        execution. Baseline: một run (baseline), danh sách runs (baseline_runs) hoặc chọn từ test_runs
+        theo baseline_filter {"branch": "main", "green_only": true, "limit": 10}.
+        """
+        execution_agent = self.agents["execution_agent"]
+        
+        def resolve(item):
+            if isinstance(item, dict):
+                return item
+            record = execution_agent.executions.get(str(item))
+            if record is None:
+                raise KeyError(f"Unknown run_id: {item}")
+            return record
+        
+        try:
+            thresholds = normalize_thresholds(thresholds)
+            current = resolve(run)
+            if baseline is not None:
+                runs = [resolve(baseline)]
+            elif baseline_runs:
+                runs = [resolve(item) for item in baseline_runs]
+            else:
+                options = baseline_filter or {}
+                runs = select_baseline_runs(
+                    test_runs or [],
+                    branch=options.get("branch"),
+                    green_only=bool(options.get("green_only", False)),
+                    limit=int(options.get("limit", 10)),
+                    exclude=[current.get("run_id")]
+                )
+        except KeyError as e:
+            return {"success": False, "error": str(e.args[0]), "not_found": True}
+        except (TypeError, ValueError) as e:
+            return {"success": False, "error": f"Invalid comparison options: {e}"}
+        if not runs:
+            return {"success": False, "error": "No baseline runs"}
+        
+        comparison = execution_agent.compare_to_baseline(current, runs, thresholds)
+        return {"success": True, "comparison": comparison}
+    
+    def get_run_coverage(self, run_id: str, include_lines: bool = False) -> Dict[str, Any]:
+        """
+        Coverage (merged qua mọi tests) của một execution; include_lines=True thì decode bitmaps
+        thành danh sách số dòng
+        """
+        record = self.agents["execution_agent"].executions.get(run_id)
+        if record is None:
+            return {"success": False, "error": f"Unknown run_id: {run_id}"}
+        coverage = record.get("coverage")
+        if not coverage:
+            return {"success": False, "error": f"No coverage collected for run {run_id}"}
+        if include_lines:
+            coverage = {
+                **coverage,
+                "files": {
+                    path: {
+                        "statements": bitmap_to_lines(data["statements"]),
+                        "executed": bitmap_to_lines(data["executed"]),
+                        "tests": {test: bitmap_to_lines(bitmap) for test, bitmap in data["tests"].items()},
+                        "branches": data.get("branches", []),
+                        "num_branches": data.get("num_branches", 0)
+                    }
+                    for path, data in coverage["files"].items()
+                }
+            }
+        return {"success": True, "run_id": run_id, "coverage": coverage}
+    
+    def build_test_impact_index(
+        self,
+        project: str = "default",
+        sources: Optional[Dict[str, str]] = None,
+        tests: Optional[Dict[str, str]] = None,
+        test_cases: Optional[List[Dict[str, Any]]] = None,
+        coverage: Optional[Dict[str, Any]] = None,
+        commit: Optional[str] = None,
+        branch: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Cập nhật test impact index của project: source files, test files, test cases (field "function")
+        và coverage theo test (coverage.py JSON có contexts)
+        """
+        registry = get_test_impact_registry()
+        index = registry.get(project)
+        with telemetry.span("test_impact.index", project=project) as span:
+            for path, source in (sources or {}).items():
+                index.index_source(path, source)
+            for path, test_code in (tests or {}).items():
+                index.index_tests(path, test_code)
+            for tc in test_cases or []:
+                test_id = tc.get("testId") or tc.get("name") or tc.get("title")
+                if test_id and tc.get("function"):
+                    index.add_test(test_id, [tc["function"]])
+            covered_tests = index.add_coverage_json(coverage) if coverage else 0
+            if commit:
+                index.commit = commit
+            if branch:
+                index.branch = branch
+            registry.save(project)
+            span.set_attribute("files", len(sources or {}) + len(tests or {}))
+        return {"success": True, "index": index.stats(), "coverage_tests": covered_tests}
+    
+    def get_test_impact(
+        self,
+        project: str = "default",
+        diff: Optional[str] = None,
+        changed_files: Optional[List[str]] = None,
+        limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Tập tests tối thiểu bị ảnh hưởng bởi diff / changed files, theo thứ tự ưu tiên"""
+        registry = get_test_impact_registry()
+        if not registry.has(project):
+            return {"success": False, "error": f"No test impact index for project: {project}"}
+        with telemetry.span("test_impact.query", project=project) as span:
+            impact = registry.get(project).affected_tests(diff=diff, changed_files=changed_files, limit=limit)
+            span.set_attribute("selected", impact["selected"])
+        telemetry.metrics.observe(
+            "testflow_test_impact_selected_ratio",
+            impact["selected"] / impact["total_tests"] if impact["total_tests"] and not impact["run_all"] else 1.0,
+            help_text="Tỷ lệ tests được chọn bởi test impact analysis (1 = chạy tất cả)"
+        )
+        return {"success": True, **impact}
+    
     def analyze_test_errors(
         self,
         test_run: Dict[str, Any]
@@ -359,30 +747,35 @@ class Orchestrator:
         
         ai_agent = self.agents["ai_analysis_agent"]
         
-        # Analyze errors
-        analyze_result = ai_agent.process({
-            "action": "analyze_multiple",
-            "failed_tests": failed_tests
-        })
-        
-        if not analyze_result.get("success"):
-            return analyze_result
-        
-        analyses = analyze_result.get("analyses", [])
-        
-        # Group errors
-        group_result = ai_agent.process({
-            "action": "group_errors",
-            "error_analyses": analyses
-        })
-        
-        # Generate summary
-        summary_result = ai_agent.process({
-            "action": "generate_summary",
-            "error_analyses": analyses,
-            "test_run": test_run
-        })
-        
+        # Failure analysis chạy với priority background (nhường cho analyze-code interactive)
+        with llm_priority(BACKGROUND):
+            # Analyze errors
+            analyze_result = ai_agent.process({
+                "action": "analyze_multiple",
+                "failed_tests": failed_tests
+            })
+            
+            if not analyze_result.get("success"):
+                return analyze_result
+            
+            analyses = analyze_result.get("analyses", [])
+            
+            # Group errors
+            group_result = ai_agent.process({
+                "action": "group_errors",
+                "error_analyses": analyses,
+                "failed_tests": failed_tests
+            })
+            
+            # Generate summary (dùng lại groups để không gán clusters hai lần)
+            summary_result = ai_agent.process({
+                "action": "generate_summary",
+                "error_analyses": analyses,
+                "test_run": test_run,
+                "failed_tests": failed_tests,
+                "groups": group_result.get("groups") if group_result.get("success") else None
+            })
+            
         return {
             "success": True,
             "analyses": analyses,
@@ -1,70 +1,120 @@
 """
-Script để chạy API server - wrapper để đảm bảo .env được load
+Script để chạy API server (non-interactive, dùng được trong container/CI)
+
+Usage:
+    python run.py                              # 1 worker, không auto-reload
+    python run.py --workers 4                  # uvicorn multi-process
+    python run.py --workers 4 --preload        # gunicorn + uvicorn workers, import app một lần trước khi fork
+    python run.py --reload                     # dev: auto-reload khi sửa code
 """
+import argparse
 import os
 import sys
 
-# Kiểm tra .env file
-env_path = os.path.join(os.path.dirname(__file__), ".env")
-if not os.path.exists(env_path):
-    print("⚠️  Warning: File .env không tồn tại!")
-    print("📝 Vui lòng tạo file .env với nội dung:")
-    print("   CEREBRAS_API_KEY=your_api_key_here")
-    print("\nBạn có muốn tạo file .env bây giờ? (y/n): ", end="")
-    choice = input().strip().lower()
-    
-    if choice == 'y':
-        api_key = input("Nhập CEREBRAS_API_KEY: ").strip()
-        if api_key:
-            with open(env_path, 'w') as f:
-                f.write(f"CEREBRAS_API_KEY={api_key}\n")
-            print("✅ Đã tạo file .env")
-        else:
-            print("❌ API key không được để trống!")
-            sys.exit(1)
+
+def parse_args(argv=None):
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="TestFlow AI API Server")
+    parser.add_argument("--host", default=Config.API_HOST)
+    parser.add_argument("--port", type=int, default=Config.API_PORT)
+    parser.add_argument("--workers", type=int, default=Config.API_WORKERS,
+                        help="số worker processes (env API_WORKERS)")
+    parser.add_argument("--reload", action="store_true", default=Config.API_RELOAD,
+                        help="auto-reload khi sửa code (chỉ dùng khi dev, env API_RELOAD)")
+    parser.add_argument("--preload", action="store_true",
+                        help="chạy bằng gunicorn --preload: master import app trước khi fork workers (cần gunicorn)")
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info").lower())
+    args = parser.parse_args(argv)
+    if args.reload and (args.workers > 1 or args.preload):
+        parser.error("--reload không dùng chung được với --workers > 1 hoặc --preload")
+    return args
+
+
+def print_banner(args):
+    from config import Config
+
+    print("=" * 50)
+    print("🚀 Starting TestFlow AI API Server")
+    print("=" * 50)
+    print(f"📡 Host: {args.host}")
+    print(f"🔌 Port: {args.port}")
+    print(f"👷 Workers: {args.workers}{' (gunicorn --preload)' if args.preload else ''}")
+    print(f"🤖 Model: {Config.CEREBRAS_MODEL}")
+
+    # Không hỏi input - chỉ cảnh báo để server vẫn khởi động được trong môi trường non-interactive
+    env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env")
+    if not os.path.exists(env_path):
+        print("⚠️  Warning: File .env không tồn tại - dùng biến môi trường hiện có")
+    if Config.CEREBRAS_API_KEY:
+        masked_key = Config.CEREBRAS_API_KEY[:10] + "..." + Config.CEREBRAS_API_KEY[-5:]
+        print(f"🔑 API Key: {masked_key}")
     else:
-        print("⚠️  Tiếp tục với default API key từ code...")
+        print("⚠️  Warning: CEREBRAS_API_KEY chưa được set!")
 
-# Import và chạy server
-if __name__ == "__main__":
+    print("=" * 50)
+    print(f"🌐 Truy cập: http://localhost:{args.port}")
+    print(f"📚 API Docs: http://localhost:{args.port}/docs")
+    print("=" * 50)
+    print()
+
+
+def run_gunicorn(args):
+    """gunicorn với uvicorn workers; --preload import app (nhẹ vì orchestrator được tạo lazy) trước khi fork"""
     try:
-        import uvicorn
-        from config import Config
-        
-        print("=" * 50)
-        print("🚀 Starting TestFlow AI API Server")
-        print("=" * 50)
-        print(f"📡 Host: {Config.API_HOST}")
-        print(f"🔌 Port: {Config.API_PORT}")
-        print(f"🤖 Model: {Config.CEREBRAS_MODEL}")
-        
-        # Kiểm tra API key
-        if Config.CEREBRAS_API_KEY:
-            masked_key = Config.CEREBRAS_API_KEY[:10] + "..." + Config.CEREBRAS_API_KEY[-5:]
-            print(f"🔑 API Key: {masked_key}")
+        from gunicorn.app.wsgiapp import run
+    except ImportError:
+        print("❌ --preload cần gunicorn: pip install gunicorn")
+        sys.exit(1)
+    try:
+        import uvicorn_worker  # noqa: F401
+        worker_class = "uvicorn_worker.UvicornWorker"
+    except ImportError:
+        worker_class = "uvicorn.workers.UvicornWorker"
+
+    sys.argv = [
+        "gunicorn", "api_server:app",
+        "--worker-class", worker_class,
+        "--workers", str(args.workers),
+        "--bind", f"{args.host}:{args.port}",
+        "--log-level", args.log_level,
+        "--preload"
+    ]
+    run()
+
+
+def run_uvicorn(args):
+    import uvicorn
+
+    uvicorn.run(
+        "api_server:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers if args.workers > 1 else None,
+        reload=args.reload,
+        log_level=args.log_level
+    )
+
+
+def main(argv=None):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    args = parse_args(argv)
+    print_banner(args)
+    try:
+        if args.preload:
+            run_gunicorn(args)
         else:
-            print("⚠️  Warning: CEREBRAS_API_KEY chưa được set!")
-        
-        print("=" * 50)
-        print("✅ Server đang khởi động...")
-        print(f"🌐 Truy cập: http://localhost:{Config.API_PORT}")
-        print("📚 API Docs: http://localhost:{}/docs".format(Config.API_PORT))
-        print("=" * 50)
-        print()
-        
-        uvicorn.run(
-            "api_server:app",
-            host=Config.API_HOST,
-            port=Config.API_PORT,
-            reload=True
-        )
+            run_uvicorn(args)
     except KeyboardInterrupt:
         print("\n\n👋 Server đã dừng!")
     except Exception as e:
         print(f"\n❌ Lỗi khi khởi động server: {e}")
         print("\n💡 Kiểm tra lại:")
         print("   1. Đã cài đặt dependencies: pip install -r requirements.txt")
-        print("   2. File .env có API key hợp lệ")
-        print("   3. Port 8000 chưa bị sử dụng")
+        print("   2. File .env / biến môi trường có API key hợp lệ")
+        print(f"   3. Port {args.port} chưa bị sử dụng")
         sys.exit(1)
 
+
+if __name__ == "__main__":
+    main()
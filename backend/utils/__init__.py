@@ -1,8 +1,37 @@
 """
 Utils package
 """
-from .github_client import GitHubClient
 from .response_parser import ResponseParser
+from .workflow_dag import WorkflowDAG
+from .single_flight import SingleFlight, request_fingerprint, normalize_code
+from .error_classifier import ErrorClassifier
+from .error_clustering import ErrorClusterIndex
+from .failure_memory import FailureMemory
+from .jest_toolchain import JestToolchain, ToolchainError, get_jest_toolchain
+from .pytest_pool import PytestWorkerPool, get_pytest_pool
+from .generated_test_cache import GeneratedTestCache
+from .execution_history import ExecutionHistory
+from .source_diff import changed_symbols, parse_unified_diff
+from .impact_index import TestImpactIndex, get_test_impact_registry
+from .coverage_data import CoverageBudget, load_coverage_report
+from .risk_index import RiskIndex
+from .run_comparison import RunComparator, select_baseline_runs
+from .duration_stats import DurationStatsIndex, get_duration_stats_registry
 
-__all__ = ["GitHubClient", "ResponseParser"]
+__all__ = [
+    "GitHubClient", "ResponseParser", "WorkflowDAG", "SingleFlight", "request_fingerprint", "normalize_code",
+    "ErrorClassifier", "ErrorClusterIndex", "FailureMemory", "JestToolchain", "ToolchainError", "get_jest_toolchain",
+    "PytestWorkerPool", "get_pytest_pool", "GeneratedTestCache", "ExecutionHistory",
+    "changed_symbols", "parse_unified_diff", "TestImpactIndex", "get_test_impact_registry",
+    "CoverageBudget", "load_coverage_report", "RiskIndex",
+    "RunComparator", "select_baseline_runs", "DurationStatsIndex", "get_duration_stats_registry"
+]
 
+
+
+def __getattr__(name):
+    # GitHubClient kéo theo requests (~90ms import) - chỉ import khi thực sự dùng
+    if name == "GitHubClient":
+        from .github_client import GitHubClient
+        return GitHubClient
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
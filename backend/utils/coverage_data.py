@@ -0,0 +1,241 @@
+"""
+Coverage của generated tests - thu thập trong sandbox, lưu compact bằng bitmap
+
+- install_coverage_plugin(): copy plugin (utils/pytest_coverage_plugin.py) vào job directory thành
+  conftest.py; mỗi test chạy trong một coverage context riêng (pytest node id)
+- load_coverage_report(): coverage JSON -> dạng compact: mỗi file một bitmap statements, một bitmap
+  dòng đã chạy và một bitmap cho từng test (bit i = dòng i), base64
+- uncovered_functions(): functions/methods chưa được tests chạy qua (feedback cho analyze_code)
+- CoverageBudget: đo overhead (thời gian mỗi test có/không coverage) và chỉ thu thập coverage ở
+  một tỷ lệ runs sao cho overhead trung bình nằm trong budget
+"""
+import ast
+import base64
+import importlib.util
+import json
+import os
+import shutil
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+PLUGIN_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pytest_coverage_plugin.py")
+REPORT_FILE = "coverage.json"
+
+_available: Optional[bool] = None
+
+
+def coverage_available() -> bool:
+    """coverage.py có cài trong môi trường chạy tests không (check một lần)"""
+    global _available
+    if _available is None:
+        _available = importlib.util.find_spec("coverage") is not None
+    return _available
+
+
+def lines_to_bitmap(lines: Iterable[int]) -> str:
+    lines = [int(line) for line in lines if int(line) > 0]
+    if not lines:
+        return ""
+    bits = bytearray(max(lines) // 8 + 1)
+    for line in lines:
+        bits[line // 8] |= 1 << (line % 8)
+    return base64.b64encode(bytes(bits)).decode("ascii")
+
+
+def bitmap_to_lines(bitmap: str) -> List[int]:
+    if not bitmap:
+        return []
+    bits = base64.b64decode(bitmap)
+    return [i * 8 + b for i, byte in enumerate(bits) if byte for b in range(8) if byte & (1 << b)]
+
+
+def _or_bitmaps(bitmaps: Iterable[str]) -> str:
+    merged = bytearray()
+    for bitmap in bitmaps:
+        bits = base64.b64decode(bitmap) if bitmap else b""
+        if len(bits) > len(merged):
+            merged.extend(bytes(len(bits) - len(merged)))
+        for i, byte in enumerate(bits):
+            merged[i] |= byte
+    return base64.b64encode(bytes(merged)).decode("ascii") if any(merged) else ""
+
+
+def install_coverage_plugin(job_dir: str, include: List[str], branch: bool = True):
+    """Bật coverage cho pytest chạy trong job_dir (include: source files, path tương đối với job_dir)"""
+    shutil.copyfile(PLUGIN_SOURCE, os.path.join(job_dir, "conftest.py"))
+    with open(os.path.join(job_dir, ".testflow-coverage.json"), "w", encoding="utf-8") as f:
+        json.dump({"include": include, "branch": branch, "report": REPORT_FILE}, f)
+
+
+def load_coverage_report(job_dir: str, sources: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Đọc coverage JSON của job và chuyển sang dạng compact. sources ({path: code}) để tính
+    uncovered functions. None nếu không có report.
+    """
+    try:
+        with open(os.path.join(job_dir, REPORT_FILE), encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    files = {}
+    for path, data in (report.get("files") or {}).items():
+        tests: Dict[str, List[int]] = {}
+        for line, contexts in (data.get("contexts") or {}).items():
+            for context in contexts:
+                tests.setdefault(context, []).append(int(line))
+        summary = data.get("summary") or {}
+        files[path] = {
+            "statements": lines_to_bitmap((data.get("executed_lines") or []) + (data.get("missing_lines") or [])),
+            "executed": lines_to_bitmap(data.get("executed_lines") or []),
+            "tests": {context: lines_to_bitmap(lines) for context, lines in tests.items()},
+            "branches": [list(arc) for arc in data.get("executed_branches") or []],
+            "num_branches": summary.get("num_branches", 0)
+        }
+    return build_coverage(files, sources)
+
+
+def build_coverage(files: Dict[str, Dict[str, Any]], sources: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Thêm summary + uncovered functions cho dữ liệu compact theo file"""
+    statements = executed = num_branches = covered_branches = 0
+    uncovered = []
+    for path, data in files.items():
+        file_statements = set(bitmap_to_lines(data["statements"]))
+        file_executed = set(bitmap_to_lines(data["executed"])) & file_statements
+        statements += len(file_statements)
+        executed += len(file_executed)
+        num_branches += data.get("num_branches", 0)
+        covered_branches += min(len(data.get("branches") or []), data.get("num_branches", 0))
+        if sources and path in sources:
+            uncovered.extend(uncovered_functions(path, sources[path], file_statements, file_executed))
+    uncovered.sort(key=lambda f: (f["coverage"], f["file"], f["name"]))
+    return {
+        "files": files,
+        "summary": {
+            "statements": statements,
+            "covered_lines": executed,
+            "line_rate": round(executed / statements, 4) if statements else None,
+            "branches": num_branches,
+            "covered_branches": covered_branches,
+            "branch_rate": round(covered_branches / num_branches, 4) if num_branches else None,
+            "tests": len({test for data in files.values() for test in data["tests"] if test})
+        },
+        "uncovered_functions": uncovered
+    }
+
+
+def merge_coverage(parent: Dict[str, Any], new: Dict[str, Any], rerun_tests: Set[str], sources: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Coverage của run merge (incremental re-run, cùng source code): bitmap của các tests chạy lại thay
+    cho bitmap cũ, các tests khác giữ nguyên. Branches là hợp của hai runs (xấp xỉ).
+    """
+    files = {}
+    for path in set(parent.get("files", {})) | set(new.get("files", {})):
+        old = parent.get("files", {}).get(path) or {}
+        fresh = new.get("files", {}).get(path) or {}
+        tests = {test: bitmap for test, bitmap in (old.get("tests") or {}).items() if test not in rerun_tests}
+        tests.update(fresh.get("tests") or {})
+        arcs = {tuple(arc) for arc in (old.get("branches") or []) + (fresh.get("branches") or [])}
+        files[path] = {
+            "statements": fresh.get("statements") or old.get("statements", ""),
+            "executed": _or_bitmaps(tests.values()),
+            "tests": tests,
+            "branches": sorted(list(arc) for arc in arcs),
+            "num_branches": fresh.get("num_branches", old.get("num_branches", 0))
+        }
+    return build_coverage(files, sources)
+
+
+def uncovered_functions(path: str, source: str, statements: Set[int], executed: Set[int]) -> List[Dict[str, Any]]:
+    """Functions/methods có statement trong body chưa được chạy (coverage < 100%)"""
+    try:
+        tree = ast.parse(source or "")
+    except (SyntaxError, ValueError):
+        return []
+    functions = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions.append((node.name, node))
+        elif isinstance(node, ast.ClassDef):
+            functions.extend(
+                (f"{node.name}.{item.name}", item) for item in node.body
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef))
+            )
+    result = []
+    for name, node in functions:
+        # Dòng "def" chạy lúc import - chỉ tính body
+        body = {line for line in statements if node.body[0].lineno <= line <= node.end_lineno}
+        if not body:
+            continue
+        missing = sorted(body - executed)
+        if missing:
+            result.append({
+                "name": name,
+                "file": path,
+                "line": node.lineno,
+                "coverage": round(1 - len(missing) / len(body), 4),
+                "missing_lines": missing
+            })
+    return result
+
+
+class CoverageBudget:
+    """
+    Giữ overhead trung bình của coverage trong budget (0.3 = chậm hơn tối đa 30%)
+
+    So sánh thời gian mỗi test (EWMA) giữa runs có và không có coverage; nếu overhead vượt budget
+    thì chỉ thu thập coverage ở tỷ lệ budget / overhead số runs. Định kỳ chạy không coverage để
+    cập nhật baseline.
+    """
+
+    def __init__(self, budget: float = 0.3, min_samples: int = 3, baseline_every: int = 20, alpha: float = 0.2):
+        self.budget = budget
+        self.min_samples = min_samples
+        self.baseline_every = baseline_every
+        self.alpha = alpha
+        self._per_test = {True: None, False: None}
+        self._samples = {True: 0, False: 0}
+        self._runs = 0
+        self._credit = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def overhead(self) -> Optional[float]:
+        """Overhead ước lượng (0.25 = chậm hơn 25%); None khi chưa đủ mẫu"""
+        covered, plain = self._per_test[True], self._per_test[False]
+        if not covered or not plain or min(self._samples.values()) < self.min_samples:
+            return None
+        return max(0.0, covered / plain - 1)
+
+    def should_collect(self) -> bool:
+        with self._lock:
+            self._runs += 1
+            if self._samples[True] < self.min_samples:
+                return True
+            if self._samples[False] < self.min_samples or self._runs % self.baseline_every == 0:
+                return False
+            overhead = self.overhead
+            if overhead is None or overhead <= self.budget:
+                return True
+            # Tỷ lệ runs có coverage để overhead trung bình = budget
+            self._credit += self.budget / overhead
+            if self._credit >= 1:
+                self._credit -= 1
+                return True
+            return False
+
+    def record(self, covered: bool, duration_ms: float, tests: int):
+        per_test = duration_ms / max(tests, 1)
+        with self._lock:
+            previous = self._per_test[covered]
+            self._per_test[covered] = per_test if previous is None else (1 - self.alpha) * previous + self.alpha * per_test
+            self._samples[covered] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        overhead = self.overhead
+        return {
+            "budget": self.budget,
+            "overhead": round(overhead, 4) if overhead is not None else None,
+            "covered_runs": self._samples[True],
+            "plain_runs": self._samples[False]
+        }
@@ -0,0 +1,425 @@
+"""
+Duration statistics theo từng test - cập nhật streaming mỗi lần upload kết quả, phát hiện tests/suites chậm đi
+
+- Mean/variance: Welford; sau `window` runs chuyển sang trọng số mũ 1/window để baseline theo kịp
+  các thay đổi lâu dài (test chậm hẳn đi rồi được chấp nhận)
+- p95: P² (Jain & Chlamtac) - 5 markers, không giữ lại các giá trị đã thấy
+- Mỗi test mỗi run: một dict lookup + cập nhật O(1)
+
+Một test bị flag khi chậm hơn mean >= N sigma hoặc vượt p95 baseline (kèm ngưỡng tối thiểu theo ms).
+Suite (classname) bị flag khi tổng phần chậm hơn mean của các tests trong suite có ý nghĩa thống kê
+(variance của tổng = tổng variances) - không bị ảnh hưởng bởi tests mới thêm/bỏ.
+"""
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLDS = {
+    "sigma": 3.0,            # chậm hơn mean >= 3 std...
+    "p95_margin": 0.25,      # ...hoặc vượt p95 baseline >= 25%
+    "min_delta_ms": 50,      # và chậm hơn mean ít nhất 50ms
+    "min_samples": 5,        # số lần pass tối thiểu trước khi kiểm tra
+    "suite_min_ratio": 0.1,  # suite chậm hơn tổng mean >= 10%
+    "limit": 50
+}
+
+
+class P2Quantile:
+    """Ước lượng quantile p streaming bằng thuật toán P² (5 markers, O(1) mỗi update)"""
+
+    __slots__ = ("p", "count", "heights", "positions", "desired")
+
+    def __init__(self, p: float = 0.95):
+        self.p = p
+        self.count = 0
+        self.heights: List[float] = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+
+    def update(self, x: float):
+        self.count += 1
+        heights = self.heights
+        if self.count <= 5:
+            heights.append(x)
+            heights.sort()
+            return
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+        positions, desired, p = self.positions, self.desired, self.p
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        # desired[0] tăng 0
+        desired[1] += p / 2
+        desired[2] += p
+        desired[3] += (1 + p) / 2
+        desired[4] += 1
+        for i in (1, 2, 3):
+            d = desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+                heights[i] = height
+                positions[i] += d
+
+    def _parabolic(self, i: int, d: int) -> float:
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    @property
+    def value(self) -> Optional[float]:
+        if not self.heights:
+            return None
+        if self.count <= 5:
+            return self.heights[min(int(self.p * len(self.heights)), len(self.heights) - 1)]
+        return self.heights[2]
+
+    def to_list(self) -> list:
+        return [self.count, list(self.heights), list(self.positions), list(self.desired)]
+
+    @classmethod
+    def from_list(cls, data: list, p: float = 0.95) -> "P2Quantile":
+        quantile = cls(p)
+        quantile.count, quantile.heights, quantile.positions, quantile.desired = data[0], list(data[1]), list(data[2]), list(data[3])
+        return quantile
+
+
+class DurationStats:
+    """Mean / variance (Welford, cửa sổ mũ sau `window` mẫu) và p95 duration của một test"""
+
+    __slots__ = ("count", "mean", "var", "p95")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.var = 0.0
+        self.p95 = P2Quantile(0.95)
+
+    def update(self, x: float, window: int = 100):
+        self.count += 1
+        alpha = 1.0 / min(self.count, window)
+        diff = x - self.mean
+        self.mean += alpha * diff
+        # alpha = 1/n: đúng bằng Welford (population variance)
+        self.var = (1 - alpha) * (self.var + alpha * diff * diff)
+        self.p95.update(x)
+
+    @property
+    def std(self) -> float:
+        return self.var ** 0.5
+
+    def check(self, x: float, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Lý do x là một duration regression so với baseline hiện tại (None nếu không)"""
+        delta = x - self.mean
+        if self.count < options["min_samples"] or delta < options["min_delta_ms"]:
+            return None
+        # std của test rất ổn định có thể ~0 - sàn 5% mean / 1ms
+        z = delta / max(self.std, self.mean * 0.05, 1.0)
+        p95 = self.p95.value
+        reasons = []
+        if z >= options["sigma"]:
+            reasons.append("sigma")
+        if p95 is not None and x >= p95 * (1 + options["p95_margin"]):
+            reasons.append("p95")
+        if not reasons:
+            return None
+        return {
+            "duration_ms": round(x, 2),
+            "mean_ms": round(self.mean, 2),
+            "std_ms": round(self.std, 2),
+            "p95_ms": round(p95, 2) if p95 is not None else None,
+            "z_score": round(z, 2),
+            "delta_ms": round(delta, 2),
+            "samples": self.count,
+            "reasons": reasons
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        p95 = self.p95.value
+        return {
+            "samples": self.count,
+            "mean_ms": round(self.mean, 2),
+            "std_ms": round(self.std, 2),
+            "p95_ms": round(p95, 2) if p95 is not None else None
+        }
+
+    def to_list(self) -> list:
+        return [self.count, self.mean, self.var, self.p95.to_list()]
+
+    @classmethod
+    def from_list(cls, data: list) -> "DurationStats":
+        stats = cls()
+        stats.count, stats.mean, stats.var = data[0], data[1], data[2]
+        stats.p95 = P2Quantile.from_list(data[3])
+        return stats
+
+
+def stats_key(test: Dict[str, Any]) -> str:
+    """Tên đầy đủ của test: name nếu đã gồm classname ("pkg.Class.test_x" từ TestingAgent), nếu không "classname::name" """
+    classname, name = test.get("classname") or "", str(test.get("name", ""))
+    return f"{classname}::{name}" if classname and not name.startswith(classname) else name
+
+
+class DurationStatsIndex:
+    """
+    Usage:
+        index = DurationStatsIndex("my-app")
+        report = index.ingest(parsed_data["tests"], run_id="#1234")
+        # {"tests": [...flagged...], "suites": [...], "run": {...}, ...}
+    """
+
+    def __init__(self, project: str = "default", window: int = 100):
+        self.project = project
+        self.window = window
+        self.tests: Dict[str, DurationStats] = {}
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    def ingest(
+        self,
+        tests: List[Dict[str, Any]],
+        run_id: Optional[str] = None,
+        thresholds: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Kiểm tra duration của các tests pass trong run so với baseline rồi cập nhật baseline.
+        Trả về tests bị flag (chậm nhất trước), suites bị flag và tổng của cả run.
+        """
+        options = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+        min_samples, window = options["min_samples"], self.window
+        flagged = []
+        # suite -> [tổng delta, tổng mean, tổng variance, số tests]; total cho cả run
+        suites: Dict[str, List[float]] = {}
+        total = [0.0, 0.0, 0.0, 0]
+        with self._lock:
+            for test in tests:
+                duration = test.get("duration")
+                if test.get("status") != "pass" or type(duration) not in (int, float):
+                    continue
+                key = stats_key(test)
+                stats = self.tests.get(key)
+                if stats is None:
+                    stats = self.tests[key] = DurationStats()
+                elif stats.count >= min_samples:
+                    finding = stats.check(duration, options)
+                    if finding is not None:
+                        flagged.append({"test": key, "name": test.get("name", ""), **finding})
+                    suite_name = test.get("classname") or ""
+                    suite = suites.get(suite_name)
+                    if suite is None:
+                        suite = suites[suite_name] = [0.0, 0.0, 0.0, 0]
+                    delta = duration - stats.mean
+                    suite[0] += delta
+                    suite[1] += stats.mean
+                    suite[2] += stats.var
+                    suite[3] += 1
+                    total[0] += delta
+                    total[1] += stats.mean
+                    total[2] += stats.var
+                    total[3] += 1
+                stats.update(duration, window)
+            self.runs += 1
+
+        # Chỉ build report cho suites bị flag
+        slow_suites = sorted(
+            (self._suite_report(name, *values, options) for name, values in suites.items()
+             if self._suite_flagged(*values, options)),
+            key=lambda s: s["delta_ms"], reverse=True
+        )
+        limit = int(options["limit"])
+        flagged.sort(key=lambda f: f["delta_ms"], reverse=True)
+        return {
+            "run_id": run_id,
+            "project": self.project,
+            "checked_tests": total[3],
+            "total_flagged": len(flagged),
+            "tests": flagged[:limit],
+            "suites": slow_suites[:limit],
+            "run": self._suite_report(None, *total, options)
+        }
+
+    @staticmethod
+    def _suite_z(delta: float, mean: float, var: float, tests: int) -> float:
+        # Tests độc lập: variance của tổng = tổng variances
+        return delta / max(var ** 0.5, mean * 0.05, 1.0) if tests else 0.0
+
+    @classmethod
+    def _suite_flagged(cls, delta: float, mean: float, var: float, tests: int, options: Dict[str, Any]) -> bool:
+        return bool(
+            tests and delta >= options["min_delta_ms"]
+            and (delta / mean if mean > 0 else 0.0) >= options["suite_min_ratio"]
+            and cls._suite_z(delta, mean, var, tests) >= options["sigma"]
+        )
+
+    @classmethod
+    def _suite_report(cls, name: Optional[str], delta: float, mean: float, var: float, tests: int, options: Dict[str, Any]) -> Dict[str, Any]:
+        z = cls._suite_z(delta, mean, var, tests)
+        ratio = delta / mean if mean > 0 else 0.0
+        return {
+            **({"suite": name} if name is not None else {}),
+            "tests": int(tests),
+            "duration_ms": round(mean + delta, 2),
+            "expected_ms": round(mean, 2),
+            "delta_ms": round(delta, 2),
+            "ratio": round(ratio, 4),
+            "z_score": round(z, 2),
+            "flagged": cls._suite_flagged(delta, mean, var, tests, options)
+        }
+
+    def slowest(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Tests có p95 lớn nhất"""
+        with self._lock:
+            items = list(self.tests.items())
+        top = heapq.nlargest(limit, items, key=lambda item: item[1].p95.value or 0.0)
+        return [{"test": key, **stats.summary()} for key, stats in top]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        stats = self.tests.get(key)
+        return stats.summary() if stats is not None else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"project": self.project, "runs": self.runs, "tests": len(self.tests), "window": self.window}
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "project": self.project,
+                "window": self.window,
+                "runs": self.runs,
+                "tests": {key: stats.to_list() for key, stats in self.tests.items()}
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DurationStatsIndex":
+        index = cls(data.get("project", "default"), data.get("window", 100))
+        index.runs = data.get("runs", 0)
+        index.tests = {key: DurationStats.from_list(value) for key, value in (data.get("tests") or {}).items()}
+        return index
+
+
+class DurationStatsRegistry:
+    """Một DurationStatsIndex cho mỗi project; optional lưu JSON trên disk (mỗi project một file)"""
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        window: int = 100,
+        save_every: int = 20,
+        save_interval: float = 60.0
+    ):
+        self.directory = os.path.expanduser(directory) if directory else None
+        self.window = window
+        self.save_every = max(1, int(save_every))
+        self.save_interval = save_interval
+        self._indexes: Dict[str, DurationStatsIndex] = {}
+        # project -> số ingests chưa ghi ra disk / thời điểm ghi gần nhất
+        self._dirty: Dict[str, int] = {}
+        self._last_save: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, project: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", project) or "default"
+        return os.path.join(self.directory, f"{safe}.json")
+
+    def get(self, project: str = "default") -> DurationStatsIndex:
+        with self._lock:
+            index = self._indexes.get(project)
+            if index is None:
+                index = self._load(project) or DurationStatsIndex(project, self.window)
+                self._indexes[project] = index
+            return index
+
+    def has(self, project: str) -> bool:
+        with self._lock:
+            if project in self._indexes:
+                return True
+        return bool(self.directory) and os.path.exists(self._path(project))
+
+    def _load(self, project: str) -> Optional[DurationStatsIndex]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(project), encoding="utf-8") as f:
+                return DurationStatsIndex.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, IndexError, TypeError) as e:
+            logger.warning(f"Không đọc được duration stats của {project}: {e}")
+            return None
+
+    def mark_dirty(self, project: str):
+        """
+        Ghi nhận một ingest. Serialize cả index là O(số tests của project) nên chỉ ghi ra disk
+        sau save_every ingests hoặc save_interval giây; phần còn lại được ghi bởi flush()
+        """
+        if not self.directory:
+            return
+        now = time.monotonic()
+        with self._lock:
+            pending = self._dirty[project] = self._dirty.get(project, 0) + 1
+            due = pending >= self.save_every or now - self._last_save.setdefault(project, now) >= self.save_interval
+        if due:
+            self.save(project)
+
+    def flush(self):
+        """Ghi các projects còn ingests chưa lưu (gọi lúc shutdown)"""
+        with self._lock:
+            projects = [project for project, pending in self._dirty.items() if pending]
+        for project in projects:
+            self.save(project)
+
+    def save(self, project: str):
+        if not self.directory:
+            return
+        index = self.get(project)
+        with self._lock:
+            pending = self._dirty.pop(project, 0)
+            self._last_save[project] = time.monotonic()
+        path = self._path(project)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(index.to_dict(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Không ghi được duration stats của {project}: {e}")
+            with self._lock:
+                self._dirty[project] = self._dirty.get(project, 0) + pending
+
+
+_default_registry: Optional[DurationStatsRegistry] = None
+_default_lock = threading.Lock()
+
+
+def get_duration_stats_registry() -> DurationStatsRegistry:
+    """Registry dùng chung trong process, cấu hình từ Config (DURATION_STATS_DIR, DURATION_STATS_WINDOW, INDEX_SAVE_*)"""
+    global _default_registry
+    if _default_registry is None:
+        with _default_lock:
+            if _default_registry is None:
+                from config import Config
+                _default_registry = DurationStatsRegistry(
+                    Config.DURATION_STATS_DIR, Config.DURATION_STATS_WINDOW,
+                    save_every=Config.INDEX_SAVE_EVERY, save_interval=Config.INDEX_SAVE_INTERVAL
+                )
+    return _default_registry
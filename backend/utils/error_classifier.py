@@ -0,0 +1,305 @@
+"""
+Error classifier - phân loại lỗi test cục bộ (không gọi LLM) cho các loại lỗi phổ biến
+
+- Rule table (regex) trên error message + stack trace
+- Model TF-IDF + nearest centroid (linear), train trên lịch sử analyses do LLM gán nhãn
+
+Chỉ kết quả có confidence >= threshold mới được dùng, lỗi còn lại vẫn gửi cho LLM.
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict, deque
+from typing import Dict, Any, List, Optional, Tuple
+
+from .telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# category, severity, cause, suggestion, patterns (trên text lowercase)
+RULES: List[Tuple[str, str, str, str, Tuple[str, ...]]] = [
+    (
+        "timeout", "medium",
+        "Test timeout - có thể do network chậm hoặc test quá phức tạp",
+        "1. Tăng timeout value\n2. Kiểm tra network connection\n3. Optimize test code",
+        (r"\btimeout(error|exception)?\b", r"\btimed out\b", r"exceeded timeout", r"deadline exceeded"),
+    ),
+    (
+        "assertion", "high",
+        "Assertion failed - kết quả không khớp với expected",
+        "1. Kiểm tra expected value\n2. Kiểm tra actual output\n3. Review test logic",
+        (r"\bassertionerror\b", r"\bassert(ion)? failed\b", r"\bexpected\b.{0,80}\b(but (was|got)|got|received|to (be|equal))\b",
+         r"\bexpect\(.*\)\.to"),
+    ),
+    (
+        "null_reference", "high",
+        "Null/Undefined reference - biến chưa được khởi tạo",
+        "1. Kiểm tra initialization\n2. Thêm null checks\n3. Review data flow",
+        (r"\bnullpointerexception\b", r"cannot read propert(y|ies) of (null|undefined)", r"'nonetype' object",
+         r"\bundefined is not\b", r"\bnullreferenceexception\b"),
+    ),
+    (
+        "network", "medium",
+        "Lỗi kết nối tới service phụ thuộc",
+        "1. Kiểm tra service/endpoint có đang chạy\n2. Kiểm tra network/DNS\n3. Mock service phụ thuộc trong test",
+        (r"\beconnrefused\b", r"\bconnection (refused|reset|aborted)\b", r"\bconnectionerror\b", r"\benotfound\b",
+         r"\bsocket hang up\b", r"\bgetaddrinfo\b"),
+    ),
+    (
+        "authentication", "high",
+        "Xác thực thất bại - token/credentials không hợp lệ hoặc hết hạn",
+        "1. Kiểm tra credentials/token dùng trong test\n2. Kiểm tra token expiry\n3. Review auth setup/fixtures",
+        (r"\b401\b", r"\bunauthorized\b", r"authentication failed", r"invalid (token|credentials)"),
+    ),
+    (
+        "authorization", "medium",
+        "Không có quyền truy cập resource",
+        "1. Kiểm tra role/permission của test user\n2. Kiểm tra quyền file/thư mục\n3. Review access policy",
+        (r"\b403\b", r"\bforbidden\b", r"permission denied", r"access denied"),
+    ),
+    (
+        "dependency", "high",
+        "Thiếu module/dependency khi chạy test",
+        "1. Cài dependency còn thiếu\n2. Kiểm tra import path\n3. Kiểm tra môi trường CI (requirements/package.json)",
+        (r"\bmodulenotfounderror\b", r"\bimporterror\b", r"cannot find module", r"no module named",
+         r"\bclassnotfoundexception\b"),
+    ),
+    (
+        "syntax", "high",
+        "Lỗi cú pháp trong code hoặc test",
+        "1. Kiểm tra dòng báo lỗi trong stack trace\n2. Chạy linter/compiler\n3. Review thay đổi gần nhất",
+        (r"\bsyntaxerror\b", r"\bunexpected token\b", r"\bindentationerror\b"),
+    ),
+]
+
+_RULES_BY_CATEGORY = {rule[0]: rule for rule in RULES}
+# Một regex (named group theo category) để match toàn bộ rule table trong một lần quét
+_RULES_RE = re.compile("|".join(
+    f"(?P<{category}>{'|'.join(patterns)})" for category, _, _, _, patterns in RULES
+))
+
+# Phần thay đổi giữa các lần chạy (địa chỉ, số, string literal, path) được bỏ khi normalize
+_NORMALIZE_PATTERNS = [
+    (re.compile(r"0x[0-9a-f]+"), " "),
+    (re.compile(r"(['\"]).*?\1"), " "),
+    (re.compile(r"[\w./\\-]+\.(py|js|ts|java|go|rb|cs|php|kt|rs)\b"), " "),
+    (re.compile(r"\d+"), " "),
+]
+_TOKEN_RE = re.compile(r"[a-z_][a-z_]+")
+MAX_STACK_LINES = 20
+
+
+def normalize_error_text(error_message: Optional[str], stack_trace: Optional[str] = None) -> str:
+    """Lowercase error message + các frame đầu của stack trace, bỏ phần thay đổi giữa các lần chạy"""
+    stack = "\n".join((stack_trace or "").splitlines()[:MAX_STACK_LINES])
+    text = f"{error_message or ''}\n{stack}".lower()
+    for pattern, replacement in _NORMALIZE_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def error_tokens(normalized_text: str) -> List[str]:
+    return _TOKEN_RE.findall(normalized_text)
+
+
+def error_features(normalized_text: str) -> Counter:
+    """Unigrams + bigrams của normalized error text"""
+    tokens = error_tokens(normalized_text)
+    features = Counter(tokens)
+    features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return features
+
+
+class ErrorClassifier:
+    """
+    Phân loại lỗi local trước khi gọi LLM
+
+    Usage:
+        classifier = ErrorClassifier(threshold=0.85)
+        analysis = classifier.classify(test_name, error_message, stack_trace)
+        if analysis is None:
+            analysis = llm_analysis(...)
+            classifier.learn(error_message, stack_trace, analysis)
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        min_samples: int = 5,
+        history_path: Optional[str] = None,
+        max_history: int = 5000,
+        refit_every: int = 20,
+        min_similarity: float = 0.5
+    ):
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.history_path = history_path
+        self.refit_every = refit_every
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self._history: deque = deque(maxlen=max_history)
+        self._unfitted = 0
+        self._idf: Dict[str, float] = {}
+        self._centroids: Dict[str, Dict[str, float]] = {}
+        self._examples: Dict[str, List[Tuple[Dict[str, float], Dict[str, Any]]]] = {}
+        if history_path:
+            self._load_history(history_path)
+
+    def classify(
+        self,
+        test_name: str,
+        error_message: Optional[str],
+        stack_trace: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Trả về analysis nếu confidence >= threshold, ngược lại None (cần LLM)"""
+        result = self._classify_rules(error_message, stack_trace)
+        if result is None or result["confidence"] < self.threshold:
+            model_result = self._classify_model(normalize_error_text(error_message, stack_trace))
+            if model_result and (result is None or model_result["confidence"] > result["confidence"]):
+                result = model_result
+
+        if result is None or result["confidence"] < self.threshold:
+            self._record("miss")
+            return None
+        self._record(result["source"])
+        return {"name": test_name, **result}
+
+    def learn(self, error_message: Optional[str], stack_trace: Optional[str], analysis: Dict[str, Any]):
+        """Thêm một analysis do LLM gán nhãn vào history (model được fit lại sau refit_every samples)"""
+        category = analysis.get("category")
+        if not category or category == "unknown" or not analysis.get("cause"):
+            return
+        sample = {
+            "text": normalize_error_text(error_message, stack_trace),
+            "category": str(category).lower(),
+            "severity": analysis.get("severity", "medium"),
+            "cause": analysis.get("cause"),
+            "suggestion": analysis.get("suggestion", "")
+        }
+        with self._lock:
+            self._history.append(sample)
+            self._unfitted += 1
+            if self.history_path:
+                try:
+                    with open(self.history_path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(sample, ensure_ascii=False) + "\n")
+                except OSError as e:
+                    logger.warning(f"Không ghi được error classifier history: {e}")
+
+    def fit(self):
+        """Fit TF-IDF + centroid theo category từ history"""
+        with self._lock:
+            samples = list(self._history)
+            self._unfitted = 0
+        counts = Counter(s["category"] for s in samples)
+        samples = [s for s in samples if counts[s["category"]] >= self.min_samples]
+
+        features = [error_features(s["text"]) for s in samples]
+        document_frequency = Counter()
+        for f in features:
+            document_frequency.update(f.keys())
+        n = len(samples)
+        idf = {term: math.log((1 + n) / (1 + df)) + 1 for term, df in document_frequency.items()}
+
+        sums: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        examples: Dict[str, List[Tuple[Dict[str, float], Dict[str, Any]]]] = defaultdict(list)
+        for sample, f in zip(samples, features):
+            vector = self._vectorize(f, idf)
+            for term, weight in vector.items():
+                sums[sample["category"]][term] += weight
+            examples[sample["category"]].append((vector, sample))
+        centroids = {category: self._unit(dict(total)) for category, total in sums.items()}
+
+        with self._lock:
+            self._idf = idf
+            self._centroids = centroids
+            self._examples = dict(examples)
+
+    def _classify_rules(self, error_message: Optional[str], stack_trace: Optional[str]) -> Optional[Dict[str, Any]]:
+        stack = "\n".join((stack_trace or "").splitlines()[:MAX_STACK_LINES])
+        text = f"{error_message or ''}\n{stack}".lower()
+        matches = list(dict.fromkeys(m.lastgroup for m in _RULES_RE.finditer(text)))
+        if not matches:
+            return None
+        category, severity, cause, suggestion, _ = _RULES_BY_CATEGORY[matches[0]]
+        # Nhiều loại lỗi cùng khớp (ví dụ assertion + timeout) - để LLM quyết định
+        confidence = 0.95 if len(matches) == 1 else 0.5
+        return {
+            "cause": cause,
+            "suggestion": suggestion,
+            "severity": severity,
+            "category": category,
+            "confidence": confidence,
+            "source": "rules"
+        }
+
+    def _classify_model(self, normalized_text: str) -> Optional[Dict[str, Any]]:
+        if self._unfitted >= self.refit_every or (self._unfitted and not self._centroids):
+            self.fit()
+        with self._lock:
+            idf, centroids, examples = self._idf, self._centroids, self._examples
+        # Softmax trên một category luôn = 1.0 - cần ít nhất hai categories để confidence có nghĩa
+        if len(centroids) < 2:
+            return None
+
+        vector = self._vectorize(error_features(normalized_text), idf)
+        if not vector:
+            return None
+        scores = {category: self._dot(vector, centroid) for category, centroid in centroids.items()}
+        category = max(scores, key=scores.get)
+
+        # Softmax trên cosine similarity làm xác suất, và lỗi phải đủ giống một lỗi đã biết
+        exps = {c: math.exp(10 * s) for c, s in scores.items()}
+        probability = exps[category] / sum(exps.values())
+        similarity, nearest = max(
+            ((self._dot(vector, example_vector), sample) for example_vector, sample in examples[category]),
+            key=lambda item: item[0]
+        )
+        confidence = probability if similarity >= self.min_similarity else probability * similarity
+        return {
+            "cause": nearest["cause"],
+            "suggestion": nearest["suggestion"],
+            "severity": nearest["severity"],
+            "category": category,
+            "confidence": round(confidence, 4),
+            "source": "model"
+        }
+
+    def _load_history(self, path: str):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        self._history.append(json.loads(line))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được error classifier history {path}: {e}")
+        self._unfitted = len(self._history)
+
+    @staticmethod
+    def _vectorize(features: Counter, idf: Dict[str, float]) -> Dict[str, float]:
+        vector = {term: (1 + math.log(count)) * idf[term] for term, count in features.items() if term in idf}
+        return ErrorClassifier._unit(vector)
+
+    @staticmethod
+    def _unit(vector: Dict[str, float]) -> Dict[str, float]:
+        norm = math.sqrt(sum(w * w for w in vector.values()))
+        return {term: w / norm for term, w in vector.items()} if norm else {}
+
+    @staticmethod
+    def _dot(a: Dict[str, float], b: Dict[str, float]) -> float:
+        if len(a) > len(b):
+            a, b = b, a
+        return sum(w * b.get(term, 0.0) for term, w in a.items())
+
+    def _record(self, outcome: str):
+        telemetry.metrics.inc(
+            "testflow_error_classifier_total",
+            help_text="Kết quả phân loại lỗi local (rules|model: không cần LLM, miss: gửi LLM)",
+            outcome=outcome
+        )
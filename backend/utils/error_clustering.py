@@ -0,0 +1,197 @@
+"""
+Error clustering - gom nhóm lỗi gần giống nhau bằng MinHash signatures + LSH banding
+
+Index giữ clusters giữa các lần chạy: failure mới được gán vào cluster đã có
+(nếu đủ giống) hoặc tạo cluster mới. Mỗi lần gán chỉ so với candidates cùng LSH bucket
+nên chi phí gần tuyến tính theo số failures.
+"""
+import functools
+import random
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+from .error_classifier import normalize_error_text, error_tokens
+
+# Prime 31-bit: a * h + b < 2^63 nên numpy (uint64) và Python cho cùng signature
+_MERSENNE_PRIME = (1 << 31) - 1
+_MAX_HASH = _MERSENNE_PRIME
+
+_numpy = None
+_numpy_loaded = False
+
+
+def get_numpy():
+    """numpy là optional - chỉ import lần đầu cần dùng"""
+    global _numpy, _numpy_loaded
+    if not _numpy_loaded:
+        _numpy_loaded = True
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = None
+    return _numpy
+
+
+def error_shingles(normalized_text: str, size: int = 3) -> set:
+    """Word shingles (hash 32-bit ổn định giữa các process) của normalized error text"""
+    tokens = error_tokens(normalized_text)
+    if len(tokens) < size:
+        return {zlib.crc32(" ".join(tokens).encode("utf-8"))} if tokens else set()
+    return {
+        zlib.crc32(" ".join(tokens[i:i + size]).encode("utf-8"))
+        for i in range(len(tokens) - size + 1)
+    }
+
+
+class MinHasher:
+    """MinHash với num_perm hàm hash dạng (a*x + b) mod p (seed cố định để signature ổn định)"""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._perms = [
+            (rng.randint(1, _MERSENNE_PRIME - 1), rng.randint(0, _MERSENNE_PRIME - 1))
+            for _ in range(num_perm)
+        ]
+        self._np_perms = None
+
+    def signature(self, shingles: set) -> Tuple[int, ...]:
+        if not shingles:
+            return (_MAX_HASH,) * self.num_perm
+        hashes = [h % _MERSENNE_PRIME for h in shingles]
+        np = get_numpy()
+        if np is not None and len(hashes) > 4:
+            if self._np_perms is None:
+                self._np_perms = (
+                    np.array([a for a, _ in self._perms], dtype=np.uint64),
+                    np.array([b for _, b in self._perms], dtype=np.uint64)
+                )
+            a, b = self._np_perms
+            values = np.array(hashes, dtype=np.uint64)[:, None] * a + b
+            return tuple((values % _MERSENNE_PRIME).min(axis=0).tolist())
+        return tuple(
+            min([(a * h + b) % _MERSENNE_PRIME for h in hashes])
+            for a, b in self._perms
+        )
+
+    @staticmethod
+    def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+        """Ước lượng Jaccard similarity từ hai signatures"""
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class ErrorClusterIndex:
+    """
+    Clusters lỗi tăng dần theo thời gian (giữ giữa các test runs)
+
+    bands * rows phải bằng num_perm. Với 16 bands x 4 rows, cặp lỗi có Jaccard ~0.5
+    có khoảng 2/3 khả năng chung ít nhất một bucket; similarity_threshold quyết định gán.
+
+    Band keys của members được index để lỗi "trôi" dần vẫn tìm được cluster, nhưng tối đa
+    max_keys_per_cluster keys mỗi cluster (mặc định 4 * bands) nên bộ nhớ tỉ lệ với số clusters.
+    Clusters giữ theo thứ tự LRU (last_seen): khi đủ max_clusters, cluster lâu nhất không gặp
+    bị bỏ, chỉ chạm vào buckets của chính nó.
+
+    Usage:
+        index = ErrorClusterIndex()
+        cluster_id, is_new = index.assign(error_message, stack_trace, label="AssertionError ...")
+    """
+
+    def __init__(
+        self,
+        num_perm: int = 64,
+        bands: int = 16,
+        similarity_threshold: float = 0.5,
+        max_clusters: int = 50000,
+        max_keys_per_cluster: Optional[int] = None
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm phải chia hết cho bands")
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.similarity_threshold = similarity_threshold
+        self.max_clusters = max_clusters
+        self.max_keys_per_cluster = max_keys_per_cluster or 4 * bands
+        self._lock = threading.Lock()
+        self._buckets: Dict[Tuple[int, Tuple[int, ...]], List[str]] = defaultdict(list)
+        self._clusters: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+        self._band_keys: Dict[str, set] = {}
+        self._next_id = 1
+        # Lỗi lặp lại (cùng normalized text) không cần tính lại signature
+        self._signature_for = functools.lru_cache(maxsize=4096)(
+            lambda normalized: self.hasher.signature(error_shingles(normalized))
+        )
+
+    def __len__(self) -> int:
+        return len(self._clusters)
+
+    def assign(
+        self,
+        error_message: Optional[str],
+        stack_trace: Optional[str] = None,
+        label: Optional[str] = None
+    ) -> Tuple[str, bool]:
+        """Gán failure vào cluster giống nhất (hoặc cluster mới); trả về (cluster_id, is_new)"""
+        signature = self._signature_for(normalize_error_text(error_message, stack_trace))
+        return self.assign_signature(signature, label or (error_message or "").strip().split("\n")[0][:120])
+
+    def assign_signature(self, signature: Tuple[int, ...], label: str = "") -> Tuple[str, bool]:
+        band_keys = [
+            (band, signature[band * self.rows:(band + 1) * self.rows])
+            for band in range(self.bands)
+        ]
+        with self._lock:
+            best_id, best_similarity = None, 0.0
+            seen = set()
+            for key in band_keys:
+                for cluster_id in self._buckets.get(key, ()):
+                    if cluster_id in seen:
+                        continue
+                    seen.add(cluster_id)
+                    similarity = self.hasher.similarity(signature, self._signatures[cluster_id])
+                    if similarity > best_similarity:
+                        best_id, best_similarity = cluster_id, similarity
+
+            is_new = best_id is None or best_similarity < self.similarity_threshold
+            if is_new:
+                if len(self._clusters) >= self.max_clusters:
+                    self._evict_oldest()
+                best_id = f"c{self._next_id}"
+                self._next_id += 1
+                self._clusters[best_id] = {"id": best_id, "label": label, "count": 0, "first_seen": time.time()}
+                self._signatures[best_id] = signature
+                self._band_keys[best_id] = set()
+            else:
+                self._clusters.move_to_end(best_id)
+            indexed = self._band_keys[best_id]
+            for key in band_keys:
+                if len(indexed) >= self.max_keys_per_cluster:
+                    break
+                if key not in indexed:
+                    indexed.add(key)
+                    self._buckets[key].append(best_id)
+            cluster = self._clusters[best_id]
+            cluster["count"] += 1
+            cluster["last_seen"] = time.time()
+        return best_id, is_new
+
+    def cluster(self, cluster_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cluster = self._clusters.get(cluster_id)
+            return dict(cluster) if cluster else None
+
+    def _evict_oldest(self):
+        oldest, _ = self._clusters.popitem(last=False)
+        del self._signatures[oldest]
+        for key in self._band_keys.pop(oldest):
+            bucket = self._buckets.get(key)
+            if bucket:
+                bucket.remove(oldest)
+                if not bucket:
+                    del self._buckets[key]
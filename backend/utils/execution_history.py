@@ -0,0 +1,107 @@
+"""
+Execution history - lưu inputs + kết quả của các lần execute test code theo run_id
+
+Cần cho incremental re-run: run mới chỉ chạy lại một phần tests của run cha (parent_run_id),
+nên phải giữ test code, source code, test cases và node id của từng test. LRU trong memory,
+optional mỗi run một file JSON trên disk (để re-run được sau khi restart hoặc giữa các workers).
+"""
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionHistory:
+    """
+    Usage:
+        history = ExecutionHistory(max_runs=200)
+        history.put("#1234", {"test_code": ..., "original_code": ..., "results": [...]})
+        record = history.get("#1234")
+    """
+
+    def __init__(self, max_runs: int = 200, directory: Optional[str] = None):
+        self.max_runs = max_runs
+        self.directory = os.path.expanduser(directory) if directory else None
+        self._runs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def __contains__(self, run_id: str) -> bool:
+        with self._lock:
+            if run_id in self._runs:
+                return True
+        return bool(self.directory) and os.path.exists(self._path(run_id))
+
+    def get(self, run_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._runs.get(run_id)
+            if record is not None:
+                self._runs.move_to_end(run_id)
+        if record is None and self.directory:
+            record = self._read(run_id)
+            if record is not None:
+                self._remember(run_id, record)
+        return copy.deepcopy(record) if record is not None else None
+
+    def put(self, run_id: str, record: Dict[str, Any]):
+        record = copy.deepcopy(record)
+        self._remember(run_id, record)
+        if self.directory:
+            self._write(run_id, record)
+
+    def _remember(self, run_id: str, record: Dict[str, Any]):
+        with self._lock:
+            self._runs[run_id] = record
+            self._runs.move_to_end(run_id)
+            while len(self._runs) > self.max_runs:
+                self._runs.popitem(last=False)
+
+    def _path(self, run_id: str) -> str:
+        # run_id do client gửi lên ("#1234") - không dùng trực tiếp làm tên file
+        name = hashlib.sha256(run_id.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, f"{name}.json")
+
+    def _read(self, run_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(run_id), encoding="utf-8") as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được execution {run_id}: {e}")
+            return None
+        return record if record.get("run_id") == run_id else None
+
+    def _write(self, run_id: str, record: Dict[str, Any]):
+        path = self._path(run_id)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Không ghi được execution {run_id}: {e}")
+            return
+        self._evict_disk()
+
+    def _evict_disk(self):
+        """Giữ tối đa max_runs files mới nhất trên disk"""
+        try:
+            files = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".json")]
+        except OSError:
+            return
+        if len(files) <= self.max_runs:
+            return
+        files.sort(key=lambda path: os.path.getmtime(path) if os.path.exists(path) else 0)
+        for path in files[:len(files) - self.max_runs]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,202 @@
+"""
+Failure memory - vector index các failure signatures đã phân tích và analysis tương ứng
+
+- Embedding: hashed n-grams (feature hashing) của normalized error text, không cần model/service ngoài
+- Search: brute-force (numpy nếu có, nếu không thì sparse dot product thuần Python);
+  index lớn dùng HNSW (hnswlib, optional)
+
+Failure mới đủ giống một failure đã biết thì dùng lại analysis, hoặc đưa vào prompt làm ví dụ.
+"""
+import heapq
+import json
+import logging
+import math
+import os
+import threading
+import zlib
+from typing import Dict, Any, List, Optional, Tuple
+
+from .error_classifier import normalize_error_text, error_features
+from .error_clustering import get_numpy
+
+logger = logging.getLogger(__name__)
+
+
+def embed_failure(
+    error_message: Optional[str],
+    stack_trace: Optional[str] = None,
+    dim: int = 512
+) -> Dict[int, float]:
+    """Sparse embedding (index -> weight, L2 normalized) bằng signed hashing của unigrams + bigrams"""
+    vector: Dict[int, float] = {}
+    for feature, count in error_features(normalize_error_text(error_message, stack_trace)).items():
+        h = zlib.crc32(feature.encode("utf-8"))
+        index = h % dim
+        sign = 1.0 if (h >> 31) & 1 else -1.0
+        vector[index] = vector.get(index, 0.0) + sign * (1 + math.log(count))
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    return {i: w / norm for i, w in vector.items() if w} if norm else {}
+
+
+class FailureMemory:
+    """
+    Usage:
+        memory = FailureMemory()
+        matches = memory.search(error_message, stack_trace)   # [(similarity, analysis)]
+        ...
+        memory.add(error_message, stack_trace, analysis)       # analysis đã được chấp nhận (từ LLM)
+    """
+
+    def __init__(
+        self,
+        dim: int = 512,
+        max_entries: int = 20000,
+        hnsw_threshold: int = 5000,
+        path: Optional[str] = None,
+        dedupe_similarity: float = 0.99
+    ):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.hnsw_threshold = hnsw_threshold
+        self.path = path
+        self.dedupe_similarity = dedupe_similarity
+        self._lock = threading.RLock()
+        # Ring buffer: slot i chứa entry thứ i (mod max_entries), slot cũng là label trong HNSW index
+        self._vectors: List[Dict[int, float]] = []
+        self._analyses: List[Dict[str, Any]] = []
+        self._next_slot = 0
+        # Brute-force search: dense matrix (numpy) hoặc inverted index dim -> {slot: weight}
+        self._np = get_numpy()
+        self._matrix = self._np.zeros((64, dim), dtype=self._np.float32) if self._np is not None else None
+        self._postings: Dict[int, Dict[int, float]] = {}
+        self._hnsw = None
+        if path:
+            self._load(path)
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def search(
+        self,
+        error_message: Optional[str],
+        stack_trace: Optional[str] = None,
+        k: int = 1
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """k analyses giống nhất (cosine similarity giảm dần)"""
+        vector = embed_failure(error_message, stack_trace, self.dim)
+        if not vector:
+            return []
+        with self._lock:
+            return [(similarity, dict(self._analyses[slot])) for similarity, slot in self._search(vector, k)]
+
+    def add(self, error_message: Optional[str], stack_trace: Optional[str], analysis: Dict[str, Any]):
+        vector = embed_failure(error_message, stack_trace, self.dim)
+        if not vector or not analysis.get("cause"):
+            return
+        entry = {key: analysis.get(key) for key in ("cause", "suggestion", "severity", "category")}
+        with self._lock:
+            # Failure đã có (gần như trùng) thì cập nhật analysis thay vì thêm entry mới
+            nearest = self._search(vector, 1)
+            if nearest and nearest[0][0] >= self.dedupe_similarity:
+                self._analyses[nearest[0][1]] = entry
+            else:
+                self._put(vector, entry)
+            if self.path:
+                self._append_file(error_message, stack_trace, entry)
+
+    def _put(self, vector: Dict[int, float], entry: Dict[str, Any]):
+        slot = self._next_slot % self.max_entries
+        self._next_slot += 1
+        if slot < len(self._vectors):
+            self._unindex(slot)
+            self._vectors[slot] = vector
+            self._analyses[slot] = entry
+        else:
+            self._vectors.append(vector)
+            self._analyses.append(entry)
+        self._index(slot, vector)
+        if self._hnsw is not None:
+            self._hnsw.add_items(self._dense([vector]), [slot], num_threads=1)
+
+    def _search(self, vector: Dict[int, float], k: int) -> List[Tuple[float, int]]:
+        if not self._vectors:
+            return []
+        k = min(k, len(self._vectors))
+        if len(self._vectors) >= self.hnsw_threshold and self._ensure_hnsw():
+            labels, distances = self._hnsw.knn_query(self._dense([vector]), k=k, num_threads=1)
+            return [(1.0 - float(d), int(slot)) for slot, d in zip(labels[0], distances[0])]
+
+        if self._matrix is not None:
+            np = self._np
+            scores = self._matrix[:len(self._vectors)] @ self._dense([vector])[0]
+            top = np.argsort(-scores)[:k] if k > 1 else [int(np.argmax(scores))]
+            return [(float(scores[slot]), int(slot)) for slot in top]
+
+        scores: Dict[int, float] = {}
+        for i, w in vector.items():
+            for slot, stored in self._postings.get(i, {}).items():
+                scores[slot] = scores.get(slot, 0.0) + w * stored
+        return heapq.nlargest(k, ((score, slot) for slot, score in scores.items()))
+
+    def _index(self, slot: int, vector: Dict[int, float]):
+        if self._matrix is not None:
+            if slot >= len(self._matrix):
+                grown = self._np.zeros((min(self.max_entries, len(self._matrix) * 2), self.dim), dtype=self._np.float32)
+                grown[:len(self._matrix)] = self._matrix
+                self._matrix = grown
+            self._matrix[slot] = 0.0
+            for i, w in vector.items():
+                self._matrix[slot, i] = w
+        else:
+            for i, w in vector.items():
+                self._postings.setdefault(i, {})[slot] = w
+
+    def _unindex(self, slot: int):
+        if self._matrix is None:
+            for i in self._vectors[slot]:
+                self._postings.get(i, {}).pop(slot, None)
+
+    def _ensure_hnsw(self) -> bool:
+        if self._hnsw is not None:
+            return True
+        try:
+            import hnswlib
+        except ImportError:
+            return False
+        index = hnswlib.Index(space="ip", dim=self.dim)
+        index.init_index(max_elements=self.max_entries, ef_construction=64, M=16)
+        index.set_ef(64)
+        index.add_items(self._matrix[:len(self._vectors)], list(range(len(self._vectors))))
+        self._hnsw = index
+        logger.info(f"Failure memory: chuyển sang HNSW index ({len(self._vectors)} entries)")
+        return True
+
+    def _dense(self, vectors: List[Dict[int, float]]):
+        np = self._np
+        matrix = np.zeros((len(vectors), self.dim), dtype=np.float32)
+        for row, vector in enumerate(vectors):
+            for i, w in vector.items():
+                matrix[row, i] = w
+        return matrix
+
+    def _append_file(self, error_message: Optional[str], stack_trace: Optional[str], entry: Dict[str, Any]):
+        record = {"error": error_message, "stackTrace": stack_trace, "analysis": entry}
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.warning(f"Không ghi được failure memory: {e}")
+
+    def _load(self, path: str):
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding="utf-8") as f:
+                records = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được failure memory {path}: {e}")
+            return
+        for record in records[-self.max_entries:]:
+            vector = embed_failure(record.get("error"), record.get("stackTrace"), self.dim)
+            if vector and (record.get("analysis") or {}).get("cause"):
+                self._put(vector, record["analysis"])
@@ -0,0 +1,207 @@
+"""
+Generated-test artifact cache - content-addressed store của test code đã generate
+
+Key là sha256 của các input quyết định output (normalized source code, test cases, language,
+framework, model và ID version của prompt), nên sửa prompt/model tự động tạo key mới. Store gồm
+LRU trong memory và (optional) thư mục trên disk, evict theo số entries.
+
+Ngoài artifact đầy đủ, snippet của từng test case cũng được lưu riêng để khi chỉ một vài test cases
+thay đổi thì chỉ các test cases đó phải generate lại (xem split_test_code / assemble_test_code).
+"""
+import copy
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from .single_flight import request_fingerprint, normalize_code
+
+logger = logging.getLogger(__name__)
+
+# Tăng khi đổi format của artifact (entries cũ bị bỏ qua)
+ARTIFACT_VERSION = 1
+
+# Dòng import/require (Python, JS/TS, Java, Go, Rust) - chỉ các dòng này được dedup khi ghép headers
+_IMPORT_LINE_RE = re.compile(
+    r"^\s*(?:import\s|from\s+\S+\s+import\s|(?:const|let|var)\s+[\w{}\s,]+=\s*require\(|require\(|use\s)"
+)
+
+# Các field của test case ảnh hưởng tới code được generate (id/status... thì không)
+TEST_CASE_FIELDS = ("name", "title", "function", "type", "description", "steps", "expectedResult")
+
+
+def case_fingerprint(test_case: Dict[str, Any]) -> str:
+    return request_fingerprint(**{field: test_case.get(field) for field in TEST_CASE_FIELDS})
+
+
+def generation_context_key(
+    original_code: str,
+    language: str,
+    framework: str,
+    model: str,
+    prompt_id: str
+) -> str:
+    """Hash của phần input dùng chung cho mọi test case trong một lần generate"""
+    return request_fingerprint(
+        version=ARTIFACT_VERSION,
+        code=normalize_code(original_code or ""),
+        language=(language or "").lower(),
+        framework=(framework or "").lower(),
+        model=model,
+        prompt=prompt_id
+    )
+
+
+def split_test_code(test_code: str, snippets: List[str]) -> Optional[str]:
+    """
+    Tách phần header (imports, fixtures, setup) khỏi test code: phần còn lại sau khi bỏ snippet của
+    từng test case. None nếu có snippet không nằm nguyên văn trong test code (không tách được).
+    """
+    header = test_code
+    for snippet in snippets:
+        snippet = (snippet or "").strip()
+        if not snippet or snippet not in header:
+            return None
+        header = header.replace(snippet, "", 1)
+    lines = [line.rstrip() for line in header.split("\n")]
+    # Gộp các dòng trống liên tiếp còn lại sau khi bỏ snippets
+    compact = []
+    for line in lines:
+        if line or (compact and compact[-1]):
+            compact.append(line)
+    return "\n".join(compact).strip("\n")
+
+
+def assemble_test_code(headers: List[str], snippets: List[str]) -> str:
+    """
+    Ghép headers và snippets thành một test file. Chỉ các dòng import/require lặp lại được bỏ;
+    các dòng khác (fixtures, setup, "});"...) của mỗi header giữ nguyên văn.
+    """
+    seen = set()
+    header_lines = []
+    for header in headers:
+        for line in (header or "").split("\n"):
+            if _IMPORT_LINE_RE.match(line):
+                key = line.strip()
+                if key in seen:
+                    continue
+                seen.add(key)
+            header_lines.append(line)
+    header = "\n".join(header_lines).strip("\n")
+    body = "\n\n\n".join(snippet.strip("\n") for snippet in snippets if snippet)
+    return f"{header}\n\n\n{body}\n" if header else f"{body}\n"
+
+
+class GeneratedTestCache:
+    """
+    Usage:
+        cache = GeneratedTestCache(max_entries=512, directory="./data/test_artifacts")
+        artifact = cache.get(key)
+        cache.put(key, {"generated_code": {...}, "framework": "pytest"})
+    """
+
+    def __init__(self, max_entries: int = 512, directory: Optional[str] = None, max_disk_entries: int = 10000):
+        self.max_entries = max_entries
+        self.directory = os.path.expanduser(directory) if directory else None
+        self.max_disk_entries = max_disk_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_entries = None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.directory:
+            entry = self._read(key)
+            if entry is not None:
+                self._remember(key, entry)
+        if entry is None or entry.get("version") != ARTIFACT_VERSION:
+            return None
+        return copy.deepcopy(entry["value"])
+
+    def put(self, key: str, value: Dict[str, Any]):
+        entry = {"version": ARTIFACT_VERSION, "created_at": time.time(), "value": copy.deepcopy(value)}
+        self._remember(key, entry)
+        if self.directory:
+            self._write(key, entry)
+
+    def _remember(self, key: str, entry: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)  # mtime = lần dùng gần nhất (cho LRU eviction trên disk)
+            return entry
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được test artifact {key}: {e}")
+            return None
+
+    def _write(self, key: str, entry: Dict[str, Any]):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            is_new = not os.path.exists(path)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Không ghi được test artifact {key}: {e}")
+            return
+        with self._lock:
+            if self._disk_entries is None:
+                self._disk_entries = sum(1 for _ in self._iter_files())
+            elif is_new:
+                # Ghi đè key đã có không làm tăng số entries
+                self._disk_entries += 1
+            evict = self._disk_entries > self.max_disk_entries
+        if evict:
+            self._evict_disk()
+
+    def _iter_files(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    yield os.path.join(root, name)
+
+    def _evict_disk(self):
+        """Xóa 10% entries dùng lâu nhất (theo mtime) khi vượt max_disk_entries"""
+        files: List[Tuple[float, str]] = []
+        for path in self._iter_files():
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        files.sort()
+        excess = len(files) - self.max_disk_entries
+        remove = files[:max(excess, 0) + self.max_disk_entries // 10] if excess > 0 else []
+        for _, path in remove:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_entries = len(files) - len(remove)
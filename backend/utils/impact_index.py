@@ -0,0 +1,487 @@
+"""
+Test impact index - map source symbols (function/method/class) tới các tests dùng chúng
+
+Index được build từ:
+- Symbol index của source files (vị trí dòng của từng function/method, Python dùng ast)
+- Tham chiếu tĩnh từ test code (tên mà từng test dùng) và field "function" của test cases
+- Coverage theo từng test (optional, ví dụ coverage.py JSON với --show-contexts) - chính xác hơn
+  tham chiếu tĩnh nên được ưu tiên khi xếp thứ tự
+
+Cho một diff (hoặc danh sách files thay đổi) trả về tập tests tối thiểu bị ảnh hưởng, xếp theo
+độ ưu tiên (bằng chứng coverage, lịch sử fail, chạy nhanh trước).
+"""
+import ast
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+
+from .source_diff import parse_unified_diff, python_test_references, symbol_names, _DECLARATION_RE
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_$][\w$]*")
+
+
+def _is_python(path: str) -> bool:
+    return path.endswith(".py")
+
+
+def python_symbol_spans(source: str) -> Optional[List[Tuple[int, int, str]]]:
+    """[(start_line, end_line, "Class.method")...] - methods đứng trước class chứa chúng"""
+    try:
+        tree = ast.parse(source or "")
+    except (SyntaxError, ValueError):
+        return None
+    spans = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            start = min([d.lineno for d in node.decorator_list] + [node.lineno])
+            spans.append((start, node.end_lineno, node.name))
+        elif isinstance(node, ast.ClassDef):
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    start = min([d.lineno for d in item.decorator_list] + [item.lineno])
+                    spans.append((start, item.end_lineno, f"{node.name}.{item.name}"))
+            spans.append((node.lineno, node.end_lineno, node.name))
+    return spans
+
+
+def text_symbol_spans(source: str) -> List[Tuple[int, int, str]]:
+    """Mỗi top-level declaration kéo dài tới dòng trước declaration kế tiếp"""
+    source = source or ""
+    starts = [
+        (source.count("\n", 0, match.start()) + 1, match.group(1))
+        for match in _DECLARATION_RE.finditer(source)
+    ]
+    total = source.count("\n") + 1
+    return [
+        (line, (starts[i + 1][0] - 1) if i + 1 < len(starts) else total, name)
+        for i, (line, name) in enumerate(starts)
+    ]
+
+
+# Dòng trống / comment: thêm/xóa không ảnh hưởng behavior
+_TRIVIAL_LINE_RE = re.compile(r"^\s*(?:#|//|/\*|\*|$)")
+# Khối thêm mới bắt đầu bằng declaration: symbol mới, chưa có test nào dùng
+_NEW_DECLARATION_RE = re.compile(r"^\s*(?:export\s+)?(?:async\s+)?(?:def|class|function)\b")
+_DECORATOR_RE = re.compile(r"^\s*@")
+
+
+def _span_at(spans: List[Tuple[int, int, str]], line: int) -> Optional[str]:
+    """Span trong cùng chứa line (methods đứng trước class trong spans)"""
+    for start, end, name in spans:
+        if start <= line <= end:
+            return name
+    return None
+
+
+def _affected_spans(spans: List[Tuple[int, int, str]], change: Dict[str, Any]) -> Tuple[Set[str], bool]:
+    """(tên các spans bị sửa, có thay đổi code top-level hay không) cho một file trong parse_unified_diff"""
+    hit: Set[str] = set()
+    module_level = False
+    for line, text in change.get("deleted", {}).items():
+        name = _span_at(spans, line)
+        if name:
+            hit.add(name)
+        elif not _TRIVIAL_LINE_RE.match(text):
+            module_level = True
+    for position, texts in change.get("inserted", []):
+        code = [text for text in texts if not _TRIVIAL_LINE_RE.match(text)]
+        if not code:
+            continue
+        if _DECORATOR_RE.match(code[0]):
+            rest = [text for text in code if not _DECORATOR_RE.match(text)]
+            if rest and _NEW_DECLARATION_RE.match(rest[0]):
+                continue  # decorators của declaration mới
+            # Chỉ thêm decorator: thuộc về declaration bắt đầu từ dòng `position`
+            name = _span_at(spans, position)
+            if name:
+                hit.add(name)
+                continue
+            module_level = True
+            continue
+        if _NEW_DECLARATION_RE.match(code[0]):
+            continue
+        if code[0][:1] in (" ", "\t"):
+            name = _span_at(spans, position - 1) or _span_at(spans, position)
+            if name:
+                hit.add(name)
+                continue
+        module_level = True
+    return hit, module_level
+
+
+def _module_name(path: str) -> str:
+    """"tests/test_calc.py" -> "tests.test_calc" (để map JUnit classname về file)"""
+    return os.path.splitext(path)[0].replace("/", ".").replace("\\", ".")
+
+
+class TestImpactIndex:
+    """
+    Usage:
+        index = TestImpactIndex("my-project")
+        index.index_source("app/calc.py", source_code)
+        index.index_tests("tests/test_calc.py", test_code)
+        index.add_coverage_json(coverage_report)         # optional
+        impact = index.affected_tests(diff=git_diff)     # {"tests": [...], "run_all": False, ...}
+    """
+
+    def __init__(self, project: str = "default"):
+        self.project = project
+        self.commit: Optional[str] = None
+        self.branch: Optional[str] = None
+        self._lock = threading.RLock()
+        # path -> [(start, end, qualname)]
+        self._spans: Dict[str, List[Tuple[int, int, str]]] = {}
+        # test file path -> [(start, end, test_id)]
+        self._test_spans: Dict[str, List[Tuple[int, int, str]]] = {}
+        # test_id -> tên mà test tham chiếu (static)
+        self._references: Dict[str, Set[str]] = {}
+        # "path::qualname" -> tests đã chạy qua symbol (coverage)
+        self._covered: Dict[str, Set[str]] = {}
+        # test_id -> {"runs", "failures", "duration_ms", "last_status"}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    # ---- Build index ----------------------------------------------------------------------
+
+    def index_source(self, path: str, source: str):
+        """Index (lại) vị trí các symbols của một source file"""
+        spans = python_symbol_spans(source) if _is_python(path) else text_symbol_spans(source)
+        with self._lock:
+            if spans is None:
+                logger.warning(f"Không parse được {path}, bỏ qua khi index")
+                self._spans.pop(path, None)
+            else:
+                self._spans[path] = spans
+
+    def index_tests(self, path: str, test_code: str):
+        """Index tests của một test file: node id + tên mà mỗi test tham chiếu"""
+        with self._lock:
+            for _, _, test_id in self._test_spans.pop(path, []):
+                self._references.pop(test_id, None)
+
+            if _is_python(path):
+                references = python_test_references(test_code)
+                spans = self._python_test_spans(path, test_code)
+                if references is not None and spans is not None:
+                    for key, names in references.items():
+                        self._references[f"{path}::{key}"] = set(names)
+                    self._test_spans[path] = spans
+                    return
+            # Ngôn ngữ khác (Jest...): cả file là một test target
+            self._references[path] = set(_IDENTIFIER_RE.findall(test_code or ""))
+            self._test_spans[path] = [(1, (test_code or "").count("\n") + 1, path)]
+
+    @staticmethod
+    def _python_test_spans(path: str, test_code: str) -> Optional[List[Tuple[int, int, str]]]:
+        spans = python_symbol_spans(test_code)
+        if spans is None:
+            return None
+        test_spans = []
+        for start, end, qualname in spans:
+            owner, _, name = qualname.rpartition(".")
+            if name.startswith("test") and (not owner or owner.startswith("Test")):
+                test_spans.append((start, end, f"{path}::{qualname.replace('.', '::')}"))
+        return test_spans
+
+    def add_test(self, test_id: str, functions: Iterable[str]):
+        """Tests biết trước function mà nó test (ví dụ test case từ analyze_code có field "function")"""
+        with self._lock:
+            self._references.setdefault(test_id, set()).update(f for f in functions if f)
+
+    def add_coverage(self, test_id: str, lines_by_file: Dict[str, Iterable[int]]):
+        """Các dòng source mà test đã chạy qua -> symbols chứa các dòng đó"""
+        with self._lock:
+            for path, lines in lines_by_file.items():
+                for line in lines:
+                    qualname = _span_at(self._spans.get(path, []), int(line))
+                    if qualname:
+                        self._covered.setdefault(f"{path}::{qualname}", set()).add(test_id)
+
+    def add_coverage_json(self, report: Dict[str, Any]) -> int:
+        """
+        coverage.py JSON report có contexts theo test (pytest-cov `--cov-context=test`, rồi
+        `coverage json --show-contexts`; context là "<node id>|run"). Trả về số tests được map.
+        """
+        tests_by_line: Dict[str, Dict[str, List[int]]] = {}
+        for path, data in (report.get("files") or {}).items():
+            for line, contexts in (data.get("contexts") or {}).items():
+                for context in contexts:
+                    test_id = context.split("|")[0]
+                    if test_id:
+                        tests_by_line.setdefault(test_id, {}).setdefault(path, []).append(int(line))
+        for test_id, lines_by_file in tests_by_line.items():
+            self.add_coverage(test_id, lines_by_file)
+        return len(tests_by_line)
+
+    def record_result(self, test_id: str, status: str, duration_ms: float = 0):
+        """Kết quả chạy (từ upload) - dùng để ưu tiên tests hay fail và chạy nhanh"""
+        with self._lock:
+            stats = self._stats.setdefault(test_id, {"runs": 0, "failures": 0, "duration_ms": 0.0, "last_status": None})
+            stats["runs"] += 1
+            stats["failures"] += 1 if status == "fail" else 0
+            # Trung bình trượt: ưu tiên thời gian gần đây
+            stats["duration_ms"] = duration_ms if stats["runs"] == 1 else 0.7 * stats["duration_ms"] + 0.3 * duration_ms
+            stats["last_status"] = status
+
+    def record_junit_results(self, tests: List[Dict[str, Any]]) -> int:
+        """Kết quả đã parse bởi TestingAgent (name, classname, status, duration) -> node ids đã index"""
+        modules = {_module_name(path): path for path in self._test_spans}
+        recorded = 0
+        for test in tests:
+            classname, name = test.get("classname", ""), test.get("name", "")
+            # TestingAgent ghép tên đầy đủ "classname.name"
+            if classname and name.startswith(classname + "."):
+                name = name[len(classname) + 1:]
+            test_id = self._junit_node_id(modules, classname, name)
+            if test_id:
+                self.record_result(test_id, test.get("status", ""), test.get("duration") or 0)
+                recorded += 1
+        return recorded
+
+    @staticmethod
+    def _junit_node_id(modules: Dict[str, str], classname: str, name: str) -> Optional[str]:
+        parts = (classname or "").split(".")
+        for i in range(len(parts), 0, -1):
+            path = modules.get(".".join(parts[:i]))
+            if path:
+                return "::".join([path, *parts[i:], re.sub(r"\[.*\]$", "", name)])
+        return None
+
+    # ---- Query ------------------------------------------------------------------------------
+
+    def changed_from_diff(self, diff: str) -> Dict[str, Any]:
+        """Symbols / tests / files bị ảnh hưởng bởi một unified diff"""
+        return self._changed(parse_unified_diff(diff))
+
+    def _changed(self, files: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        symbols: Set[str] = set()
+        tests: Set[str] = set()
+        unmapped: List[str] = []
+        with self._lock:
+            for path, change in files.items():
+                precise = change["status"] == "modified" and "deleted" in change
+                if path in self._test_spans:
+                    test_spans = self._test_spans[path]
+                    hit, module_level = _affected_spans(test_spans, change) if precise else (set(), True)
+                    # Sửa ngoài test functions (imports, fixtures, helpers): chạy lại cả file
+                    tests |= {test_id for _, _, test_id in test_spans} if module_level else hit
+                    continue
+                if path not in self._spans:
+                    if change["status"] != "added":
+                        unmapped.append(path)
+                    continue
+                spans = self._spans[path]
+                hit, module_level = _affected_spans(spans, change) if precise else (set(), True)
+                # Code top-level (imports, constants) thay đổi: mọi symbol của file đều có thể bị ảnh hưởng
+                qualnames = {qualname for _, _, qualname in spans} if module_level else hit
+                symbols |= {f"{path}::{qualname}" for qualname in qualnames}
+        return {"symbols": symbols, "tests": tests, "unmapped": unmapped}
+
+    def affected_tests(
+        self,
+        diff: Optional[str] = None,
+        changed_files: Optional[List[str]] = None,
+        limit: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Tests bị ảnh hưởng bởi diff (chính xác tới function) hoặc changed_files (cả file), xếp theo ưu tiên.
+        run_all = True khi có source file thay đổi mà index không biết (không đủ thông tin để chọn tập con).
+        """
+        if diff:
+            changed = self.changed_from_diff(diff)
+        else:
+            changed = self._changed({path: {"status": "modified"} for path in changed_files or []})
+
+        reasons: Dict[str, Dict[str, Set[str]]] = {}
+
+        def add(test_id: str, kind: str, detail: str):
+            reasons.setdefault(test_id, {"coverage": set(), "static": set(), "test_changed": set()})[kind].add(detail)
+
+        with self._lock:
+            for test_id in changed["tests"]:
+                add(test_id, "test_changed", test_id)
+            for symbol in changed["symbols"]:
+                for test_id in self._covered.get(symbol, ()):
+                    add(test_id, "coverage", symbol)
+                names = symbol_names({symbol.split("::", 1)[1]})
+                for test_id, referenced in self._references.items():
+                    if referenced & names:
+                        add(test_id, "static", symbol)
+            stats = {test_id: dict(self._stats.get(test_id) or {}) for test_id in reasons}
+            total_tests = len(self._references)
+
+        ranked = []
+        for test_id, why in reasons.items():
+            s = stats[test_id]
+            fail_rate = s["failures"] / s["runs"] if s.get("runs") else 0.0
+            score = 3 * len(why["test_changed"]) + 2 * len(why["coverage"]) + len(why["static"]) + 2 * fail_rate
+            ranked.append({
+                "test": test_id,
+                "score": round(score, 3),
+                "reasons": {kind: sorted(values) for kind, values in why.items() if values},
+                "last_status": s.get("last_status"),
+                "duration_ms": round(s["duration_ms"], 1) if s.get("runs") else None
+            })
+        # Điểm cao trước; cùng điểm thì test chạy nhanh trước
+        ranked.sort(key=lambda t: (-t["score"], t["duration_ms"] if t["duration_ms"] is not None else float("inf"), t["test"]))
+        if limit:
+            ranked = ranked[:limit]
+
+        return {
+            "project": self.project,
+            "indexed_commit": self.commit,
+            "run_all": bool(changed["unmapped"]),
+            "unmapped_files": changed["unmapped"],
+            "changed_symbols": sorted(changed["symbols"]),
+            "tests": ranked,
+            "selected": len(ranked),
+            "total_tests": total_tests
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "project": self.project,
+                "commit": self.commit,
+                "branch": self.branch,
+                "source_files": len(self._spans),
+                "test_files": len(self._test_spans),
+                "tests": len(self._references),
+                "symbols": sum(len(spans) for spans in self._spans.values()),
+                "covered_symbols": len(self._covered)
+            }
+
+    # ---- Persistence ------------------------------------------------------------------------
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "version": INDEX_VERSION,
+                "project": self.project,
+                "commit": self.commit,
+                "branch": self.branch,
+                "spans": self._spans,
+                "test_spans": self._test_spans,
+                "references": {k: sorted(v) for k, v in self._references.items()},
+                "covered": {k: sorted(v) for k, v in self._covered.items()},
+                "stats": self._stats
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TestImpactIndex":
+        index = cls(data.get("project", "default"))
+        if data.get("version") != INDEX_VERSION:
+            return index
+        index.commit = data.get("commit")
+        index.branch = data.get("branch")
+        index._spans = {k: [tuple(s) for s in v] for k, v in (data.get("spans") or {}).items()}
+        index._test_spans = {k: [tuple(s) for s in v] for k, v in (data.get("test_spans") or {}).items()}
+        index._references = {k: set(v) for k, v in (data.get("references") or {}).items()}
+        index._covered = {k: set(v) for k, v in (data.get("covered") or {}).items()}
+        index._stats = data.get("stats") or {}
+        return index
+
+
+class TestImpactRegistry:
+    """Một TestImpactIndex cho mỗi project; optional lưu JSON trên disk (mỗi project một file)"""
+
+    def __init__(self, directory: Optional[str] = None, save_every: int = 20, save_interval: float = 60.0):
+        self.directory = os.path.expanduser(directory) if directory else None
+        self.save_every = max(1, int(save_every))
+        self.save_interval = save_interval
+        self._indexes: Dict[str, TestImpactIndex] = {}
+        # project -> số updates chưa ghi ra disk / thời điểm ghi gần nhất
+        self._dirty: Dict[str, int] = {}
+        self._last_save: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, project: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", project) or "default"
+        return os.path.join(self.directory, f"{safe}.json")
+
+    def get(self, project: str = "default") -> TestImpactIndex:
+        with self._lock:
+            index = self._indexes.get(project)
+            if index is None:
+                index = self._load(project) or TestImpactIndex(project)
+                self._indexes[project] = index
+            return index
+
+    def has(self, project: str) -> bool:
+        with self._lock:
+            if project in self._indexes:
+                return True
+        return bool(self.directory) and os.path.exists(self._path(project))
+
+    def _load(self, project: str) -> Optional[TestImpactIndex]:
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(project), encoding="utf-8") as f:
+                return TestImpactIndex.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Không đọc được test impact index của {project}: {e}")
+            return None
+
+    def mark_dirty(self, project: str):
+        """Update nhỏ (kết quả JUnit của một upload): ghi ra disk sau save_every updates hoặc save_interval giây"""
+        if not self.directory:
+            return
+        now = time.monotonic()
+        with self._lock:
+            pending = self._dirty[project] = self._dirty.get(project, 0) + 1
+            due = pending >= self.save_every or now - self._last_save.setdefault(project, now) >= self.save_interval
+        if due:
+            self.save(project)
+
+    def flush(self):
+        """Ghi các projects còn updates chưa lưu (gọi lúc shutdown)"""
+        with self._lock:
+            projects = [project for project, pending in self._dirty.items() if pending]
+        for project in projects:
+            self.save(project)
+
+    def save(self, project: str):
+        if not self.directory:
+            return
+        index = self.get(project)
+        with self._lock:
+            pending = self._dirty.pop(project, 0)
+            self._last_save[project] = time.monotonic()
+        path = self._path(project)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(index.to_dict(), f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Không ghi được test impact index của {project}: {e}")
+            with self._lock:
+                self._dirty[project] = self._dirty.get(project, 0) + pending
+
+
+_default_registry: Optional[TestImpactRegistry] = None
+_default_lock = threading.Lock()
+
+
+def get_test_impact_registry() -> TestImpactRegistry:
+    """Registry dùng chung trong process, cấu hình từ Config (TEST_IMPACT_DIR, INDEX_SAVE_*)"""
+    global _default_registry
+    if _default_registry is None:
+        with _default_lock:
+            if _default_registry is None:
+                from config import Config
+                _default_registry = TestImpactRegistry(
+                    Config.TEST_IMPACT_DIR, save_every=Config.INDEX_SAVE_EVERY, save_interval=Config.INDEX_SAVE_INTERVAL
+                )
+    return _default_registry
@@ -0,0 +1,243 @@
+"""
+Jest toolchain - node_modules (jest, babel, ts-jest) được cài một lần và dùng chung cho mọi test job
+
+- Thư mục toolchain được đặt tên theo hash của package versions + Node major version (content-addressed),
+  nên đổi version tạo toolchain mới còn toolchain cũ vẫn dùng được cho tới khi xóa
+- Cài bằng npm với local cache (mặc định --offline), vào thư mục tạm rồi rename atomically;
+  có thể cài sẵn trong image hoặc mount read-only
+- Mỗi job chỉ tạo symlink node_modules + jest.config.js (vài ms), transform cache của Jest dùng chung
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JEST_PACKAGES = (
+    "jest@29.7.0",
+    "babel-jest@29.7.0",
+    "@babel/core@7.24.4",
+    "@babel/preset-env@7.24.4",
+    "ts-jest@29.1.2",
+    "typescript@5.4.5",
+)
+
+
+class ToolchainError(RuntimeError):
+    """Không có toolchain (thiếu node/npm, package chưa có trong cache...)"""
+
+
+def _split_spec(spec: str):
+    """"@babel/core@7.24.4" -> ("@babel/core", "7.24.4")"""
+    name, sep, version = spec.rpartition("@")
+    if not sep or not name:
+        return spec, "*"
+    return name, version
+
+
+class JestToolchain:
+    """
+    Usage:
+        toolchain = JestToolchain("/var/cache/testflow/jest")
+        config_path = toolchain.prepare_job(job_dir, typescript=False)
+        report = toolchain.run(job_dir, config_path, timeout=60)   # Jest --json output (dict)
+    """
+
+    def __init__(
+        self,
+        root: str,
+        packages: Optional[List[str]] = None,
+        npm_cache: Optional[str] = None,
+        offline: bool = True,
+        install_timeout: int = 600,
+        retry_after: float = 300.0
+    ):
+        self.root = os.path.abspath(os.path.expanduser(root))
+        self.packages = sorted(packages or DEFAULT_JEST_PACKAGES)
+        self.npm_cache = os.path.expanduser(npm_cache) if npm_cache else None
+        self.offline = offline
+        self.install_timeout = install_timeout
+        # Cài lỗi thì không thử lại ngay ở mỗi request (tránh mỗi request chờ npm timeout)
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._path: Optional[str] = None
+        self._node_version: Optional[str] = None
+        self._failed_at: Optional[float] = None
+        self._last_error = ""
+
+    def node_version(self) -> Optional[str]:
+        """Version của node (check một lần); None nếu không có node"""
+        if self._node_version is None:
+            try:
+                result = subprocess.run(["node", "--version"], capture_output=True, text=True, timeout=5)
+                self._node_version = result.stdout.strip() if result.returncode == 0 else ""
+            except (OSError, subprocess.SubprocessError):
+                self._node_version = ""
+        return self._node_version or None
+
+    def available(self) -> bool:
+        """Có node và toolchain đã cài (hoặc chưa cài lỗi gần đây)"""
+        if not self.node_version():
+            return False
+        return self._path is not None or self._failed_at is None or time.time() - self._failed_at >= self.retry_after
+
+    @property
+    def key(self) -> str:
+        node_major = (self.node_version() or "none").lstrip("v").split(".")[0]
+        payload = json.dumps({"packages": self.packages, "node": node_major}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.root, self.key)
+
+    @property
+    def cache_directory(self) -> str:
+        """Jest transform cache dùng chung giữa các jobs"""
+        return os.path.join(self.root, "jest-cache")
+
+    def ensure(self) -> str:
+        """Đường dẫn toolchain đã cài; cài (từ npm cache) nếu chưa có"""
+        if self._path is not None:
+            return self._path
+        with self._lock:
+            if self._path is not None:
+                return self._path
+            if not self.node_version():
+                raise ToolchainError("node không có sẵn")
+            path = self.path
+            if not os.path.isfile(self._jest_bin(path)):
+                if self._failed_at is not None and time.time() - self._failed_at < self.retry_after:
+                    raise ToolchainError(f"Cài Jest toolchain lỗi gần đây: {self._last_error}")
+                try:
+                    self._install(path)
+                except ToolchainError as e:
+                    self._failed_at, self._last_error = time.time(), str(e)
+                    raise
+            self._path = path
+            return path
+
+    def _install(self, path: str):
+        os.makedirs(self.root, exist_ok=True)
+        staging = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        manifest = {
+            "name": "testflow-jest-toolchain",
+            "private": True,
+            "dependencies": dict(_split_spec(spec) for spec in self.packages)
+        }
+        with open(os.path.join(staging, "package.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        command = ["npm", "install", "--no-audit", "--no-fund", "--ignore-scripts", "--no-package-lock"]
+        command.append("--offline" if self.offline else "--prefer-offline")
+        if self.npm_cache:
+            command += ["--cache", self.npm_cache]
+
+        started = time.perf_counter()
+        logger.info(f"Cài Jest toolchain {self.key} ({', '.join(self.packages)})")
+        try:
+            result = subprocess.run(
+                command, cwd=staging, capture_output=True, text=True, timeout=self.install_timeout
+            )
+        except (OSError, subprocess.SubprocessError) as e:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise ToolchainError(f"npm install failed: {e}")
+        if result.returncode != 0 or not os.path.isfile(self._jest_bin(staging)):
+            shutil.rmtree(staging, ignore_errors=True)
+            raise ToolchainError(f"npm install failed: {result.stderr.strip()[-500:]}")
+
+        try:
+            os.rename(staging, path)
+        except OSError:
+            # Process khác đã cài xong trước - dùng bản của nó
+            shutil.rmtree(staging, ignore_errors=True)
+            if not os.path.isfile(self._jest_bin(path)):
+                raise ToolchainError(f"Không publish được toolchain vào {path}")
+        logger.info(f"Jest toolchain sẵn sàng sau {time.perf_counter() - started:.1f}s: {path}")
+
+    @staticmethod
+    def _jest_bin(path: str) -> str:
+        return os.path.join(path, "node_modules", "jest", "bin", "jest.js")
+
+    def prepare_job(self, job_dir: str, typescript: bool = False) -> str:
+        """Link node_modules của toolchain vào job_dir và ghi jest config; trả về đường dẫn config"""
+        modules = os.path.join(self.ensure(), "node_modules")
+        os.symlink(modules, os.path.join(job_dir, "node_modules"), target_is_directory=True)
+
+        if typescript:
+            transform = {"^.+\\.tsx?$": [
+                os.path.join(modules, "ts-jest"),
+                # Transpile-only: bỏ type-check để chạy nhanh, lỗi type không làm fail test
+                {"isolatedModules": True, "tsconfig": {"esModuleInterop": True, "allowJs": True, "target": "ES2019"}}
+            ]}
+        else:
+            transform = {"^.+\\.[jt]sx?$": [
+                os.path.join(modules, "babel-jest"),
+                {"presets": [[os.path.join(modules, "@babel", "preset-env"), {"targets": {"node": "current"}}]]}
+            ]}
+        config = {
+            "rootDir": job_dir,
+            "testEnvironment": "node",
+            "testMatch": ["**/*.test.[jt]s?(x)"],
+            "transform": transform,
+            "cacheDirectory": self.cache_directory,
+            "watchman": False
+        }
+        config_path = os.path.join(job_dir, "jest.config.json")
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f)
+        return config_path
+
+    def run(
+        self,
+        job_dir: str,
+        config_path: str,
+        timeout: int = 60,
+        test_name_pattern: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Chạy Jest trong job_dir (chỉ tests khớp test_name_pattern nếu có); trả về JSON report"""
+        output_file = os.path.join(job_dir, "jest-results.json")
+        command = [
+            "node", self._jest_bin(self.ensure()),
+            "--config", config_path,
+            "--json", "--outputFile", output_file,
+            "--ci", "--runInBand"
+        ]
+        if test_name_pattern:
+            command += ["--testNamePattern", test_name_pattern]
+        env = dict(os.environ, CI="true", NODE_ENV="test", FORCE_COLOR="0")
+        # Jest exit code != 0 khi có test fail - kết quả vẫn nằm trong output file
+        result = subprocess.run(command, cwd=job_dir, capture_output=True, text=True, timeout=timeout, env=env)
+        try:
+            with open(output_file, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise RuntimeError(f"Jest không tạo được JSON report (exit {result.returncode}): {result.stderr.strip()[-500:]}")
+
+
+_default_toolchain: Optional[JestToolchain] = None
+_default_lock = threading.Lock()
+
+
+def get_jest_toolchain() -> JestToolchain:
+    """Toolchain dùng chung trong process, cấu hình từ Config (JEST_*)"""
+    global _default_toolchain
+    if _default_toolchain is None:
+        with _default_lock:
+            if _default_toolchain is None:
+                from config import Config
+                _default_toolchain = JestToolchain(
+                    Config.JEST_TOOLCHAIN_ROOT,
+                    packages=Config.JEST_TOOLCHAIN_PACKAGES or None,
+                    npm_cache=Config.JEST_NPM_CACHE,
+                    offline=Config.JEST_NPM_OFFLINE
+                )
+    return _default_toolchain
@@ -0,0 +1,55 @@
+"""
+Coverage plugin cho generated pytest suites - được copy vào job directory thành conftest.py
+
+Không import gì từ backend (chạy trong pytest worker / subprocess). Đọc config từ
+.testflow-coverage.json trong thư mục hiện tại:
+    {"include": ["source.py"], "branch": true, "report": "coverage.json"}
+Mỗi test chạy trong context riêng (pytest node id) để biết từng test cover dòng nào; code chạy lúc
+import (ngoài test) thuộc context "". Kết quả được ghi bằng coverage json --show-contexts.
+"""
+import json
+import os
+
+import pytest
+
+_CONFIG_FILE = ".testflow-coverage.json"
+_state = {}
+
+
+def pytest_sessionstart(session):
+    try:
+        with open(os.path.join(str(session.config.rootpath), _CONFIG_FILE), encoding="utf-8") as f:
+            config = json.load(f)
+        import coverage
+    except (OSError, ValueError, ImportError):
+        return
+    cov = coverage.Coverage(
+        data_file=None,
+        branch=bool(config.get("branch")),
+        include=[os.path.join(str(session.config.rootpath), path) for path in config.get("include", [])],
+        config_file=False
+    )
+    cov.start()
+    _state.update(cov=cov, report=os.path.join(str(session.config.rootpath), config.get("report", "coverage.json")))
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item, nextitem):
+    cov = _state.get("cov")
+    if cov is not None:
+        cov.switch_context(item.nodeid)
+    yield
+    if cov is not None:
+        cov.switch_context("")
+
+
+def pytest_sessionfinish(session, exitstatus):
+    cov = _state.pop("cov", None)
+    if cov is None:
+        return
+    cov.stop()
+    try:
+        cov.json_report(outfile=_state["report"], show_contexts=True)
+    except Exception:
+        # Không có dữ liệu (source không được import...) - không có report
+        pass
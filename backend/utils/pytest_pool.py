@@ -0,0 +1,224 @@
+"""
+Pytest worker pool - chạy generated pytest suites trong các worker đã warm (pytest import sẵn)
+
+Mỗi worker (utils/pytest_worker.py) fork một child cho từng job nên job chỉ trả chi phí fork +
+collect/run thay vì khởi động interpreter và import pytest/plugins (~hàng trăm ms). Child chạy trong
+thư mục riêng với rlimits (memory, CPU, file size) và bị kill (cả process group) khi quá timeout.
+
+Nền tảng không có fork (Windows) hoặc worker không khởi động được thì chạy `pytest` subprocess như cũ.
+"""
+import json
+import logging
+import os
+import queue
+import select
+import shutil
+import subprocess
+import sys
+import threading
+from typing import List, Optional
+
+from .telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pytest_worker.py")
+DEFAULT_PRELOAD = (
+    "pytest", "unittest.mock", "json", "re", "datetime", "decimal", "collections", "dataclasses", "typing",
+    # coverage.py (optional) - import sẵn để job có coverage không tốn thêm ~100ms import
+    "coverage", "coverage.jsonreport", "coverage.tracer"
+)
+
+
+class _Worker:
+    """Một forkserver process; xử lý tuần tự từng job"""
+
+    def __init__(self, preload: List[str], startup_timeout: float = 30.0):
+        env = dict(os.environ, PYTEST_WORKER_PRELOAD=",".join(preload), PYTHONDONTWRITEBYTECODE="1")
+        self.process = subprocess.Popen(
+            [sys.executable, WORKER_SCRIPT],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+            env=env
+        )
+        self.jobs = 0
+        hello = self._read_line(startup_timeout)
+        if not hello or not json.loads(hello).get("ready"):
+            self.kill()
+            raise RuntimeError("pytest worker không khởi động được")
+        self.info = json.loads(hello)
+
+    def _read_line(self, timeout: float) -> Optional[str]:
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            return None
+        return self.process.stdout.readline() or None
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def run(self, job: dict) -> dict:
+        self.jobs += 1
+        self.process.stdin.write(json.dumps(job) + "\n")
+        self.process.stdin.flush()
+        # Worker tự kill child khi quá timeout; grace để phòng worker bị treo
+        line = self._read_line(float(job["timeout"]) + 10)
+        if line is None:
+            self.kill()
+            raise subprocess.TimeoutExpired(["pytest", *job["args"]], job["timeout"])
+        return json.loads(line)
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+
+
+class PytestWorkerPool:
+    """
+    Usage:
+        pool = PytestWorkerPool(size=2)
+        if pool.available():
+            result = pool.run(["test_generated.py", "-v"], cwd=tmpdir, timeout=60)
+            # subprocess.CompletedProcess(returncode, stdout, stderr)
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        preload: Optional[List[str]] = None,
+        memory_limit_mb: int = 1024,
+        file_size_limit_mb: int = 64,
+        max_jobs_per_worker: int = 1000
+    ):
+        self.size = max(1, size)
+        self.preload = list(preload or DEFAULT_PRELOAD)
+        self.memory_limit_mb = memory_limit_mb
+        self.file_size_limit_mb = file_size_limit_mb
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._idle: "queue.LifoQueue[_Worker]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._closed = False
+        # Kiểm tra toolchain một lần: None = chưa check
+        self._pool_ok: Optional[bool] = None
+        self._pytest_cli: Optional[str] = None
+        self._cli_checked = False
+
+    def available(self) -> bool:
+        """Có thể chạy pytest (worker pool hoặc CLI); kết quả check được cache"""
+        return self._use_pool() or self._cli() is not None
+
+    def _use_pool(self) -> bool:
+        if self._pool_ok is None:
+            with self._lock:
+                if self._pool_ok is None:
+                    self._pool_ok = False
+                    if hasattr(os, "fork") and os.name == "posix":
+                        try:
+                            worker = _Worker(self.preload)
+                            self._idle.put(worker)
+                            self._pool_ok = True
+                            logger.info(f"Pytest worker pool sẵn sàng (pytest {worker.info.get('pytest')})")
+                        except Exception as e:
+                            logger.warning(f"Không khởi động được pytest worker, dùng subprocess: {e}")
+        return self._pool_ok
+
+    def _cli(self) -> Optional[str]:
+        if not self._cli_checked:
+            self._pytest_cli = shutil.which("pytest")
+            self._cli_checked = True
+        return self._pytest_cli
+
+    def run(self, args: List[str], cwd: str, timeout: float = 60) -> subprocess.CompletedProcess:
+        """Chạy pytest với args trong cwd; raise subprocess.TimeoutExpired khi quá timeout"""
+        if not self._use_pool():
+            return subprocess.run(
+                [self._cli() or "pytest", *args], capture_output=True, text=True, timeout=timeout, cwd=cwd
+            )
+
+        job = {
+            "args": list(args),
+            "cwd": cwd,
+            "timeout": timeout,
+            "memory_mb": self.memory_limit_mb,
+            "fsize_mb": self.file_size_limit_mb
+        }
+        with self._slots:
+            worker = self._checkout()
+            try:
+                result = worker.run(job)
+            except Exception:
+                worker.kill()
+                raise
+            self._checkin(worker)
+
+        telemetry.metrics.observe(
+            "testflow_pytest_worker_job_seconds",
+            result.get("duration_ms", 0) / 1000,
+            help_text="Thời gian chạy một pytest job trong worker (fork + collect + run)"
+        )
+        if result.get("timed_out"):
+            raise subprocess.TimeoutExpired(["pytest", *args], timeout)
+        return subprocess.CompletedProcess(
+            ["pytest", *args],
+            result["returncode"],
+            stdout=self._read_output(cwd, ".pytest-stdout"),
+            stderr=self._read_output(cwd, ".pytest-stderr") or result.get("error", "")
+        )
+
+    def _checkout(self) -> _Worker:
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return _Worker(self.preload)
+            if worker.alive():
+                return worker
+            worker.kill()
+
+    def _checkin(self, worker: _Worker):
+        if self._closed or not worker.alive() or worker.jobs >= self.max_jobs_per_worker:
+            worker.kill()
+        else:
+            self._idle.put(worker)
+
+    @staticmethod
+    def _read_output(cwd: str, name: str) -> str:
+        try:
+            with open(os.path.join(cwd, name), encoding="utf-8", errors="replace") as f:
+                return f.read()
+        except OSError:
+            return ""
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().kill()
+            except queue.Empty:
+                break
+
+
+_default_pool: Optional[PytestWorkerPool] = None
+_default_lock = threading.Lock()
+
+
+def get_pytest_pool() -> PytestWorkerPool:
+    """Pool dùng chung trong process, cấu hình từ Config (PYTEST_*)"""
+    global _default_pool
+    if _default_pool is None:
+        with _default_lock:
+            if _default_pool is None:
+                from config import Config
+                _default_pool = PytestWorkerPool(
+                    size=Config.PYTEST_WORKERS,
+                    preload=Config.PYTEST_WORKER_PRELOAD or None,
+                    memory_limit_mb=Config.PYTEST_MEMORY_LIMIT_MB
+                )
+    return _default_pool
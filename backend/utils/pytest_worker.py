@@ -0,0 +1,225 @@
+"""
+Pytest worker (forkserver) - process sống lâu đã import sẵn pytest và các thư viện hay dùng
+
+Chạy như script độc lập (không import gì từ backend): nhận job qua stdin (JSON mỗi dòng),
+fork một child cho mỗi job - child chạy pytest.main() trong thư mục riêng với resource limits,
+parent chờ child (kill cả process group khi timeout) rồi trả kết quả qua stdout (JSON mỗi dòng).
+
+Job:    {"args": [...], "cwd": "/tmp/job", "timeout": 60, "memory_mb": 1024, "fsize_mb": 64}
+Result: {"returncode": 0, "timed_out": false, "duration_ms": 35.2}
+"""
+import gc
+import importlib
+import json
+import os
+import select
+import shutil
+import signal
+import sys
+import tempfile
+import time
+
+# Status của child đã được reap trong lúc polling (nền tảng không có pidfd)
+_reaped = {}
+
+
+def _preload(modules):
+    loaded = []
+    for name in modules:
+        try:
+            importlib.import_module(name)
+            loaded.append(name)
+        except Exception:
+            pass
+    # Import sẵn các pytest plugins (entry points) để child không phải import lại
+    try:
+        from importlib.metadata import entry_points
+        for ep in entry_points(group="pytest11"):
+            try:
+                ep.load()
+            except Exception:
+                pass
+    except Exception:
+        pass
+    return loaded
+
+
+def _warm_up():
+    """
+    Chạy một session pytest nhỏ trong worker để import hết builtin plugins (python, assertion
+    rewrite, terminal...) - child được fork sau đó không phải import lại
+    """
+    import pytest
+    workdir = tempfile.mkdtemp(prefix="pytest-warmup-")
+    try:
+        with open(os.path.join(workdir, "test_warmup.py"), "w") as f:
+            f.write("def test_warmup():\n    assert 1 + 1 == 2\n")
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            pytest.main(["test_warmup.py", "-q", "-p", "no:cacheprovider"])
+        finally:
+            os.chdir(cwd)
+    except Exception:
+        pass
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+        sys.modules.pop("test_warmup", None)
+    _warm_up_coverage()
+
+
+def _warm_up_coverage():
+    """Chạy thử coverage (start/stop/json report) để các modules import lazy của nó có sẵn cho child"""
+    try:
+        import coverage
+    except ImportError:
+        return
+    workdir = tempfile.mkdtemp(prefix="coverage-warmup-")
+    try:
+        source = os.path.join(workdir, "warmup_source.py")
+        with open(source, "w") as f:
+            f.write("def f(x):\n    if x:\n        return 1\n    return 2\n")
+        cov = coverage.Coverage(data_file=None, branch=True, include=[source], config_file=False)
+        cov.start()
+        try:
+            namespace = {}
+            exec(compile(open(source).read(), source, "exec"), namespace)
+            cov.switch_context("warmup")
+            namespace["f"](1)
+        finally:
+            cov.stop()
+        cov.json_report(outfile=os.path.join(workdir, "coverage.json"), show_contexts=True)
+    except Exception:
+        pass
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _run_child(job):
+    """Trong child process: không bao giờ return"""
+    code = 4
+    try:
+        os.setsid()
+        os.chdir(job["cwd"])
+        try:
+            import resource
+            if job.get("memory_mb"):
+                limit = int(job["memory_mb"]) * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+            if job.get("timeout"):
+                cpu = int(job["timeout"]) + 1
+                resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+            if job.get("fsize_mb"):
+                size = int(job["fsize_mb"]) * 1024 * 1024
+                resource.setrlimit(resource.RLIMIT_FSIZE, (size, size))
+        except (ImportError, ValueError, OSError):
+            pass
+
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        stdout = os.open(os.path.join(job["cwd"], ".pytest-stdout"), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        stderr = os.open(os.path.join(job["cwd"], ".pytest-stderr"), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.dup2(devnull, 0)
+        os.dup2(stdout, 1)
+        os.dup2(stderr, 2)
+        sys.stdin = open(0, closefd=False)
+        sys.stdout = open(1, "w", closefd=False)
+        sys.stderr = open(2, "w", closefd=False)
+        sys.argv = ["pytest", *job["args"]]
+
+        import pytest
+        code = int(pytest.main(list(job["args"])))
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else 1
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def _wait_child(pid, deadline):
+    """Chờ child exit tới deadline; False nếu quá hạn. Linux dùng pidfd (không polling)"""
+    if hasattr(os, "pidfd_open"):
+        try:
+            pidfd = os.pidfd_open(pid)
+        except OSError:
+            pidfd = None
+        if pidfd is not None:
+            try:
+                ready, _, _ = select.select([pidfd], [], [], max(0.0, deadline - time.perf_counter()))
+                return bool(ready)
+            finally:
+                os.close(pidfd)
+
+    delay = 0.0005
+    while time.perf_counter() < deadline:
+        finished, status = os.waitpid(pid, os.WNOHANG)
+        if finished:
+            # Đã reap - để waitpid() của caller không lỗi, giữ lại status
+            _reaped[pid] = status
+            return True
+        time.sleep(delay)
+        delay = min(delay * 2, 0.01)
+    return False
+
+
+def _run_job(job):
+    started = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        _run_child(job)
+
+    timeout = float(job.get("timeout") or 60)
+    timed_out = not _wait_child(pid, started + timeout)
+    if timed_out:
+        try:
+            os.killpg(pid, signal.SIGKILL)
+        except OSError:
+            pass
+    status = _reaped.pop(pid) if pid in _reaped else os.waitpid(pid, 0)[1]
+
+    if os.WIFEXITED(status):
+        returncode = os.WEXITSTATUS(status)
+    else:
+        returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else 1
+    return {
+        "returncode": returncode,
+        "timed_out": timed_out,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+
+def main():
+    # Dùng fd stdout gốc riêng cho protocol; print() trong lúc preload không làm hỏng protocol
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+    # sys.path[0] là thư mục utils/ của backend - không để tests import nhầm modules của server
+    if sys.path and os.path.abspath(sys.path[0]) == os.path.dirname(os.path.abspath(__file__)):
+        sys.path.pop(0)
+
+    modules = [m for m in os.environ.get("PYTEST_WORKER_PRELOAD", "pytest").split(",") if m]
+    loaded = _preload(modules)
+    _warm_up()
+    # Objects của worker vào permanent generation: gc.collect() trong child (pytest gọi mỗi session)
+    # không phải duyệt lại cả heap đã preload, và page được chia sẻ copy-on-write lâu hơn
+    gc.collect()
+    gc.freeze()
+    import pytest
+    protocol.write(json.dumps({"ready": True, "pytest": pytest.__version__, "preloaded": loaded}) + "\n")
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            result = _run_job(json.loads(line))
+        except Exception as e:
+            result = {"returncode": 1, "timed_out": False, "error": str(e)}
+        protocol.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ Response Parser - Parse AI response và extract structured data
 import json
 import re
 from typing import Dict, Any, List, Optional
+from .telemetry import telemetry
 
 
 class ResponseParser:
@@ -11,6 +12,14 @@ class ResponseParser:
     
     @staticmethod
     def parse_ai_response(response: str) -> Dict[str, Any]:
+        """Parse AI response (có đo thời gian parse) - xem _parse_ai_response"""
+        with telemetry.span("parser.ai_response", size_chars=len(response or "")) as span:
+            parsed = ResponseParser._parse_ai_response(response)
+            span.set_attribute("test_cases", len(parsed.get("testCases", [])))
+            return parsed
+    
+    @staticmethod
+    def _parse_ai_response(response: str) -> Dict[str, Any]:
         """
         Parse AI response và extract test cases, summary
         
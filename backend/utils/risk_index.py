@@ -0,0 +1,123 @@
+"""
+Risk index - map test cases tới các risks (từ analyze_code) liên quan, kèm lý do match
+
+Build một lần cho mỗi request: mỗi risk được tokenize (lowercase, tách camelCase/snake_case, bỏ số
+nhiều) thành inverted index token -> risks. Mỗi test case chỉ lookup các tokens của nó (function name,
+function trong test name, keywords), nên tổng chi phí tuyến tính theo số tests + độ dài risks thay vì
+tests × risks × keywords.
+"""
+import re
+from typing import Dict, Any, List, Optional, Set
+
+_WORD_RE = re.compile(r"\w+")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+FUNCTION_PREFIXES = ("get", "set", "is", "has", "add", "delete", "update", "create", "remove")
+TEST_NAME_PREFIXES = ("test", "should", "verify", "check")
+STOP_WORDS = frozenset(["when", "then", "should", "test", "the", "a", "an", "is", "are", "from", "to", "and", "or"])
+NEGATIVE_TEST_WORDS = ("not", "fail", "error", "exception", "throw")
+ERROR_RISK_KEYWORDS = ("không", "lỗi", "fail", "error", "exception", "throwing")
+
+
+def _stem(token: str) -> str:
+    """"products" -> "product", "classes" -> "class" (đủ để match số ít/số nhiều)"""
+    if len(token) > 4 and token.endswith(("sses", "xes", "ches", "shes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def _strip_prefix(name: str, prefixes) -> str:
+    for prefix in prefixes:
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+    return name
+
+
+def identifier_tokens(text: str) -> List[str]:
+    """Tokens của text: mỗi word (lowercase) và các phần camelCase/snake_case của nó"""
+    tokens = []
+    for word in _WORD_RE.findall(text or ""):
+        tokens.append(word.lower())
+        parts = [part.lower() for chunk in word.split("_") for part in (_CAMEL_RE.findall(chunk) or [chunk])]
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+class RiskIndex:
+    """
+    Usage:
+        index = RiskIndex(["deleteProduct không kiểm tra product tồn tại"])
+        index.match({"name": "deleteProduct_WhenMissing_Throws", "function": "deleteProduct"})
+        # [{"risk": "...", "riskIndex": 0, "reason": "function", "token": "deleteproduct"}]
+    """
+
+    def __init__(self, risks: Optional[List[str]] = None):
+        self.risks = [str(risk) for risk in (risks or []) if risk]
+        self._index: Dict[str, Set[int]] = {}
+        self._error_risks: List[int] = []
+        for i, risk in enumerate(self.risks):
+            for token in identifier_tokens(risk):
+                self._index.setdefault(_stem(token), set()).add(i)
+            lowered = risk.lower()
+            if any(keyword in lowered for keyword in ERROR_RISK_KEYWORDS):
+                self._error_risks.append(i)
+
+    def __len__(self) -> int:
+        return len(self.risks)
+
+    def _lookup(self, token: str) -> Set[int]:
+        return self._index.get(_stem(token), set()) if token else set()
+
+    def match(self, test_case: Optional[Dict[str, Any]], limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Tối đa `limit` risks liên quan tới test case, mỗi risk một lần với lý do mạnh nhất, theo thứ tự ưu
+        tiên: "function" (function name hoặc phần sau prefix get/set/...), "test_name" (function ở đầu test
+        name dạng functionName_When_Then), "keyword" (từ có nghĩa > 3 ký tự trong test name), "negative"
+        (negative test + risk về lỗi/thiếu kiểm tra)
+        """
+        if not self.risks or not test_case:
+            return []
+
+        function_name = str(test_case.get("function") or "")
+        test_name = str(test_case.get("name") or "")
+        test_type = str(test_case.get("type") or "").lower()
+
+        candidates = []  # (reason, token) theo thứ tự ưu tiên
+        if function_name:
+            lowered = function_name.lower()
+            candidates.append(("function", lowered))
+            clean = _strip_prefix(lowered, FUNCTION_PREFIXES)
+            if len(clean) > 2:
+                candidates.append(("function", clean))
+            candidates.extend(("function", token) for token in identifier_tokens(function_name)[1:] if len(token) > 3)
+        if "_" in test_name:
+            from_name = test_name.split("_")[0].lower()
+            candidates.append(("test_name", from_name))
+            clean = _strip_prefix(from_name, TEST_NAME_PREFIXES)
+            if len(clean) > 2:
+                candidates.append(("test_name", clean))
+        candidates.extend(
+            ("keyword", token) for token in identifier_tokens(test_name)
+            if len(token) > 3 and token not in STOP_WORDS
+        )
+
+        matches: Dict[int, Dict[str, Any]] = {}
+        for reason, token in candidates:
+            for i in sorted(self._lookup(token)):
+                if len(matches) >= limit:
+                    return list(matches.values())
+                if i not in matches:
+                    matches[i] = {"risk": self.risks[i], "riskIndex": i, "reason": reason, "token": token}
+
+        lowered_name = test_name.lower()
+        if test_type == "negative" or any(word in lowered_name for word in NEGATIVE_TEST_WORDS):
+            for i in self._error_risks:
+                if len(matches) >= limit:
+                    break
+                if i not in matches:
+                    matches[i] = {"risk": self.risks[i], "riskIndex": i, "reason": "negative", "token": None}
+
+        return list(matches.values())
@@ -0,0 +1,500 @@
+"""
+Run comparison - so sánh một test run với một run khác hoặc với baseline gộp từ nhiều runs
+(ví dụ "10 green runs gần nhất trên main")
+
+Mỗi run được chuyển một lần sang dạng cột (RunColumns): test id (hash của tên), status code, duration.
+Baseline gộp theo test id: số runs có test, số lần pass/fail, mean/std duration của các lần pass.
+So sánh là các phép toán tập hợp trên test ids (numpy searchsorted/isin nếu có, dict/set nếu không):
+
+- new_failures: fail ở run hiện tại, chưa từng fail trong baseline (kể cả tests mới)
+- known_failures: fail ở run hiện tại, đã fail trong baseline
+- fixed_tests: pass ở run hiện tại, fail trong >= 50% số lần chạy ở baseline
+- added_tests / removed_tests
+- duration_regressions: chậm hơn baseline cả tương đối, tuyệt đối và (khi baseline đủ mẫu) theo z-score
+
+Test id dùng hash() của Python (nhanh, hash của str được cache) nên chỉ có nghĩa trong một process -
+columns không được lưu xuống disk.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from .error_clustering import get_numpy
+
+PASS, FAIL, SKIP, OTHER = 0, 1, 2, 3
+STATUS_CODES = {
+    "pass": PASS, "passed": PASS, "success": PASS,
+    "fail": FAIL, "failed": FAIL, "error": FAIL, "broken": FAIL,
+    "skip": SKIP, "skipped": SKIP, "pending": SKIP, "todo": SKIP
+}
+DURATION_KEYS = ("duration", "timeMs", "durationMs", "duration_ms")
+
+DEFAULT_THRESHOLDS = {
+    "min_ratio": 0.5,        # chậm hơn ít nhất 50%...
+    "min_delta_ms": 50,      # ...và ít nhất 50ms
+    "z_score": 3.0,          # baseline >= min_samples mẫu: vượt mean + 3 std
+    "min_samples": 3,
+    "fixed_fail_rate": 0.5,  # fixed = trước đó fail trong >= 50% số lần chạy
+    "limit": 100             # số phần tử tối đa mỗi danh sách trong kết quả
+}
+
+
+def normalize_thresholds(thresholds: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Gộp thresholds với DEFAULT_THRESHOLDS, ép kiểu theo default; ValueError nếu giá trị không hợp lệ"""
+    if thresholds is not None and not isinstance(thresholds, dict):
+        raise ValueError("thresholds phải là object")
+    options = dict(DEFAULT_THRESHOLDS)
+    for key, value in (thresholds or {}).items():
+        if key not in DEFAULT_THRESHOLDS:
+            continue
+        cast = type(DEFAULT_THRESHOLDS[key])
+        try:
+            value = cast(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"thresholds.{key} phải là số, nhận được {value!r}")
+        if value < 0 or value != value:
+            raise ValueError(f"thresholds.{key} không hợp lệ: {value!r}")
+        options[key] = value
+    return options
+
+
+def run_tests(run: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Tests của run - format create_test_run ("test_results") hoặc execution ("results")"""
+    return run.get("test_results") or run.get("results") or []
+
+
+def _duration(test: Dict[str, Any]) -> float:
+    for key in DURATION_KEYS:
+        value = test.get(key)
+        if value is not None:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return 0.0
+    return 0.0
+
+
+class RunColumns:
+    """Một run ở dạng cột; mỗi test name một dòng (tên trùng: giữ dòng cuối)"""
+
+    __slots__ = ("run_id", "names", "ids", "status", "duration", "_rows", "_arrays", "_sorted", "_counts")
+
+    def __init__(self, run_id: Optional[str], names: List[str], status: List[int], duration: List[float]):
+        self.run_id = run_id
+        ids = list(map(hash, names))
+        self._arrays = None
+        self._sorted = None
+        if self._has_duplicates(ids, status, duration):
+            keep = sorted(dict(zip(ids, range(len(ids)))).values())
+            names = [names[i] for i in keep]
+            ids = [ids[i] for i in keep]
+            status = [status[i] for i in keep]
+            duration = [duration[i] for i in keep]
+            self._arrays = None
+            self._sorted = None
+        self.names = names
+        self.ids = ids
+        self.status = status
+        self.duration = duration
+        self._rows = None
+        self._counts = None
+
+    @classmethod
+    def from_run(cls, run: Dict[str, Any]) -> "RunColumns":
+        tests = run_tests(run)
+        # Fast path cho format create_test_run, sửa lại từng dòng nếu khác
+        names = [t.get("name", "") for t in tests]
+        raw_status = [t.get("status") for t in tests]
+        duration = [t.get("duration") for t in tests]
+        if set(map(type, names)) - {str}:
+            names = [str(name) for name in names]
+        status = list(map(STATUS_CODES.get, raw_status))
+        if None in status:
+            status = [
+                code if code is not None else STATUS_CODES.get(str(raw or "").lower(), OTHER)
+                for code, raw in zip(status, raw_status)
+            ]
+        if set(map(type, duration)) - {int, float}:
+            duration = [_duration(t) for t in tests]
+        return cls(run.get("run_id"), names, status, duration)
+
+    def _has_duplicates(self, ids: List[int], status: List[int], duration: List[float]) -> bool:
+        np = get_numpy()
+        if np is None or len(ids) < 1000:
+            return len(set(ids)) < len(ids)
+        # Build luôn arrays / thứ tự theo id (so sánh sẽ cần) rồi check trùng trên dãy đã sort
+        self._arrays = (
+            np.array(ids, dtype=np.int64),
+            np.array(status, dtype=np.int8),
+            np.array(duration, dtype=np.float64)
+        )
+        ordered = self.sorted_arrays()[1]
+        return bool((ordered[1:] == ordered[:-1]).any())
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def rows(self) -> Dict[int, int]:
+        """test id -> dòng; build khi cần"""
+        if self._rows is None:
+            self._rows = dict(zip(self.ids, range(len(self.ids))))
+        return self._rows
+
+    def row(self, test_id: int) -> Optional[int]:
+        return self.rows.get(test_id)
+
+    def arrays(self):
+        """(ids int64, status int8, duration float64) - numpy, build một lần"""
+        if self._arrays is None:
+            np = get_numpy()
+            self._arrays = (
+                np.array(self.ids, dtype=np.int64),
+                np.array(self.status, dtype=np.int8),
+                np.array(self.duration, dtype=np.float64)
+            )
+        return self._arrays
+
+    def sorted_arrays(self):
+        """
+        (order, ids, status, duration) sắp theo test id: searchsorted giữa hai dãy đã sort truy cập
+        memory tuần tự, nhanh hơn nhiều lần so với tra theo thứ tự dòng (hash ids ngẫu nhiên)
+        """
+        if self._sorted is None:
+            ids, status, duration = self.arrays()
+            order = ids.argsort(kind="stable")
+            self._sorted = (order, ids[order], status[order], duration[order])
+        return self._sorted
+
+    def counts(self) -> Dict[str, int]:
+        if self._counts is None:
+            self._counts = {
+                "total": len(self.status),
+                "passed": self.status.count(PASS),
+                "failed": self.status.count(FAIL)
+            }
+        return dict(self._counts)
+
+
+class Baseline:
+    """
+    Baseline gộp từ một hoặc nhiều runs, theo test id: seen (số runs có test), passes, fails,
+    samples / mean / std duration (chỉ các lần pass)
+    """
+
+    def __init__(self, runs: List[RunColumns]):
+        self.runs = runs
+        self.run_ids = [run.run_id for run in runs]
+        total = sum(len(run) for run in runs)
+        self.pass_rate = (
+            round(sum(run.counts()["passed"] for run in runs) / total * 100, 2) if total else 0.0
+        )
+        np = get_numpy()
+        self._np = np is not None
+        if self._np:
+            self._build_arrays(np)
+        else:
+            self._build_dict()
+
+    def _build_arrays(self, np):
+        if len(self.runs) == 1:
+            # Một run: ids đã unique + sort sẵn
+            _, self.ids, status, duration = self.runs[0].sorted_arrays()
+            passed = (status == PASS).astype(np.float64)
+            self.seen = np.ones(len(self.ids), dtype=np.int64)
+            self.fails = (status == FAIL).astype(np.float64)
+            self.samples = passed
+            self.mean = duration * passed
+            self.std = np.zeros(len(self.ids))
+            return
+        if self.runs:
+            arrays = [run.arrays() for run in self.runs]
+            ids = np.concatenate([a[0] for a in arrays])
+            status = np.concatenate([a[1] for a in arrays])
+            duration = np.concatenate([a[2] for a in arrays])
+        else:
+            ids, status, duration = np.zeros(0, np.int64), np.zeros(0, np.int8), np.zeros(0, np.float64)
+        self.ids, inverse = np.unique(ids, return_inverse=True)
+        size = len(self.ids)
+        passed = (status == PASS).astype(np.float64)
+        self.seen = np.bincount(inverse, minlength=size)
+        self.fails = np.bincount(inverse, weights=(status == FAIL).astype(np.float64), minlength=size)
+        self.samples = np.bincount(inverse, weights=passed, minlength=size)
+        sums = np.bincount(inverse, weights=duration * passed, minlength=size)
+        squares = np.bincount(inverse, weights=duration * duration * passed, minlength=size)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self.mean = np.where(self.samples > 0, sums / self.samples, 0.0)
+            variance = np.where(
+                self.samples > 1, (squares - self.samples * self.mean ** 2) / (self.samples - 1), 0.0
+            )
+        self.std = np.sqrt(np.maximum(variance, 0.0))
+
+    def _build_dict(self):
+        # test id -> [seen, fails, samples, sum, sum of squares]
+        stats: Dict[int, List[float]] = {}
+        for run in self.runs:
+            for test_id, status, duration in zip(run.ids, run.status, run.duration):
+                entry = stats.get(test_id)
+                if entry is None:
+                    entry = stats[test_id] = [0, 0, 0, 0.0, 0.0]
+                entry[0] += 1
+                if status == FAIL:
+                    entry[1] += 1
+                elif status == PASS:
+                    entry[2] += 1
+                    entry[3] += duration
+                    entry[4] += duration * duration
+        self.stats = {}
+        for test_id, (seen, fails, samples, total, squares) in stats.items():
+            mean = total / samples if samples else 0.0
+            variance = (squares - samples * mean * mean) / (samples - 1) if samples > 1 else 0.0
+            self.stats[test_id] = (seen, fails, samples, mean, max(variance, 0.0) ** 0.5)
+
+    def __len__(self) -> int:
+        return len(self.ids) if self._np else len(self.stats)
+
+    def _position(self, test_id: int) -> tuple:
+        # (run, dòng) đầu tiên có test - runs mới nhất trước
+        for i, run in enumerate(self.runs):
+            row = run.row(test_id)
+            if row is not None:
+                return i, row
+        return len(self.runs), 0
+
+    def names_of(self, test_ids: List[int], limit: int) -> List[str]:
+        """Tên của test ids, theo thứ tự xuất hiện trong baseline (hash ids không có thứ tự ổn định)"""
+        positions = sorted(self._position(test_id) for test_id in test_ids)[:limit]
+        return [self.runs[i].names[row] for i, row in positions]
+
+
+def compare(current: RunColumns, baseline: Baseline, thresholds: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """So sánh run hiện tại với baseline (xem docstring của module)"""
+    options = normalize_thresholds(thresholds)
+    limit = options["limit"]
+    if baseline._np:
+        groups, regressions = _compare_arrays(current, baseline, options, limit)
+    else:
+        groups, regressions = _compare_dict(current, baseline, options, limit)
+
+    counts = current.counts()
+    pass_rate = round(counts["passed"] / counts["total"] * 100, 2) if counts["total"] else 0.0
+    return {
+        "run_id": current.run_id,
+        "baseline_run_ids": baseline.run_ids,
+        "totals": {
+            **counts,
+            "pass_rate": pass_rate,
+            "baseline_pass_rate": baseline.pass_rate,
+            "pass_rate_change": round(pass_rate - baseline.pass_rate, 2),
+            **{key: total for key, (total, _) in groups.items()},
+            "duration_regressions": regressions[0]
+        },
+        **{key: names for key, (_, names) in groups.items()},
+        "duration_regressions": regressions[1],
+        "regression": bool(groups["new_failures"][0] or regressions[0])
+    }
+
+
+def _regression(name: str, duration: float, mean: float, std: float, samples: int, z: Optional[float]) -> Dict[str, Any]:
+    return {
+        "name": name,
+        "duration_ms": round(duration, 2),
+        "baseline_mean_ms": round(mean, 2),
+        "baseline_std_ms": round(std, 2),
+        "baseline_samples": int(samples),
+        "ratio": round(duration / mean, 2),
+        "delta_ms": round(duration - mean, 2),
+        "z_score": round(z, 2) if z is not None else None
+    }
+
+
+def _member(haystack, needles):
+    """needles nằm trong haystack không (cả hai là int64 đã sort)"""
+    np = get_numpy()
+    if not len(haystack):
+        return np.zeros(len(needles), dtype=bool)
+    pos = np.minimum(np.searchsorted(haystack, needles), len(haystack) - 1)
+    return haystack[pos] == needles
+
+
+def _compare_arrays(current: RunColumns, baseline: Baseline, options: Dict[str, Any], limit: int):
+    np = get_numpy()
+    # Tính trên thứ tự theo test id, map về dòng (thứ tự của run) khi lấy tên
+    order, ids, status, duration = current.sorted_arrays()
+    base_ids = baseline.ids
+    names = current.names
+    if len(base_ids):
+        pos = np.minimum(np.searchsorted(base_ids, ids), len(base_ids) - 1)
+        found = base_ids[pos] == ids
+        # Giá trị ở các dòng không found là của test kế bên - mọi điều kiện đều & found
+        fails, seen, samples = baseline.fails[pos], baseline.seen[pos], baseline.samples[pos]
+        mean, std = baseline.mean[pos], baseline.std[pos]
+    else:
+        found = np.zeros(len(ids), dtype=bool)
+        fails = seen = samples = mean = std = np.zeros(len(ids))
+    failing = status == FAIL
+    passing = status == PASS
+    previously_failed = found & (fails > 0)
+
+    def group(mask):
+        rows = order[mask]
+        total = len(rows)
+        if total > limit:
+            rows = np.partition(rows, limit - 1)[:limit]
+        return total, [names[i] for i in np.sort(rows).tolist()]
+
+    # Test ids unique ở cả hai phía: số tests bị bỏ = số tests baseline không được found
+    removed = len(base_ids) - int(np.count_nonzero(found))
+    groups = {
+        "new_failures": group(failing & ~previously_failed),
+        "known_failures": group(failing & previously_failed),
+        "fixed_tests": group(passing & previously_failed & (fails >= options["fixed_fail_rate"] * seen)),
+        "added_tests": group(~found),
+        "removed_tests": (removed, _removed_names(baseline, ids, limit) if removed else [])
+    }
+
+    # Duration regressions: cả ba ngưỡng vectorized, chỉ build dict cho top `limit` theo delta
+    delta = duration - mean
+    slower = (
+        passing & found & (samples > 0) & (mean > 0)
+        & (delta >= options["min_delta_ms"]) & (duration >= mean * (1 + options["min_ratio"]))
+    )
+    # std của test rất ổn định có thể ~0 - sàn 5% mean / 1ms
+    z = delta / np.maximum(np.maximum(std, mean * 0.05), 1.0)
+    enough = samples >= options["min_samples"]
+    slower &= ~enough | (z >= options["z_score"])
+    picked = np.flatnonzero(slower)
+    if len(picked) > limit:
+        picked = picked[np.argpartition(-delta[picked], limit - 1)[:limit]]
+    # Cùng delta: theo thứ tự dòng trong run
+    picked = picked[np.lexsort((order[picked], -delta[picked]))]
+    regressions = [
+        _regression(names[order[i]], float(duration[i]), float(mean[i]), float(std[i]), samples[i], float(z[i]) if enough[i] else None)
+        for i in picked.tolist()
+    ]
+    return groups, (int(np.count_nonzero(slower)), regressions)
+
+
+def _removed_names(baseline: Baseline, current_ids, limit: int) -> List[str]:
+    """Tên tests của baseline không có trong run hiện tại - theo thứ tự dòng, runs mới nhất trước"""
+    np = get_numpy()
+    names, taken = [], set()
+    for run in baseline.runs:
+        order, ids, _, _ = run.sorted_arrays()
+        rows = np.sort(order[~_member(current_ids, ids)])
+        for row in rows.tolist():
+            test_id = run.ids[row]
+            if test_id not in taken:
+                taken.add(test_id)
+                names.append(run.names[row])
+                if len(names) >= limit:
+                    return names
+    return names
+
+
+def _compare_dict(current: RunColumns, baseline: Baseline, options: Dict[str, Any], limit: int):
+    stats = baseline.stats
+    lists = {key: [] for key in ("new_failures", "known_failures", "fixed_tests", "added_tests")}
+    regressions = []
+    for name, test_id, status, duration in zip(current.names, current.ids, current.status, current.duration):
+        entry = stats.get(test_id)
+        if entry is None:
+            lists["added_tests"].append(name)
+            if status == FAIL:
+                lists["new_failures"].append(name)
+            continue
+        seen, fails, samples, mean, std = entry
+        if status == FAIL:
+            lists["known_failures" if fails else "new_failures"].append(name)
+        elif status == PASS:
+            if fails >= options["fixed_fail_rate"] * seen:
+                lists["fixed_tests"].append(name)
+            delta = duration - mean
+            if samples and mean > 0 and delta >= options["min_delta_ms"] and duration >= mean * (1 + options["min_ratio"]):
+                z = delta / max(std, mean * 0.05, 1.0)
+                enough = samples >= options["min_samples"]
+                if not enough or z >= options["z_score"]:
+                    regressions.append((delta, name, duration, mean, std, samples, z if enough else None))
+    removed = [test_id for test_id in stats if test_id not in current.rows]
+    groups = {key: (len(names), names[:limit]) for key, names in lists.items()}
+    groups["removed_tests"] = (len(removed), baseline.names_of(removed, limit))
+    regressions.sort(key=lambda r: r[0], reverse=True)
+    return groups, (len(regressions), [_regression(*r[1:]) for r in regressions[:limit]])
+
+
+def select_baseline_runs(
+    runs: List[Dict[str, Any]],
+    branch: Optional[str] = None,
+    green_only: bool = False,
+    limit: int = 10,
+    exclude: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """Chọn runs cho baseline (mới nhất trước): theo branch, chỉ runs không có test fail, tối đa limit"""
+    exclude = set(exclude or [])
+    selected = []
+    for run in sorted(runs, key=lambda r: str(r.get("timestamp") or r.get("executed_at") or ""), reverse=True):
+        if run.get("run_id") in exclude:
+            continue
+        if branch and (run.get("metadata") or {}).get("branch") != branch:
+            continue
+        if green_only:
+            failed = run.get("failed")
+            if failed is None:
+                failed = sum(1 for t in run_tests(run) if STATUS_CODES.get(str(t.get("status", "")).lower()) == FAIL)
+            if failed:
+                continue
+        selected.append(run)
+        if len(selected) >= limit:
+            break
+    return selected
+
+
+class RunComparator:
+    """
+    Cache columns theo run và baseline theo tập runs - baseline như "10 green runs gần nhất trên main"
+    được dùng lại cho nhiều runs mới, chỉ build một lần
+
+    Usage:
+        comparator = RunComparator()
+        comparator.compare(run, [baseline_run1, baseline_run2, ...])
+    """
+
+    def __init__(self, max_runs: int = 64, max_baselines: int = 16):
+        self.max_runs = max_runs
+        self.max_baselines = max_baselines
+        self._columns: "OrderedDict[tuple, RunColumns]" = OrderedDict()
+        self._baselines: "OrderedDict[tuple, Baseline]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(run: Dict[str, Any]) -> tuple:
+        # run_id có thể bị dùng lại cho dữ liệu khác - thêm các counts rẻ để nhận ra
+        tests = run_tests(run)
+        return (run.get("run_id"), run.get("timestamp"), len(tests), run.get("passed"), run.get("failed"), run.get("duration_ms"))
+
+    def _cached(self, cache: OrderedDict, key: tuple, limit: int, build):
+        with self._lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+                return value
+        value = build()
+        with self._lock:
+            cache[key] = value
+            while len(cache) > limit:
+                cache.popitem(last=False)
+        return value
+
+    def columns(self, run: Dict[str, Any]) -> RunColumns:
+        if not run.get("run_id"):
+            return RunColumns.from_run(run)
+        return self._cached(self._columns, self._key(run), self.max_runs, lambda: RunColumns.from_run(run))
+
+    def baseline(self, runs: List[Dict[str, Any]]) -> Baseline:
+        key = tuple(self._key(run) for run in runs)
+        if any(k[0] is None for k in key):
+            return Baseline([self.columns(run) for run in runs])
+        return self._cached(self._baselines, key, self.max_baselines, lambda: Baseline([self.columns(run) for run in runs]))
+
+    def compare(self, run: Dict[str, Any], baseline_runs: List[Dict[str, Any]], thresholds: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return compare(self.columns(run), self.baseline(baseline_runs), thresholds)
@@ -0,0 +1,82 @@
+"""
+Single-flight - gộp các request giống hệt nhau đang chạy đồng thời thành một lần tính toán
+"""
+import asyncio
+import hashlib
+import json
+from typing import Dict, Any, Awaitable, Callable, TypeVar
+
+from .telemetry import telemetry
+
+T = TypeVar("T")
+
+
+def normalize_code(code: str) -> str:
+    """Chuẩn hóa code trước khi fingerprint: newline, trailing whitespace, dòng trống đầu/cuối"""
+    lines = [line.rstrip() for line in code.replace("\r\n", "\n").replace("\r", "\n").split("\n")]
+    return "\n".join(lines).strip("\n")
+
+
+def request_fingerprint(**parts: Any) -> str:
+    """Hash ổn định (sha256) của các phần quyết định kết quả request"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Các caller cùng key trong lúc computation đang chạy sẽ nhận chung kết quả (hoặc exception)
+
+    Computation chạy như một task riêng nên nếu client của request đầu tiên ngắt kết nối,
+    các request đang chờ vẫn nhận được kết quả.
+
+    Usage:
+        flights = SingleFlight("analyze_code")
+        result = await flights.do(key, lambda: run_in_threadpool(orchestrator.process_request, ...))
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._in_flight.get(key)
+        if task is not None:
+            telemetry.metrics.inc(
+                "testflow_singleflight_requests_total",
+                help_text="Số requests qua single-flight (role=coalesced: dùng chung kết quả đang chạy)",
+                operation=self.name,
+                role="coalesced"
+            )
+            return await asyncio.shield(task)
+
+        telemetry.metrics.inc(
+            "testflow_singleflight_requests_total",
+            help_text="Số requests qua single-flight (role=coalesced: dùng chung kết quả đang chạy)",
+            operation=self.name,
+            role="leader"
+        )
+        task = asyncio.ensure_future(fn())
+        self._in_flight[key] = task
+        self._set_gauge()
+        task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Future):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        self._set_gauge()
+        # Lấy exception để asyncio không log "exception was never retrieved" khi không còn ai chờ
+        if not task.cancelled():
+            task.exception()
+
+    def _set_gauge(self):
+        telemetry.metrics.set_gauge(
+            "testflow_singleflight_in_flight",
+            len(self._in_flight),
+            help_text="Số computations đang chạy trong single-flight",
+            operation=self.name
+        )
@@ -0,0 +1,225 @@
+"""
+Source diff theo symbol - biết function/method nào thay đổi giữa hai phiên bản source code
+
+Python được parse bằng ast (hash của AST từng function/method, bỏ qua comment/format);
+ngôn ngữ khác được chia thành các đoạn bắt đầu từ mỗi top-level declaration (function, class,
+const...). Dùng để chỉ chạy lại các tests bị ảnh hưởng khi sửa code.
+"""
+import ast
+import hashlib
+import re
+from typing import Dict, Any, Optional, Set
+
+# Key cho code top-level không thuộc function/class nào (imports, constants...)
+MODULE_KEY = "<module>"
+
+_DECLARATION_RE = re.compile(
+    r"^(?:export\s+)?(?:default\s+)?(?:public\s+|private\s+|protected\s+|static\s+)*"
+    r"(?:async\s+)?(?:function\*?|class|const|let|var|def|func|fn)\s+([A-Za-z_$][\w$]*)",
+    re.M
+)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def python_symbol_hashes(source: str) -> Optional[Dict[str, str]]:
+    """
+    {"func": hash, "Class": hash (phần không phải method), "Class.method": hash, "<module>": hash}
+    None nếu source không parse được
+    """
+    try:
+        tree = ast.parse(source or "")
+    except (SyntaxError, ValueError):
+        return None
+    hashes = {}
+    module_parts = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            hashes[node.name] = _digest(ast.dump(node))
+        elif isinstance(node, ast.ClassDef):
+            class_parts = [ast.dump(base) for base in node.bases] + [ast.dump(d) for d in node.decorator_list]
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    hashes[f"{node.name}.{item.name}"] = _digest(ast.dump(item))
+                else:
+                    class_parts.append(ast.dump(item))
+            hashes[node.name] = _digest("\n".join(class_parts))
+        else:
+            module_parts.append(ast.dump(node))
+    hashes[MODULE_KEY] = _digest("\n".join(module_parts))
+    return hashes
+
+
+def text_symbol_hashes(source: str) -> Dict[str, str]:
+    """Hash từng đoạn code bắt đầu từ một top-level declaration tới declaration kế tiếp"""
+    source = source or ""
+    matches = list(_DECLARATION_RE.finditer(source))
+    hashes = {MODULE_KEY: _digest(_normalize(source[:matches[0].start()] if matches else source))}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(source)
+        hashes[match.group(1)] = _digest(_normalize(source[match.start():end]))
+    return hashes
+
+
+def _normalize(text: str) -> str:
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def changed_symbols(old_source: str, new_source: str, language: str = "python") -> Optional[Set[str]]:
+    """
+    Tên các symbols bị sửa/thêm/xóa giữa hai phiên bản ("Class.method" cho methods).
+    None nếu không xác định được phạm vi thay đổi (parse lỗi, code top-level thay đổi) - khi đó
+    nên coi như mọi thứ đều thay đổi.
+    """
+    if (old_source or "") == (new_source or ""):
+        return set()
+    if (language or "").lower() in ("python", "py"):
+        old, new = python_symbol_hashes(old_source), python_symbol_hashes(new_source)
+        if old is None or new is None:
+            return None
+    else:
+        old, new = text_symbol_hashes(old_source), text_symbol_hashes(new_source)
+    if old.get(MODULE_KEY) != new.get(MODULE_KEY):
+        return None
+    return {name for name in set(old) | set(new) if old.get(name) != new.get(name)}
+
+
+def symbol_names(symbols: Set[str]) -> Set[str]:
+    """Tên mà tests dùng để tham chiếu symbols: "Calc.add" -> "add"; "Calc.__init__"/"Calc" -> "Calc" """
+    names = set()
+    for symbol in symbols:
+        owner, _, member = symbol.rpartition(".")
+        if owner and member not in ("__init__", "__new__", "__post_init__"):
+            names.add(member)
+        else:
+            names.add(owner or member)
+    return names
+
+
+def python_test_references(test_code: str) -> Optional[Dict[str, Set[str]]]:
+    """
+    Tên (biến, function, attribute) mà từng test function dùng, gồm cả fixtures định nghĩa trong file.
+    Key là phần sau file của pytest node id: "test_x" hoặc "TestClass::test_x". None nếu không parse được.
+    """
+    try:
+        tree = ast.parse(test_code or "")
+    except (SyntaxError, ValueError):
+        return None
+
+    def names_in(node) -> Set[str]:
+        found = set()
+        for child in ast.walk(node):
+            if isinstance(child, ast.Name):
+                found.add(child.id)
+            elif isinstance(child, ast.Attribute):
+                found.add(child.attr)
+        return found
+
+    helpers = {}
+    tests = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if node.name.startswith("test"):
+                tests.append((node.name, node, set()))
+            else:
+                helpers[node.name] = names_in(node)
+        elif isinstance(node, ast.ClassDef) and node.name.startswith("Test"):
+            class_names = set()
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and not item.name.startswith("test"):
+                    class_names |= names_in(item)  # setup_method, fixtures trong class
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)) and item.name.startswith("test"):
+                    tests.append((f"{node.name}::{item.name}", item, class_names))
+
+    references = {}
+    for key, node, inherited in tests:
+        names = names_in(node) | inherited
+        # Fixtures/helpers trong file mà test dùng (một cấp)
+        for name in list(names):
+            names |= helpers.get(name, set())
+        references[key] = names
+    return references
+
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+def parse_unified_diff(diff: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Unified diff (git diff) -> {path: {"status", "deleted", "inserted", "lines"}}
+
+    - status: "modified" | "added" | "deleted" | "renamed"
+    - deleted: {số dòng trong file *cũ*: nội dung} của các dòng bị xóa/sửa
+    - inserted: [(vị trí, [nội dung...])] các khối chỉ thêm dòng, chèn trước dòng `vị trí` của file cũ
+    - lines: tất cả số dòng (file cũ) bị ảnh hưởng
+
+    Số dòng theo file cũ để map với index được build từ phiên bản trước diff. Path là path của
+    file cũ (file mới nếu được thêm).
+    """
+    files: Dict[str, Dict[str, Any]] = {}
+    current = None
+    old_path = new_path = None
+    old_line = old_left = new_left = 0
+    block_deleted = False
+    for line in (diff or "").splitlines():
+        if old_left > 0 or new_left > 0:
+            # Trong hunk: "--- x" cũng chỉ là dòng bị xóa
+            if line.startswith("-"):
+                current["deleted"][old_line] = line[1:]
+                current["lines"].add(old_line)
+                block_deleted = True
+                old_line += 1
+                old_left -= 1
+            elif line.startswith("+"):
+                # Dòng thêm ngay sau dòng bị xóa là phần sửa của chính chỗ đó
+                if not block_deleted:
+                    inserted = current["inserted"]
+                    if inserted and inserted[-1][0] == old_line:
+                        inserted[-1][1].append(line[1:])
+                    else:
+                        inserted.append((old_line, [line[1:]]))
+                    current["lines"].update(n for n in (old_line - 1, old_line) if n > 0)
+                new_left -= 1
+            elif line.startswith(" ") or not line:
+                block_deleted = False
+                old_line += 1
+                old_left -= 1
+                new_left -= 1
+            continue
+        if line.startswith("diff --git "):
+            current, old_path, new_path = None, None, None
+        elif line.startswith("--- "):
+            old_path = _diff_path(line[4:])
+        elif line.startswith("+++ "):
+            new_path = _diff_path(line[4:])
+            if old_path is None and new_path is None:
+                current = None
+                continue
+            if old_path is None:
+                status, path = "added", new_path
+            elif new_path is None:
+                status, path = "deleted", old_path
+            else:
+                status, path = ("renamed" if old_path != new_path else "modified"), old_path
+            current = files.setdefault(path, {"status": status, "deleted": {}, "inserted": [], "lines": set()})
+        elif current is not None:
+            hunk = _HUNK_RE.match(line)
+            if hunk:
+                old_left = int(hunk.group(2) or 1)
+                new_left = int(hunk.group(4) or 1)
+                # "-10,0": hunk chỉ thêm dòng, chèn sau dòng 10
+                old_line = int(hunk.group(1)) + (1 if old_left == 0 else 0)
+                block_deleted = False
+    return files
+
+
+def _diff_path(path: str) -> Optional[str]:
+    path = path.split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    if path.startswith(("a/", "b/")):
+        path = path[2:]
+    return path
@@ -0,0 +1,255 @@
+"""
+Telemetry - Tracing spans và metrics (Prometheus text format, OTLP optional)
+"""
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bucket (giây) cho latency histograms: từ parse nhanh (ms) tới LLM call dài
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("testflow_current_span", default=None)
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape_label_value(v)}"' for k, v in items) + "}"
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class MetricsRegistry:
+    """Registry đơn giản cho counters, gauges và histograms (thread-safe)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._gauges: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    def inc(self, name: str, value: float = 1.0, help_text: str = "", **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def set_gauge(self, name: str, value: float, help_text: str = "", **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def observe(self, name: str, value: float, help_text: str = "", buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(buckets)
+            histogram.observe(value)
+            if help_text:
+                self._help.setdefault(name, help_text)
+
+    def get_counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def render_prometheus(self) -> str:
+        """Render tất cả metrics theo Prometheus text exposition format 0.0.4"""
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} gauge")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', str(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class Span:
+    """Một span đang chạy - thu thập attributes và thời gian"""
+
+    def __init__(self, name: str, attributes: Dict[str, Any], parent: Optional["Span"] = None):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.span_id = uuid.uuid4().hex[:16]
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.parent_id = parent.span_id if parent else None
+        self.start_time = time.time()
+        self.duration_ms = 0.0
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes
+        }
+
+
+class Telemetry:
+    """Điểm truy cập chung cho tracing và metrics của backend"""
+
+    def __init__(self, recent_spans: int = 500):
+        self.metrics = MetricsRegistry()
+        self._recent = deque(maxlen=recent_spans)
+        self._recent_lock = threading.Lock()
+        self._otel_tracer = None
+        self._otel_configured = False
+
+    def configure_otlp(self, endpoint: Optional[str], service_name: str = "testflow-ai-backend") -> bool:
+        """
+        Bật export spans qua OTLP/HTTP tới collector (cần opentelemetry-sdk
+        và opentelemetry-exporter-otlp-proto-http). Trả về False nếu không khả dụng.
+        """
+        if self._otel_configured or not endpoint:
+            return self._otel_tracer is not None
+        self._otel_configured = True
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("OTLP endpoint được cấu hình nhưng opentelemetry chưa được cài đặt")
+            return False
+
+        provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+        self._otel_tracer = provider.get_tracer("testflow")
+        return True
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Context manager đo thời gian một stage
+
+        Usage:
+            with telemetry.span("llm.call", agent="Leader") as span:
+                ...
+                span.set_attribute("prompt_tokens", 123)
+        """
+        parent = _current_span.get()
+        current = Span(name, attributes, parent)
+        token = _current_span.set(current)
+        otel_cm = self._otel_tracer.start_as_current_span(name) if self._otel_tracer else None
+        otel_span = otel_cm.__enter__() if otel_cm else None
+        start = time.perf_counter()
+        try:
+            yield current
+        except BaseException as e:
+            current.status = "error"
+            current.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            current.duration_ms = (time.perf_counter() - start) * 1000
+            _current_span.reset(token)
+            self.metrics.observe(
+                "testflow_stage_duration_seconds",
+                current.duration_ms / 1000,
+                help_text="Latency của từng stage (span)",
+                stage=name,
+                status=current.status
+            )
+            with self._recent_lock:
+                self._recent.append(current)
+            if otel_span is not None:
+                for key, value in current.attributes.items():
+                    if isinstance(value, (str, bool, int, float)):
+                        otel_span.set_attribute(key, value)
+                otel_cm.__exit__(None, None, None)
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def recent_spans(self, limit: int = 100, name: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._recent_lock:
+            spans = list(self._recent)
+        if name:
+            spans = [s for s in spans if s.name == name]
+        return [s.to_dict() for s in spans[-limit:]]
+
+    def record_llm_usage(self, agent: str, model: str, prompt_tokens: int, completion_tokens: int, status: str = "ok",
+                         cached_tokens: int = 0):
+        """Ghi nhận số LLM calls và token usage"""
+        self.metrics.inc("testflow_llm_requests_total", help_text="Số LLM calls", agent=agent, model=model, status=status)
+        if prompt_tokens:
+            self.metrics.inc("testflow_llm_tokens_total", prompt_tokens, help_text="Số tokens đã dùng", agent=agent, model=model, kind="prompt")
+        if completion_tokens:
+            self.metrics.inc("testflow_llm_tokens_total", completion_tokens, help_text="Số tokens đã dùng", agent=agent, model=model, kind="completion")
+        if cached_tokens:
+            self.metrics.inc("testflow_llm_tokens_total", cached_tokens, help_text="Số tokens đã dùng", agent=agent, model=model, kind="cached")
+
+    def render_prometheus(self) -> str:
+        return self.metrics.render_prometheus()
+
+
+# Instance dùng chung trong toàn backend
+telemetry = Telemetry()
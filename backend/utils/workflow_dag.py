@@ -0,0 +1,255 @@
+"""
+Workflow DAG - Chạy các bước workflow của Leader plan theo đồ thị phụ thuộc
+
+Step không required bị fail/timeout không chặn các step phụ thuộc: chúng vẫn chạy nhưng thiếu
+output của step đó, và record của chúng được đánh dấu "degraded" kèm "missing_dependencies".
+
+Step timeout bị bỏ (abandoned), không bị kill: Python không dừng được thread đang chạy, nên
+agent call vẫn chạy tới khi xong trong background; kết quả của nó bị bỏ qua.
+"""
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional, Callable
+
+
+class WorkflowDAG:
+    """
+    Thực thi workflow dạng DAG với parallelism giới hạn
+
+    Mỗi step có thể khai báo:
+        id: ID của step (mặc định "step_<index>")
+        depends_on: List step IDs cần hoàn thành trước. Nếu không khai báo,
+            step phụ thuộc vào step ngay trước nó (giữ hành vi tuần tự cũ)
+        required: Nếu True và step fail, các step chưa chạy sẽ bị cancel
+        timeout: Timeout riêng cho step (giây)
+    """
+
+    def __init__(
+        self,
+        steps: List[Dict[str, Any]],
+        max_parallel: int = 4,
+        step_timeout: Optional[float] = None
+    ):
+        self.max_parallel = max(1, int(max_parallel))
+        self.step_timeout = step_timeout
+        self.steps = self._normalize(steps)
+        self.order = self._topological_order()
+
+    def _normalize(self, steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Gán ID và depends_on mặc định cho từng step"""
+        normalized = []
+        seen_ids = set()
+        previous_id = None
+
+        if not isinstance(steps, list):
+            return normalized
+
+        for i, step in enumerate(steps):
+            if not isinstance(step, dict):
+                continue
+            step_id = str(step.get("id") or f"step_{i + 1}")
+            if step_id in seen_ids:
+                step_id = f"{step_id}_{i + 1}"
+            seen_ids.add(step_id)
+
+            if "depends_on" in step:
+                depends_on = step.get("depends_on") or []
+                if isinstance(depends_on, str):
+                    depends_on = [depends_on]
+                depends_on = [str(d) for d in depends_on]
+            else:
+                depends_on = [previous_id] if previous_id else []
+
+            normalized.append({
+                **step,
+                "id": step_id,
+                "depends_on": depends_on,
+                "required": bool(step.get("required", False))
+            })
+            previous_id = step_id
+
+        # Bỏ các dependency không tồn tại (LLM có thể tạo ID sai)
+        known_ids = {s["id"] for s in normalized}
+        for step in normalized:
+            step["depends_on"] = [d for d in step["depends_on"] if d in known_ids and d != step["id"]]
+
+        return normalized
+
+    def _topological_order(self) -> List[str]:
+        """Sắp xếp topo; nếu có cycle thì fallback về thứ tự tuần tự"""
+        indegree = {s["id"]: len(s["depends_on"]) for s in self.steps}
+        dependents = {s["id"]: [] for s in self.steps}
+        for step in self.steps:
+            for dep in step["depends_on"]:
+                dependents[dep].append(step["id"])
+
+        ready = [s["id"] for s in self.steps if indegree[s["id"]] == 0]
+        order = []
+        while ready:
+            step_id = ready.pop(0)
+            order.append(step_id)
+            for child in dependents[step_id]:
+                indegree[child] -= 1
+                if indegree[child] == 0:
+                    ready.append(child)
+
+        if len(order) != len(self.steps):
+            # Cycle - chạy tuần tự theo thứ tự trong plan
+            previous_id = None
+            for step in self.steps:
+                step["depends_on"] = [previous_id] if previous_id else []
+                previous_id = step["id"]
+            order = [s["id"] for s in self.steps]
+
+        return order
+
+    def run(
+        self,
+        run_step: Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """
+        Chạy workflow
+
+        Args:
+            run_step: Hàm (step, dependency_outputs) -> agent result dict
+
+        Returns:
+            List records theo thứ tự step trong plan, mỗi record có
+            step_id, status (completed|failed|timeout|cancelled), result/error;
+            step chạy thiếu output của dependency có degraded=True, missing_dependencies
+        """
+        steps_by_id = {s["id"]: s for s in self.steps}
+        records: Dict[str, Dict[str, Any]] = {}
+        outputs: Dict[str, Dict[str, Any]] = {}
+        started_at: Dict[str, float] = {}
+        pending = list(self.order)
+        running = {}
+        missing_inputs: Dict[str, List[str]] = {}
+        aborted_by = None
+
+        def timed(step, dep_outputs):
+            started_at[step["id"]] = time.monotonic()
+            return run_step(step, dep_outputs)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_parallel)
+        try:
+            while pending or running:
+                # Submit các step đã sẵn sàng
+                for step_id in list(pending):
+                    step = steps_by_id[step_id]
+                    if aborted_by:
+                        records[step_id] = self._record(step, "cancelled", error=f"Cancelled: required step '{aborted_by}' failed")
+                        pending.remove(step_id)
+                        continue
+                    if any(d in records and records[d]["status"] == "cancelled" for d in step["depends_on"]):
+                        records[step_id] = self._record(step, "cancelled", error="Cancelled: dependency was cancelled")
+                        pending.remove(step_id)
+                        continue
+                    if not all(d in records for d in step["depends_on"]):
+                        continue
+                    if len(running) >= self.max_parallel:
+                        break
+                    dep_outputs = {d: outputs[d] for d in step["depends_on"] if d in outputs}
+                    if len(dep_outputs) < len(step["depends_on"]):
+                        missing_inputs[step_id] = [d for d in step["depends_on"] if d not in outputs]
+                    # Copy context để span/priority của request đi theo vào thread
+                    ctx = contextvars.copy_context()
+                    running[executor.submit(ctx.run, timed, step, dep_outputs)] = step_id
+                    pending.remove(step_id)
+
+                if not running:
+                    continue
+
+                done, _ = wait(list(running), timeout=self._next_deadline(running, steps_by_id, started_at), return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    step_id = running.pop(future)
+                    step = steps_by_id[step_id]
+                    duration_ms = self._elapsed_ms(started_at.get(step_id))
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        records[step_id] = self._record(step, "failed", error=str(e), duration_ms=duration_ms)
+                    else:
+                        if isinstance(result, dict) and result.get("success"):
+                            outputs[step_id] = result
+                            records[step_id] = self._record(step, "completed", result=result, duration_ms=duration_ms)
+                        else:
+                            records[step_id] = self._record(step, "failed", result=result, duration_ms=duration_ms)
+                    if records[step_id]["status"] != "completed" and step["required"]:
+                        aborted_by = aborted_by or step_id
+
+                # Kiểm tra timeout của các step đang chạy
+                now = time.monotonic()
+                for future, step_id in list(running.items()):
+                    timeout = self._timeout_for(steps_by_id[step_id])
+                    start = started_at.get(step_id)
+                    if timeout and start is not None and now - start >= timeout:
+                        future.cancel()
+                        running.pop(future)
+                        records[step_id] = self._record(
+                            steps_by_id[step_id], "timeout",
+                            error=f"Step timeout after {timeout}s",
+                            duration_ms=self._elapsed_ms(start)
+                        )
+                        if steps_by_id[step_id]["required"]:
+                            aborted_by = aborted_by or step_id
+        finally:
+            # Không chờ các step bị timeout (thread không thể bị kill)
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        for step_id, missing in missing_inputs.items():
+            if step_id in records:
+                records[step_id]["degraded"] = True
+                records[step_id]["missing_dependencies"] = missing
+
+        return [records[s["id"]] for s in self.steps if s["id"] in records]
+
+    def _timeout_for(self, step: Dict[str, Any]) -> Optional[float]:
+        timeout = step.get("timeout", self.step_timeout)
+        try:
+            return float(timeout) if timeout else None
+        except (TypeError, ValueError):
+            return self.step_timeout
+
+    def _next_deadline(self, running, steps_by_id, started_at) -> Optional[float]:
+        """Thời gian chờ tối đa cho tới khi step gần nhất hết hạn"""
+        remaining = []
+        now = time.monotonic()
+        for step_id in running.values():
+            timeout = self._timeout_for(steps_by_id[step_id])
+            if not timeout:
+                continue
+            start = started_at.get(step_id)
+            # Step chưa bắt đầu (đang chờ thread) - poll lại sau
+            remaining.append(timeout if start is None else max(0.0, start + timeout - now))
+        return min(remaining) if remaining else None
+
+    def _elapsed_ms(self, start: Optional[float]) -> int:
+        if start is None:
+            return 0
+        return int((time.monotonic() - start) * 1000)
+
+    def _record(
+        self,
+        step: Dict[str, Any],
+        status: str,
+        result: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+        duration_ms: int = 0
+    ) -> Dict[str, Any]:
+        record = {
+            "step": step.get("agent"),
+            "step_id": step["id"],
+            "task": step.get("task", ""),
+            "depends_on": step["depends_on"],
+            "status": status,
+            "duration_ms": duration_ms
+        }
+        if result is not None:
+            record["result"] = result
+        if error:
+            record["success"] = False
+            record["error"] = error
+        return record